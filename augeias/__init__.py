@@ -11,6 +11,11 @@ def includeme(config):
     config.registry.collections = {}
     config.add_route("home", "/")
     config.add_route("list_collections", pattern="/collections", request_method="GET")
+    config.add_route(
+        "list_container_keys",
+        pattern="/collections/{collection_key}/containers",
+        request_method="GET",
+    )
     config.add_route(
         "create_container_and_id",
         pattern="/collections/{collection_key}/containers",
@@ -38,11 +43,47 @@ def includeme(config):
         request_method="GET",
         accept="application/zip",
     )
+    config.add_route(
+        "stream_object_keys_for_container",
+        pattern="/collections/{collection_key}/containers/{container_key}",
+        request_method="GET",
+        accept="application/x-ndjson",
+    )
     config.add_route(
         "create_object_and_id",
         pattern="/collections/{collection_key}/containers/{container_key}",
         request_method="POST",
     )
+    config.add_route(
+        "bulk_upload",
+        pattern="/collections/{collection_key}/containers/{container_key}/bulk",
+        request_method="POST",
+    )
+    config.add_route(
+        "create_upload",
+        pattern="/collections/{collection_key}/containers/{container_key}/{object_key}/uploads",
+        request_method="POST",
+    )
+    config.add_route(
+        "append_upload",
+        pattern="/collections/{collection_key}/containers/{container_key}/{object_key}/uploads/{upload_id}",
+        request_method="PUT",
+    )
+    config.add_route(
+        "get_upload_offset",
+        pattern="/collections/{collection_key}/containers/{container_key}/{object_key}/uploads/{upload_id}",
+        request_method=("GET", "HEAD"),
+    )
+    config.add_route(
+        "commit_upload",
+        pattern="/collections/{collection_key}/containers/{container_key}/{object_key}/uploads/{upload_id}",
+        request_method="POST",
+    )
+    config.add_route(
+        "abort_upload",
+        pattern="/collections/{collection_key}/containers/{container_key}/{object_key}/uploads/{upload_id}",
+        request_method="DELETE",
+    )
     config.add_route(
         "update_object",
         pattern="/collections/{collection_key}/containers/{container_key}/{object_key}",
@@ -74,6 +115,12 @@ def includeme(config):
         request_method="GET",
     )
 
+    if asbool(config.get_settings().get("augeias.metrics", False)):
+        config.include("augeias.metrics")
+
+    if config.get_settings().get("augeias.tracing"):
+        config.include("augeias.tracing")
+
     config.scan()
 
 
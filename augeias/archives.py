@@ -0,0 +1,433 @@
+"""
+This module contains helpers to read or replace single files in zip and tar
+archives without processing the rest of the archive.
+
+Tar archives have no central directory, so :func:`build_tar_index` records
+where the data of every file starts. For gzipped tars the offsets are offsets
+in the decompressed stream, and :class:`GzipCheckpoints` keeps decompressor
+states along the way so a file can be reached without decompressing the
+archive from the start.
+"""
+import bisect
+import collections
+import copy as copy_module
+import shutil
+import struct
+import tarfile
+import threading
+import time
+import zipfile
+import zlib
+
+from augeias.tracing import span
+
+CHUNK_SIZE = 64 * 1024
+
+#: Minimum number of decompressed bytes between two checkpoints in a gzip stream.
+CHECKPOINT_SPACING = 4 * 1024 * 1024
+
+#: Maximum number of checkpoints kept for a gzip stream. A checkpoint holds a
+#: copy of a decompressor, about 40 KiB.
+MAX_CHECKPOINTS = 64
+
+_LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+_LOCAL_HEADER_SIZE = 30
+_DATA_DESCRIPTOR_SIGNATURE = b'PK\x07\x08'
+_FLAG_DATA_DESCRIPTOR = 0x08
+
+_GZIP_MAGIC = b'\x1f\x8b'
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+def open_archive(archive_content):
+    """
+    Open a zip or tar archive
+
+    :param archive_content: content of the archive
+    :return: the opened archive
+    """
+    if zipfile.is_zipfile(archive_content):
+        archive_content.seek(0)  # the zip check actually reads the bytes, so reset.
+        return zipfile.ZipFile(archive_content)
+    else:
+        archive_content.seek(0)
+        return tarfile.open(fileobj=archive_content)
+
+
+def open_archive_member(archive_file, file_name, index=None, checkpoints=None):
+    """
+    Open a single file in a zip/tar archive, without reading the other files.
+
+    Zip members are looked up in the central directory. Tar members are looked
+    up in `index` when it is given, otherwise by their headers, seeking past
+    the data of the other members.
+
+    :param archive_file: seekable file-like object with the archive
+    :param file_name: name of the file to open
+    :param index: index of the archive as built by :func:`build_tar_index`
+    :param checkpoints: :class:`GzipCheckpoints` for a gzipped tar
+    :return: an :class:`ArchiveMember`, closing it also closes `archive_file`
+    :raises KeyError: when the archive has no file named `file_name`
+    """
+    with span('archive.open_member', member=file_name, indexed=index is not None):
+        if index is not None:
+            offset, size = index['members'][file_name]
+            if index['format'] == 'gzip':
+                reader = GzipReader(archive_file, checkpoints, offset)
+            else:
+                archive_file.seek(offset)
+                reader = archive_file
+            return ArchiveMember(_SliceReader(reader, size), size, archive_file)
+        archive = open_archive(archive_file)
+        try:
+            if isinstance(archive, zipfile.ZipFile):
+                zinfo = archive.getinfo(file_name)
+                return ArchiveMember(
+                    archive.open(zinfo), zinfo.file_size, archive, archive_file)
+            for member in archive:
+                if member.name == file_name and member.isfile():
+                    return ArchiveMember(
+                        archive.extractfile(member), member.size, archive, archive_file)
+            raise KeyError(file_name)
+        except BaseException:
+            archive.close()
+            raise
+
+
+def build_tar_index(archive_file, checkpoints=None):
+    """
+    Index the files in a tar or gzipped tar archive.
+
+    Only the headers are read. A gzipped tar has to be decompressed once, the
+    decompressor states are saved in `checkpoints` while doing so.
+
+    :param archive_file: seekable file-like object with the archive
+    :param checkpoints: :class:`GzipCheckpoints` to fill for a gzipped tar
+    :return: a dict with the `format` (`tar` or `gzip`) and the `members`,
+        mapping the name of every file to the offset of its data in the
+        (decompressed) tar and its size. `None` when `archive_file` is not a
+        tar or gzipped tar.
+    """
+    with span('archive.build_tar_index'):
+        if zipfile.is_zipfile(archive_file):
+            return None
+        archive_file.seek(0)
+        if archive_file.read(2) == _GZIP_MAGIC:
+            archive_format = 'gzip'
+            fileobj = GzipReader(archive_file, checkpoints)
+            mode = 'r|'
+        else:
+            archive_format = 'tar'
+            fileobj = archive_file
+            mode = 'r:'
+        archive_file.seek(0)
+        members = {}
+        try:
+            with tarfile.open(fileobj=fileobj, mode=mode) as archive:
+                for member in archive:
+                    if member.isfile():
+                        members.setdefault(member.name, [member.offset_data, member.size])
+        except (tarfile.TarError, zlib.error, EOFError):
+            return None
+        return {'format': archive_format, 'members': members}
+
+
+def replace_zip_member(zip_file, file_to_replace, file_content, new_file_name,
+                       target_file, size=None):
+    """
+    Write a copy of a zip archive with one file replaced by a new one.
+
+    The other files are copied as they are, compressed data and headers
+    included, so they keep their compression method and are not
+    decompressed. Only the new file, added at the end, is compressed.
+
+    :param zip_file: seekable file-like object with the original zip
+    :param file_to_replace: name of the file to replace
+    :param file_content: content of the new file, as bytes or a file-like object
+    :param new_file_name: name of the new file
+    :param target_file: seekable file-like object to write the new zip to
+    :param int size: size of `file_content` when it is a file-like object,
+        used to decide whether the new file needs zip64 extensions
+    :raises KeyError: when the archive has no file named `file_to_replace`
+    """
+    with span('archive.replace_zip_member', member=file_to_replace):
+        with zipfile.ZipFile(zip_file) as source, \
+                zipfile.ZipFile(target_file, 'w', zipfile.ZIP_DEFLATED) as target:
+            source.getinfo(file_to_replace)
+            for zinfo in source.infolist():
+                if zinfo.filename != file_to_replace:
+                    _copy_zip_member(zip_file, zinfo, target)
+            if isinstance(file_content, bytes):
+                target.writestr(new_file_name, file_content)
+            else:
+                zinfo = zipfile.ZipInfo(new_file_name, time.localtime()[:6])
+                zinfo.compress_type = zipfile.ZIP_DEFLATED
+                if size is not None:
+                    zinfo.file_size = size
+                with target.open(zinfo, 'w', force_zip64=size is None) as dst:
+                    shutil.copyfileobj(file_content, dst, CHUNK_SIZE)
+            target.comment = source.comment
+
+
+def _copy_zip_member(zip_file, zinfo, target):
+    """
+    Copy the local header, the compressed data and the data descriptor of a
+    member to the end of `target` and register it in its central directory.
+    """
+    zip_file.seek(zinfo.header_offset)
+    header = zip_file.read(_LOCAL_HEADER_SIZE)
+    if len(header) != _LOCAL_HEADER_SIZE or header[:4] != _LOCAL_HEADER_SIGNATURE:
+        raise zipfile.BadZipFile(f'Bad local header for {zinfo.filename}')
+    name_length, extra_length = struct.unpack('<HH', header[26:30])
+    variable = zip_file.read(name_length + extra_length)
+    length = zinfo.compress_size
+    if zinfo.flag_bits & _FLAG_DATA_DESCRIPTOR:
+        zip_file.seek(zinfo.compress_size, 1)
+        signature = zip_file.read(4)
+        length += 16 if _has_zip64_extra(variable[name_length:]) else 8
+        length += 8 if signature == _DATA_DESCRIPTOR_SIGNATURE else 4
+        zip_file.seek(zinfo.header_offset + len(header) + len(variable))
+    copy = copy_module.copy(zinfo)
+    copy.header_offset = target.fp.tell()
+    target.fp.write(header)
+    target.fp.write(variable)
+    while length > 0:
+        chunk = zip_file.read(min(CHUNK_SIZE, length))
+        if not chunk:
+            raise zipfile.BadZipFile(f'Truncated data for {zinfo.filename}')
+        target.fp.write(chunk)
+        length -= len(chunk)
+    # zipfile writes the central directory at start_dir when it is closed
+    target.start_dir = target.fp.tell()
+    target.filelist.append(copy)
+    target.NameToInfo[copy.filename] = copy
+
+
+def _has_zip64_extra(extra):
+    while len(extra) >= 4:
+        header_id, data_size = struct.unpack('<HH', extra[:4])
+        if header_id == 1:
+            return True
+        extra = extra[4 + data_size:]
+    return False
+
+
+class ArchiveMember:
+    """
+    A file opened from an archive by :func:`open_archive_member`.
+
+    :param member_file: file-like object to read the member from
+    :param int size: uncompressed size of the member
+    :param closables: objects to close together with the member
+    """
+
+    def __init__(self, member_file, size, *closables):
+        self.file = member_file
+        self.size = size
+        self.closables = closables
+
+    def read(self, size=-1):
+        return self.file.read(size)
+
+    def close(self):
+        self.file.close()
+        for closable in self.closables:
+            closable.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class GzipCheckpoints:
+    """
+    Decompressor states saved at regular offsets of a gzip stream, so it can
+    be decompressed from the nearest checkpoint instead of from the start.
+
+    Deflate blocks do not end on byte boundaries and :mod:`zlib` can not
+    resume a stream at a bit offset, so the states are copies of live
+    decompressors and only live in memory. When `max_checkpoints` is
+    reached, every other checkpoint is dropped and the spacing doubles, so
+    the memory used does not grow with the size of the stream.
+
+    :param int spacing: minimum number of decompressed bytes between two
+        checkpoints.
+    :param int max_checkpoints: maximum number of checkpoints to keep.
+    """
+
+    def __init__(self, spacing=CHECKPOINT_SPACING, max_checkpoints=MAX_CHECKPOINTS):
+        self.spacing = spacing
+        self.max_checkpoints = max_checkpoints
+        self._offsets = [0]
+        self._states = [(0, None)]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def add(self, offset, compressed_offset, decompressor):
+        """
+        Save the state of a decompressor.
+
+        :param int offset: offset in the decompressed stream.
+        :param int compressed_offset: offset in the gzip stream, all input
+            before it must have been consumed by `decompressor`.
+        :param decompressor: a :func:`zlib.decompressobj`.
+        """
+        with self._lock:
+            if offset < self._offsets[-1] + self.spacing:
+                return
+            self._offsets.append(offset)
+            self._states.append((compressed_offset, decompressor.copy()))
+            if len(self._offsets) > self.max_checkpoints:
+                self._offsets = self._offsets[::2]
+                self._states = self._states[::2]
+                self.spacing *= 2
+
+    def find(self, offset):
+        """
+        Find the last checkpoint at or before an offset.
+
+        :param int offset: offset in the decompressed stream.
+        :return: a tuple with the offset of the checkpoint in the decompressed
+            and in the gzip stream and a copy of the decompressor, or `None`
+            for the start of the stream.
+        """
+        with self._lock:
+            i = bisect.bisect_right(self._offsets, offset) - 1
+            compressed_offset, decompressor = self._states[i]
+            return (
+                self._offsets[i],
+                compressed_offset,
+                decompressor.copy() if decompressor is not None else None
+            )
+
+
+class CheckpointCache:
+    """
+    Keeps the :class:`GzipCheckpoints` of the most recently used archives.
+
+    :param int max_archives: number of archives to keep checkpoints for.
+    :param int spacing: spacing of the checkpoints.
+    :param int max_checkpoints: maximum number of checkpoints per archive.
+    """
+
+    def __init__(self, max_archives=16, spacing=CHECKPOINT_SPACING,
+                 max_checkpoints=MAX_CHECKPOINTS):
+        self.max_archives = max_archives
+        self.spacing = spacing
+        self.max_checkpoints = max_checkpoints
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        """
+        Get the checkpoints of an archive.
+
+        :param key: key of the archive.
+        :param version: value that changes when the archive is rewritten, eg.
+            its size and time of last modification.
+        :return: the :class:`GzipCheckpoints` of the archive.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                entry = (version, GzipCheckpoints(self.spacing, self.max_checkpoints))
+                self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_archives:
+                self._entries.popitem(last=False)
+            return entry[1]
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class GzipReader:
+    """
+    Read a gzip stream from an offset in the decompressed data.
+
+    Decompression starts from the nearest checkpoint before `offset`, and new
+    checkpoints are saved while decompressing. Concatenated gzip members are
+    read as one stream.
+
+    :param fileobj: seekable binary file-like object with the gzip stream
+    :param checkpoints: :class:`GzipCheckpoints` for the stream
+    :param int offset: offset in the decompressed data to start reading at
+    """
+
+    def __init__(self, fileobj, checkpoints=None, offset=0):
+        self.fileobj = fileobj
+        self.checkpoints = checkpoints if checkpoints is not None else GzipCheckpoints()
+        start, self._compressed_offset, decompressor = self.checkpoints.find(offset)
+        self._decompressor = decompressor or zlib.decompressobj(_GZIP_WBITS)
+        self._offset = start
+        self._tail = b''
+        self._buffer = bytearray()
+        self._eof = False
+        fileobj.seek(self._compressed_offset)
+        self._skip(offset - start)
+
+    def _fill(self):
+        data = self._tail
+        if not data:
+            data = self.fileobj.read(CHUNK_SIZE)
+            self._compressed_offset += len(data)
+        if self._decompressor.eof:
+            data = self._decompressor.unused_data + data
+            if not data.startswith(_GZIP_MAGIC):
+                # end of the last member, possibly followed by padding
+                self._eof = True
+                return
+            self._decompressor = zlib.decompressobj(_GZIP_WBITS)
+        elif not data:
+            raise EOFError('Compressed file ended before the end-of-stream marker was reached')
+        out = self._decompressor.decompress(data, CHUNK_SIZE)
+        self._tail = self._decompressor.unconsumed_tail
+        self._buffer += out
+        self._offset += len(out)
+        if not self._tail and not self._decompressor.unused_data:
+            self.checkpoints.add(self._offset, self._compressed_offset, self._decompressor)
+
+    def _skip(self, count):
+        while count > 0:
+            if not self._buffer:
+                self._fill()
+                if self._eof:
+                    raise EOFError('Offset lies beyond the end of the stream')
+            skipped = min(count, len(self._buffer))
+            del self._buffer[:skipped]
+            count -= skipped
+
+    def read(self, size=-1):
+        while (size < 0 or len(self._buffer) < size) and not self._eof:
+            self._fill()
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def close(self):
+        pass
+
+
+class _SliceReader:
+    """Read at most `size` bytes from a file-like object."""
+
+    def __init__(self, fileobj, size):
+        self.fileobj = fileobj
+        self.remaining = size
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.fileobj.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        pass
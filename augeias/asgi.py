@@ -0,0 +1,197 @@
+"""
+This module serves Augeias to ASGI servers.
+
+Pyramid is a WSGI framework, so the application still handles a request in a
+thread. Everything that waits on the client does not: the request body is
+received on the event loop, and every chunk of the response is produced in
+the thread pool and then sent from the event loop. A thread is only busy
+while there is work to do, so many slow clients can be served with a small,
+bounded pool of threads.
+
+Run it with eg.::
+
+    uvicorn --factory 'augeias.asgi:make_app'
+
+with the path of the configuration file in the `AUGEIAS_CONFIG` environment
+variable.
+"""
+import os
+import sys
+import tempfile
+
+from pyramid.paster import get_app
+from pyramid.paster import setup_logging
+
+from augeias import main as wsgi_main
+from augeias.executor import DEFAULT_MAX_WORKERS
+from augeias.executor import make_executor
+from augeias.executor import run_in_executor
+
+#: Request bodies larger than this are spooled to a temporary file.
+MAX_BODY_IN_MEMORY = 1024 * 1024
+
+_EXHAUSTED = object()
+
+
+class AsgiApp:
+    """
+    Serve a WSGI application to an ASGI server.
+
+    :param wsgi_app: The WSGI application, eg. the result of :func:`augeias.main`.
+    :param executor: A :class:`concurrent.futures.Executor` to run the WSGI
+        application in. A pool of `max_workers` threads is created when it is
+        not given.
+    :param int max_workers: Number of threads of the created pool.
+    """
+
+    def __init__(self, wsgi_app, executor=None, max_workers=DEFAULT_MAX_WORKERS):
+        self.wsgi_app = wsgi_app
+        self.executor = executor if executor is not None else make_executor(max_workers)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        elif scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        else:
+            raise ValueError(f"Unsupported ASGI scope type {scope['type']}")
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _receive_body(self, receive):
+        body = tempfile.SpooledTemporaryFile(max_size=MAX_BODY_IN_MEMORY)
+        size = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return None
+            chunk = message.get('body', b'')
+            more_body = message.get('more_body', False)
+            size += len(chunk)
+            if size > MAX_BODY_IN_MEMORY:
+                await run_in_executor(self.executor, body.write, chunk)
+            else:
+                body.write(chunk)
+        body.seek(0)
+        return body
+
+    async def _http(self, scope, receive, send):
+        body = await self._receive_body(receive)
+        if body is None:
+            return
+        try:
+            environ = build_environ(scope, body)
+            response = {}
+
+            def start_response(status, headers, exc_info=None):
+                if exc_info and response.get('sent'):
+                    raise exc_info[1].with_traceback(exc_info[2])
+                response['status'] = status
+                response['headers'] = headers
+                return _write_not_supported
+
+            result = await run_in_executor(self.executor, self.wsgi_app, environ, start_response)
+            try:
+                iterator = await run_in_executor(self.executor, iter, result)
+                chunk = await run_in_executor(self.executor, next, iterator, _EXHAUSTED)
+                response['sent'] = True
+                await send({
+                    'type': 'http.response.start',
+                    'status': int(response['status'].split(' ', 1)[0]),
+                    'headers': [
+                        (name.lower().encode('latin-1'), value.encode('latin-1'))
+                        for name, value in response['headers']
+                    ]
+                })
+                while chunk is not _EXHAUSTED:
+                    if chunk:
+                        await send({'type': 'http.response.body', 'body': chunk,
+                                    'more_body': True})
+                    chunk = await run_in_executor(self.executor, next, iterator, _EXHAUSTED)
+                await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+            finally:
+                close = getattr(result, 'close', None)
+                if close is not None:
+                    await run_in_executor(self.executor, close)
+        finally:
+            await run_in_executor(self.executor, body.close)
+
+
+def _write_not_supported(data):
+    raise NotImplementedError('The write callable of start_response is not supported')
+
+
+def build_environ(scope, body):
+    """
+    Build a WSGI environ for an ASGI HTTP scope.
+
+    :param dict scope: The ASGI scope.
+    :param body: A binary file-like object with the request body.
+    :rtype: dict
+    """
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+        environ['REMOTE_PORT'] = str(scope['client'][1])
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            key = 'CONTENT_TYPE'
+        elif name == 'CONTENT_LENGTH':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name
+        if key in environ:
+            value = environ[key] + ',' + value
+        environ[key] = value
+    return environ
+
+
+def main(global_config, **settings):
+    """This function returns the Pyramid application as an ASGI application."""
+    max_workers = int(settings.get('augeias.asgi.max_workers', DEFAULT_MAX_WORKERS))
+    return AsgiApp(wsgi_main(global_config, **settings), max_workers=max_workers)
+
+
+def make_app():  # pragma: no cover
+    """
+    Create the ASGI application from the configuration file in the
+    `AUGEIAS_CONFIG` environment variable, for `uvicorn --factory`.
+    """
+    config_uri = os.environ['AUGEIAS_CONFIG']
+    setup_logging(config_uri)
+    wsgi_app = get_app(config_uri)
+    max_workers = int(wsgi_app.registry.settings.get(
+        'augeias.asgi.max_workers', DEFAULT_MAX_WORKERS))
+    return AsgiApp(wsgi_app, max_workers=max_workers)
@@ -0,0 +1,54 @@
+"""
+This module contains helpers to run blocking code from asyncio code in a
+bounded pool of threads.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+#: Default number of threads that run blocking code.
+DEFAULT_MAX_WORKERS = 32
+
+_EXHAUSTED = object()
+
+
+def make_executor(max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Create a bounded pool of threads for blocking code.
+
+    :param int max_workers: Maximum number of threads.
+    :rtype: concurrent.futures.ThreadPoolExecutor
+    """
+    return ThreadPoolExecutor(max_workers=max_workers,
+                              thread_name_prefix='augeias')
+
+
+async def run_in_executor(executor, func, *args, **kwargs):
+    """
+    Call a blocking function in `executor` and wait for its result.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executor, functools.partial(func, *args, **kwargs))
+
+
+async def iterate_in_executor(executor, iterable):
+    """
+    Iterate over a blocking iterable, producing every item in `executor`.
+
+    The iterable is closed when the iteration ends or is abandoned, when it
+    has a `close` method.
+
+    :return: An asynchronous iterator over the items of `iterable`.
+    """
+    iterator = await run_in_executor(executor, iter, iterable)
+    try:
+        while True:
+            item = await run_in_executor(executor, next, iterator, _EXHAUSTED)
+            if item is _EXHAUSTED:
+                return
+            yield item
+    finally:
+        close = getattr(iterable, 'close', None)
+        if close is not None:
+            await run_in_executor(executor, close)
@@ -0,0 +1,190 @@
+"""
+This module provides an index of the metadata of the objects in a store, kept
+in an SQLite database.
+"""
+import contextlib
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS containers (
+    container_key TEXT PRIMARY KEY
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS objects (
+    container_key TEXT NOT NULL,
+    object_key TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    mime TEXT NOT NULL,
+    PRIMARY KEY (container_key, object_key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS objects_mtime ON objects (mtime_ns);
+CREATE INDEX IF NOT EXISTS objects_mime ON objects (mime);
+CREATE TABLE IF NOT EXISTS settings (
+    name TEXT PRIMARY KEY,
+    value TEXT
+) WITHOUT ROWID;
+"""
+
+
+class MetadataIndex:
+    """
+    Keeps the containers of a store, and the size, time of last modification
+    and mimetype of its objects, in an SQLite database.
+
+    The database is used in WAL mode, so it can be read while it is written,
+    also by other processes. Every thread gets its own connection.
+
+    The index is only used to answer questions once it has been built, see
+    :attr:`built`, until then it is only kept up to date.
+
+    :param str path: Path of the database file.
+    :param float timeout: Number of seconds to wait for a lock on the database.
+    """
+
+    def __init__(self, path, timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=self.timeout,
+                                 isolation_level=None, check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        db = self._connect()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    def close(self):
+        """Close the connection of the current thread."""
+        db = getattr(self._local, 'db', None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+    @property
+    def built(self):
+        """Whether the index has been built from the store."""
+        row = self._connect().execute(
+            "SELECT value FROM settings WHERE name = 'built'").fetchone()
+        return row is not None
+
+    def add_container(self, container_key):
+        """Add a container, unless it is indexed already."""
+        with self._transaction() as db:
+            db.execute('INSERT OR IGNORE INTO containers VALUES (?)', (container_key,))
+
+    def remove_container(self, container_key):
+        """Remove a container and its objects."""
+        with self._transaction() as db:
+            db.execute('DELETE FROM objects WHERE container_key = ?', (container_key,))
+            db.execute('DELETE FROM containers WHERE container_key = ?', (container_key,))
+
+    def put_object(self, container_key, object_key, size, mtime_ns, mime):
+        """Add or update an object, and add its container if needed."""
+        with self._transaction() as db:
+            db.execute('INSERT OR IGNORE INTO containers VALUES (?)', (container_key,))
+            db.execute('INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?)',
+                       (container_key, object_key, size, mtime_ns, mime))
+
+    def remove_object(self, container_key, object_key):
+        """Remove an object."""
+        with self._transaction() as db:
+            db.execute('DELETE FROM objects WHERE container_key = ? AND object_key = ?',
+                       (container_key, object_key))
+
+    def has_container(self, container_key):
+        """Whether a container is indexed."""
+        return self._connect().execute(
+            'SELECT 1 FROM containers WHERE container_key = ?', (container_key,)
+        ).fetchone() is not None
+
+    def list_container_keys(self):
+        """List the keys of all containers, sorted."""
+        return [row[0] for row in self._connect().execute(
+            'SELECT container_key FROM containers ORDER BY container_key')]
+
+    def get_object(self, container_key, object_key):
+        """
+        :return: A dict with the `size`, `mtime_ns` and `mime` of an object,
+            or `None` when it is not in the index.
+        """
+        row = self._connect().execute(
+            'SELECT size, mtime_ns, mime FROM objects '
+            'WHERE container_key = ? AND object_key = ?',
+            (container_key, object_key)).fetchone()
+        return dict(zip(('size', 'mtime_ns', 'mime'), row)) if row else None
+
+    def list_objects(self, container_key):
+        """
+        :return: A dict with the `size`, `mtime_ns` and `mime` of every object
+            of a container, by object key.
+        """
+        return {
+            row[0]: dict(zip(('size', 'mtime_ns', 'mime'), row[1:]))
+            for row in self._connect().execute(
+                'SELECT object_key, size, mtime_ns, mime FROM objects '
+                'WHERE container_key = ? ORDER BY object_key', (container_key,))
+        }
+
+    def summarize(self, container_key=None):
+        """
+        Count the objects and their size, in total and by mimetype.
+
+        :param str container_key: Only count the objects of this container.
+        :return: A dict with the number of `objects`, their `size` and a dict
+            with the number of objects by mimetype as `mimes`.
+        """
+        where, params = ('WHERE container_key = ?', (container_key,)) \
+            if container_key is not None else ('', ())
+        db = self._connect()
+        objects, size = db.execute(
+            f'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM objects {where}', params
+        ).fetchone()
+        mimes = dict(db.execute(
+            f'SELECT mime, COUNT(*) FROM objects {where} GROUP BY mime', params))
+        return {'objects': objects, 'size': size, 'mimes': mimes}
+
+    def list_modified_since(self, mtime_ns):
+        """
+        :param int mtime_ns: Time as nanoseconds since the epoch.
+        :return: A list of `(container_key, object_key)` for the objects that
+            were modified after `mtime_ns`, oldest first.
+        """
+        return [tuple(row) for row in self._connect().execute(
+            'SELECT container_key, object_key FROM objects '
+            'WHERE mtime_ns > ? ORDER BY mtime_ns', (mtime_ns,))]
+
+    def replace_container(self, container_key, objects):
+        """
+        Replace everything the index holds about a container.
+
+        :param dict objects: The `size`, `mtime_ns` and `mime` of every
+            object of the container, by object key.
+        """
+        with self._transaction() as db:
+            db.execute('DELETE FROM objects WHERE container_key = ?', (container_key,))
+            db.execute('INSERT OR IGNORE INTO containers VALUES (?)', (container_key,))
+            db.executemany('INSERT INTO objects VALUES (?, ?, ?, ?, ?)', [
+                (container_key, object_key, o['size'], o['mtime_ns'], o['mime'])
+                for object_key, o in objects.items()
+            ])
+
+    def mark_built(self):
+        """Record that the index has been built from the store."""
+        with self._transaction() as db:
+            db.execute("INSERT OR REPLACE INTO settings VALUES ('built', '1')")
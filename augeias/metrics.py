@@ -0,0 +1,402 @@
+"""
+This module records metrics about the requests Augeias handles and the work
+its stores do, and exposes them in the Prometheus text format.
+
+Enable it with `augeias.metrics = true` in the configuration file. The
+metrics are then served at `/metrics`.
+"""
+import contextlib
+import threading
+import time
+
+from pyramid.events import ApplicationCreated
+from pyramid.response import Response
+
+#: Upper bounds, in seconds, of the buckets of duration histograms.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0, 10.0, 30.0, 60.0)
+
+#: Content type of the Prometheus text format.
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    return '{%s}' % ','.join(
+        f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} needs the labels {self.labelnames}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        """
+        :return: The lines of the metric in the Prometheus text format.
+        """
+        lines = [f'# HELP {self.name} {_escape(self.documentation)}',
+                 f'# TYPE {self.name} {self.type}']
+        with self._lock:
+            values = sorted(self._values.items(), key=lambda item: item[0])
+        for key, value in values:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}']
+
+
+class Counter(_Metric):
+    """A value that only goes up, eg. a number of requests."""
+
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """Add `amount` to the value for `labels`."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """A value that can go up and down, eg. a number of cached bytes."""
+
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        """Set the value for `labels`."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """
+    Counts observed values, eg. durations, in buckets.
+
+    :param buckets: The upper bounds of the buckets, in increasing order.
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        """Count `value` for `labels`."""
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * len(self.buckets) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-1] += value
+
+    def _render_value(self, key, value):
+        lines = []
+        labelnames = self.labelnames + ('le',)
+        cumulative = 0
+        for bound, count in zip(self.buckets, value):
+            cumulative += count
+            labels = _format_labels(labelnames, key + (_format_value(float(bound)),))
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f'{self.name}_sum{labels} {_format_value(value[-1])}')
+        lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    """
+    The metrics of a process.
+
+    Metrics are created the first time they are asked for. Collectors are
+    called every time the metrics are rendered, to add metrics that are
+    read from elsewhere, eg. the statistics of a cache.
+
+    :param bool enabled: Whether :meth:`timed` records durations.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._metrics = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+        if not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+            raise ValueError(f'{name} is registered as another metric')
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        """:rtype: Counter"""
+        return self._get(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        """:rtype: Gauge"""
+        return self._get(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """:rtype: Histogram"""
+        return self._get(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def timed(self, histogram, **labels):
+        """
+        Like :func:`timed`, but nothing is recorded while the registry is not
+        enabled.
+        """
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return timed(histogram, **labels)
+
+    def set_collector(self, name, collector):
+        """
+        :param str name: Name of the collector, it replaces an earlier
+            collector with the same name.
+        :param collector: A callable that returns a list of metrics to
+            render with the registered ones.
+        """
+        with self._lock:
+            self._collectors[name] = collector
+
+    def collect(self):
+        """
+        :return: The registered metrics and those of the collectors.
+        :rtype: list
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors.values())
+        for collector in collectors:
+            metrics.extend(collector())
+        return metrics
+
+    def render(self):
+        """
+        :return: All metrics in the Prometheus text format.
+        :rtype: str
+        """
+        lines = []
+        for metric in sorted(self.collect(), key=lambda m: m.name):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+#: The registry of metrics that are not tied to an application, eg. the
+#: time spent detecting mimetypes. It is enabled once an application
+#: serves metrics.
+REGISTRY = MetricsRegistry(enabled=False)
+
+MIME_DETECTION_SECONDS = REGISTRY.histogram(
+    'augeias_mime_detection_duration_seconds',
+    'Time spent detecting the mimetype of objects with libmagic.')
+
+
+@contextlib.contextmanager
+def timed(histogram, **labels):
+    """
+    Observe the time spent in the `with` block in a histogram.
+
+    :param Histogram histogram: The histogram to observe the duration in.
+    :param labels: The labels of the observation.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start, **labels)
+
+
+def _request_metrics(registry):
+    return (
+        registry.histogram(
+            'augeias_http_request_duration_seconds',
+            'Time until the response of a request was ready to be sent.',
+            ('route', 'method', 'collection')),
+        registry.counter(
+            'augeias_http_requests_total',
+            'Number of handled requests.',
+            ('route', 'method', 'status', 'collection')),
+        registry.counter(
+            'augeias_http_request_bytes_total',
+            'Number of bytes received in request bodies.',
+            ('route', 'collection')),
+        registry.counter(
+            'augeias_http_response_bytes_total',
+            'Number of bytes sent in response bodies.',
+            ('route', 'collection')),
+    )
+
+
+def _collection_label(request):
+    """
+    The name of the collection of a request, only for existing collections
+    so made up names do not add labels.
+    """
+    collection = (getattr(request, 'matchdict', None) or {}).get('collection_key')
+    return collection if collection in request.registry.collections else ''
+
+
+class _CountingAppIter:
+    """
+    Wraps the `app_iter` of a response without a `Content-Length` and counts
+    the bytes that are sent.
+    """
+
+    def __init__(self, app_iter, counter, labels):
+        self.app_iter = app_iter
+        self.counter = counter
+        self.labels = labels
+        self.bytes = 0
+
+    def __iter__(self):
+        for chunk in self.app_iter:
+            self.bytes += len(chunk)
+            yield chunk
+
+    def close(self):
+        self.counter.inc(self.bytes, **self.labels)
+        close = getattr(self.app_iter, 'close', None)
+        if close is not None:
+            close()
+
+
+def metrics_tween_factory(handler, registry):
+    """
+    A tween that records the duration, the status and the number of bytes
+    received and sent of every request, by route and collection.
+
+    The duration ends when the response is ready to be sent, bodies that are
+    streamed afterwards are not included.
+    """
+    duration, requests, request_bytes, response_bytes = _request_metrics(registry.metrics)
+
+    def metrics_tween(request):
+        start = time.perf_counter()
+        response = None
+        status = 500
+        try:
+            response = handler(request)
+            status = response.status_int
+            return response
+        finally:
+            elapsed = time.perf_counter() - start
+            matched_route = getattr(request, 'matched_route', None)
+            route = matched_route.name if matched_route is not None else ''
+            collection = _collection_label(request)
+            duration.observe(elapsed, route=route, method=request.method,
+                             collection=collection)
+            requests.inc(route=route, method=request.method, status=status,
+                         collection=collection)
+            request_bytes.inc(request.content_length or 0,
+                              route=route, collection=collection)
+            if response is not None:
+                if response.content_length is not None:
+                    response_bytes.inc(response.content_length,
+                                       route=route, collection=collection)
+                else:
+                    response.app_iter = _CountingAppIter(
+                        response.app_iter, response_bytes,
+                        {'route': route, 'collection': collection})
+
+    return metrics_tween
+
+
+def metrics_view(request):
+    """Render the metrics in the Prometheus text format."""
+    res = Response(body=request.registry.metrics.render().encode('utf-8'), status=200)
+    res.headers['Content-Type'] = CONTENT_TYPE
+    return res
+
+
+def _collect_cache_stats(registry):
+    """
+    Read the statistics of the :class:`~augeias.stores.CachingStore.CachingStore`
+    of every collection.
+    """
+    from augeias.stores.CachingStore import CachingStore
+    from augeias.stores.StoreDecorator import StoreDecorator
+
+    def collect():
+        counters = {
+            name: Counter(f'augeias_cache_{name}_total', f'Number of cache {name}.', ('collection',))
+            for name in ('hits', 'misses', 'evictions')
+        }
+        gauges = {
+            name: Gauge(f'augeias_cache_{name}', f'Number of cached {name}.', ('collection',))
+            for name in ('entries', 'bytes')
+        }
+        for collection in registry.collections.values():
+            store = collection.object_store
+            while isinstance(store, StoreDecorator):
+                if isinstance(store, CachingStore):
+                    stats = store.stats
+                    for name, counter in counters.items():
+                        counter.inc(stats[name], collection=collection.name)
+                    for name, gauge in gauges.items():
+                        gauge.set(stats[name], collection=collection.name)
+                    break
+                store = store.store
+        return [*counters.values(), *gauges.values()]
+
+    return collect
+
+
+def _instrument_collections(event):
+    from augeias.stores.InstrumentedStore import InstrumentedStore
+
+    registry = event.app.registry
+    for collection in registry.collections.values():
+        if not isinstance(collection.object_store, InstrumentedStore):
+            collection.object_store = InstrumentedStore(
+                collection.object_store, collection.name, registry.metrics)
+
+
+def includeme(config):
+    """
+    Record metrics of the application in its own registry and serve them,
+    with those of :data:`REGISTRY`, at `/metrics`. The stores of all
+    collections are wrapped in an
+    :class:`~augeias.stores.InstrumentedStore.InstrumentedStore` once the
+    application has been created.
+    """
+    REGISTRY.enabled = True
+    metrics = config.registry.metrics = MetricsRegistry()
+    metrics.set_collector('process', REGISTRY.collect)
+    metrics.set_collector('cache', _collect_cache_stats(config.registry))
+    config.add_tween('augeias.metrics.metrics_tween_factory')
+    config.add_route('metrics', pattern='/metrics', request_method='GET')
+    config.add_view(metrics_view, route_name='metrics')
+    config.add_subscriber(_instrument_collections, ApplicationCreated)
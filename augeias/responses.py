@@ -0,0 +1,263 @@
+"""
+This module contains helpers to build responses that stream stored objects.
+"""
+import hashlib
+import re
+import uuid
+
+from pyramid.httpexceptions import HTTPRequestRangeNotSatisfiable
+from pyramid.response import FileIter
+
+BLOCK_SIZE = 64 * 1024
+
+_RANGE_SPEC = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+
+
+def file_app_iter(request, fileobj, block_size=BLOCK_SIZE):
+    """
+    Wrap a file-like object in a WSGI `app_iter`.
+
+    When the WSGI server offers a `wsgi.file_wrapper` and `fileobj` is a file
+    of the operating system, the wrapper is used, so the server can send the
+    file with `sendfile` where it is available. Other file-like objects, eg.
+    objects that are decoded or fetched over the network while they are read,
+    are read sequentially instead, as servers may seek back and forth in the
+    files they are given. The file is closed once the response has been sent.
+
+    :param request: The current request.
+    :param fileobj: A binary file-like object, positioned at the start of
+        the data to send.
+    :param int block_size: Number of bytes to read at a time.
+    :return: An iterable to use as `app_iter`.
+    """
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    if file_wrapper is not None and _has_fileno(fileobj):
+        return file_wrapper(fileobj, block_size)
+    return FileIter(fileobj, block_size)
+
+
+def _has_fileno(fileobj):
+    try:
+        fileobj.fileno()
+    except (AttributeError, OSError, ValueError):
+        return False
+    return True
+
+
+def set_object_validators(response, size, mtime, encoding=None):
+    """
+    Set `ETag` and `Last-Modified` on a response for a stored object.
+
+    The strong `ETag` is derived from the size and the time of last
+    modification of the object, so it can be computed without reading it.
+
+    :param response: The response to set the validators on.
+    :param int size: Size of the object in bytes.
+    :param float mtime: Time of last modification as a POSIX timestamp.
+    :param str encoding: Content coding of the representation, it is part
+        of the `ETag`, so encoded and decoded representations differ.
+    """
+    response.etag = '%x-%x' % (int(mtime * 1000000), size)
+    if encoding is not None:
+        response.etag += '-' + encoding
+    response.last_modified = mtime
+
+
+def weak_etag(*parts):
+    """
+    Compute a weak `ETag` value from a number of values.
+
+    :return: A tuple to assign to :attr:`webob.Response.etag`.
+    """
+    digest = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+    return digest, False
+
+
+def is_conditional(request):
+    """
+    :return: True when the request has validators that :func:`not_modified`
+        evaluates.
+    """
+    return 'If-None-Match' in request.headers or 'If-Modified-Since' in request.headers
+
+
+def not_modified(request, response):
+    """
+    Evaluate `If-None-Match` and `If-Modified-Since` against the validators
+    of a response, and turn it into a `304 Not Modified` when they match.
+
+    Evaluate this before producing the body of the response, so nothing needs
+    to be read when the client already has the current representation.
+
+    :param request: The current request.
+    :param response: A response with its validators set.
+    :return: True when the response became a `304 Not Modified`.
+    """
+    if 'If-None-Match' in request.headers:
+        if response.etag is None or response.etag not in request.if_none_match:
+            return False
+    elif 'If-Modified-Since' in request.headers:
+        if_modified_since = request.if_modified_since
+        if if_modified_since is None or response.last_modified is None or \
+                response.last_modified > if_modified_since:
+            return False
+    else:
+        return False
+    response.status_int = 304
+    response.body = b''
+    response.content_type = None
+    del response.content_length
+    return True
+
+
+def parse_range_header(header, size):
+    """
+    Parse the value of a `Range` header for a representation of `size` bytes.
+
+    :param str header: Value of the `Range` header.
+    :param int size: Size of the complete representation.
+    :return: A list of `(start, stop)` tuples, `stop` being exclusive. `None`
+        when the header is absent, malformed or not worth honouring, in which
+        case the complete representation should be sent. An empty list when
+        none of the ranges can be satisfied.
+    """
+    if not header:
+        return None
+    unit, _, specs = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not specs.strip():
+        return None
+    ranges = []
+    for spec in specs.split(','):
+        match = _RANGE_SPEC.match(spec)
+        if not match:
+            return None
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            stop = int(last) + 1 if last else size
+            if last and stop <= start:
+                return None
+        elif last:
+            start = max(size - int(last), 0)
+            stop = size
+            if not int(last):
+                continue
+        else:
+            return None
+        if start < size:
+            ranges.append((start, min(stop, size)))
+    if sum(stop - start for start, stop in ranges) > size:
+        # Overlapping ranges asking for more than the whole representation.
+        return None
+    return ranges
+
+
+def requested_ranges(request, response, size):
+    """
+    Determine which byte ranges of an object should be sent.
+
+    `If-Range` is matched against the validators already set on `response`.
+
+    :param request: The current request.
+    :param response: The response that will be sent.
+    :param int size: Size of the object.
+    :return: A list of `(start, stop)` tuples or `None` for the whole object.
+    :raises pyramid.httpexceptions.HTTPRequestRangeNotSatisfiable: When none
+        of the requested ranges lies within the object.
+    """
+    ranges = parse_range_header(request.headers.get('Range'), size)
+    if ranges is None or response not in request.if_range:
+        return None
+    if not ranges:
+        raise HTTPRequestRangeNotSatisfiable(
+            headers={'Content-Range': f'bytes */{size}'})
+    return ranges
+
+
+def set_file_body(request, response, fileobj, size, ranges=None,
+                  block_size=BLOCK_SIZE):
+    """
+    Use (ranges of) a file-like object as the body of a response.
+
+    With a single range a `206 Partial Content` response is sent, with several
+    ranges the parts are sent as `multipart/byteranges`. Only the requested
+    bytes are read, so `fileobj` must be seekable when ranges are given.
+
+    :param request: The current request.
+    :param response: The response to set the body on. Its content type is
+        used as the content type of the object.
+    :param fileobj: A binary file-like object with the data of the object.
+    :param int size: Size of the object.
+    :param ranges: The ranges to send as returned by :func:`requested_ranges`.
+    :param int block_size: Number of bytes to read at a time.
+    """
+    response.accept_ranges = 'bytes'
+    if not ranges:
+        response.app_iter = file_app_iter(request, fileobj, block_size)
+        response.content_length = size
+        return
+    response.status_int = 206
+    if len(ranges) == 1:
+        start, stop = ranges[0]
+        response.content_range = (start, stop, size)
+        response.app_iter = RangeFileIter(fileobj, ranges, block_size)
+        response.content_length = stop - start
+        return
+    boundary = uuid.uuid4().hex
+    parts = []
+    for start, stop in ranges:
+        parts.append((
+            f'\r\n--{boundary}\r\n'
+            f'Content-Type: {response.content_type}\r\n'
+            f'Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n'
+        ).encode('latin-1'))
+        parts.append((start, stop))
+    parts.append(f'\r\n--{boundary}--\r\n'.encode('latin-1'))
+    response.content_type = 'multipart/byteranges'
+    response.content_type_params = {'boundary': boundary}
+    response.app_iter = RangeFileIter(fileobj, parts, block_size)
+    response.content_length = sum(
+        len(part) if isinstance(part, bytes) else part[1] - part[0]
+        for part in parts
+    )
+
+
+class RangeFileIter:
+    """
+    A WSGI `app_iter` that sends byte ranges of a file-like object.
+
+    :param fileobj: A seekable binary file-like object.
+    :param parts: A list of `(start, stop)` tuples and literal byte strings,
+        sent in order.
+    :param int block_size: Number of bytes to read at a time.
+    """
+
+    def __init__(self, fileobj, parts, block_size=BLOCK_SIZE):
+        self.file = fileobj
+        self.parts = parts
+        self.block_size = block_size
+        self._chunks = self._iter_chunks()
+
+    def _iter_chunks(self):
+        for part in self.parts:
+            if isinstance(part, bytes):
+                yield part
+                continue
+            start, stop = part
+            self.file.seek(start)
+            remaining = stop - start
+            while remaining > 0:
+                chunk = self.file.read(min(self.block_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._chunks)
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,27 @@
+"""
+Record the mimetype of objects in existing
+:class:`~augeias.stores.PairTreeFileSystemStore.PairTreeFileSystemStore`
+stores, so it no longer has to be detected when the objects are fetched.
+
+Usage::
+
+    augeias_backfill_mime ~/data/cheeses/data ~/data/trees/data
+"""
+import argparse
+
+from augeias.stores.PairTreeFileSystemStore import PairTreeFileSystemStore
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Record the mimetype of every object in a store.')
+    parser.add_argument('store_dir', nargs='+',
+                        help='Directory of a PairTreeFileSystemStore.')
+    args = parser.parse_args(argv)
+    for store_dir in args.store_dir:
+        count = PairTreeFileSystemStore(store_dir).backfill_mime_types()
+        print(f'{store_dir}: recorded the mimetype of {count} objects')
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
@@ -0,0 +1,41 @@
+"""
+Remove the data nothing refers to anymore from
+:class:`~augeias.stores.ContentAddressableStore.ContentAddressableStore`
+stores and repair their reference counts.
+
+With `--uploads` the abandoned resumable uploads of
+:class:`~augeias.stores.PairTreeFileSystemStore.PairTreeFileSystemStore`
+stores are removed instead.
+
+Usage::
+
+    augeias_collect_garbage ~/data/dossiers/data
+    augeias_collect_garbage --uploads --max-age 48 ~/data/cheeses/data
+"""
+import argparse
+
+from augeias.stores.ContentAddressableStore import ContentAddressableStore
+from augeias.stores.PairTreeFileSystemStore import PairTreeFileSystemStore
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Remove unreferenced data from a content addressable store.')
+    parser.add_argument('store_dir', nargs='+',
+                        help='Directory of a ContentAddressableStore.')
+    parser.add_argument('--uploads', action='store_true',
+                        help='Remove abandoned uploads from PairTreeFileSystemStores instead.')
+    parser.add_argument('--max-age', type=float, default=24 * 7,
+                        help='Hours after the last chunk an upload is abandoned (default: 168).')
+    args = parser.parse_args(argv)
+    for store_dir in args.store_dir:
+        if args.uploads:
+            count = PairTreeFileSystemStore(store_dir).expire_uploads(args.max_age * 3600)
+            print(f'{store_dir}: removed {count} abandoned uploads')
+            continue
+        count = ContentAddressableStore(store_dir).collect_garbage()
+        print(f'{store_dir}: removed {count} unreferenced blobs')
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
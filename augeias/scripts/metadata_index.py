@@ -0,0 +1,42 @@
+"""
+Rebuild or verify the metadata index of
+:class:`~augeias.stores.PairTreeFileSystemStore.PairTreeFileSystemStore`
+stores.
+
+Usage::
+
+    augeias_metadata_index rebuild ~/data/cheeses/data
+    augeias_metadata_index verify ~/data/cheeses/data
+"""
+import argparse
+
+from augeias.stores.PairTreeFileSystemStore import PairTreeFileSystemStore
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Reconcile the metadata index of a store with its files.')
+    parser.add_argument('command', choices=['rebuild', 'verify'],
+                        help='Rebuild the index, or only report its differences.')
+    parser.add_argument('store_dir', nargs='+',
+                        help='Directory of a PairTreeFileSystemStore.')
+    args = parser.parse_args(argv)
+    status = 0
+    for store_dir in args.store_dir:
+        store = PairTreeFileSystemStore(store_dir, metadata_index=True)
+        if args.command == 'rebuild':
+            count = store.rebuild_metadata_index()
+            print(f'{store_dir}: indexed {count} objects')
+        else:
+            problems = store.verify_metadata_index()
+            for container_key, object_key, problem in problems:
+                location = container_key if object_key is None else f'{container_key}/{object_key}'
+                print(f'{store_dir}: {location} is {problem}')
+            print(f'{store_dir}: found {len(problems)} differences')
+            if problems:
+                status = 1
+    return status
+
+
+if __name__ == '__main__':  # pragma: no cover
+    raise SystemExit(main())
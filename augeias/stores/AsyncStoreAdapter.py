@@ -0,0 +1,118 @@
+"""
+This module provides an asynchronous adapter for blocking stores.
+"""
+from augeias.executor import iterate_in_executor
+from augeias.executor import make_executor
+from augeias.executor import run_in_executor
+from augeias.stores.AsyncStoreInterface import AsyncIStore
+from augeias.stores.StoreInterface import CHUNK_SIZE
+
+
+class AsyncStoreAdapter(AsyncIStore):
+    """
+    Use an :class:`~augeias.stores.StoreInterface.IStore` from asyncio code.
+
+    Every call to the store, and every read of an object, runs in a bounded
+    pool of threads, so the event loop never blocks on disk or network I/O
+    and the number of threads does not grow with the number of clients.
+
+    :param IStore store: The store to adapt.
+    :param executor: A :class:`concurrent.futures.Executor` to run the calls
+        in. A pool of `max_workers` threads is created when it is not given.
+    :param int max_workers: Number of threads of the created pool.
+    """
+
+    def __init__(self, store, executor=None, max_workers=None):
+        self.store = store
+        if executor is None:
+            executor = make_executor(max_workers) if max_workers else make_executor()
+        self.executor = executor
+
+    def _run(self, func, *args):
+        return run_in_executor(self.executor, func, *args)
+
+    async def create_object(self, container_key, object_key, object_data):
+        return await self._run(
+            self.store.create_object, container_key, object_key, object_data)
+
+    async def delete_object(self, container_key, object_key):
+        return await self._run(self.store.delete_object, container_key, object_key)
+
+    async def get_object(self, container_key, object_key):
+        return await self._run(self.store.get_object, container_key, object_key)
+
+    async def iter_object(self, container_key, object_key, chunk_size=None):
+        chunk_size = chunk_size or CHUNK_SIZE
+        f = await self._run(self.store.open_object, container_key, object_key)
+        try:
+            while True:
+                chunk = await self._run(f.read, chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+        finally:
+            await self._run(f.close)
+
+    async def get_object_info(self, container_key, object_key):
+        return await self._run(self.store.get_object_info, container_key, object_key)
+
+    async def stat_object(self, container_key, object_key):
+        return await self._run(self.store.stat_object, container_key, object_key)
+
+    async def update_object(self, container_key, object_key, object_data):
+        return await self._run(
+            self.store.update_object, container_key, object_key, object_data)
+
+    async def copy_object(self, source_store, source_container_key, source_object_key,
+                          container_key, object_key):
+        if isinstance(source_store, AsyncStoreAdapter):
+            source_store = source_store.store
+        return await self._run(
+            self.store.copy_object, source_store, source_container_key,
+            source_object_key, container_key, object_key)
+
+    async def create_upload(self, container_key, object_key):
+        return await self._run(self.store.create_upload, container_key, object_key)
+
+    async def append_upload(self, container_key, object_key, upload_id, offset, data):
+        return await self._run(
+            self.store.append_upload, container_key, object_key, upload_id, offset, data)
+
+    async def get_upload_offset(self, container_key, object_key, upload_id):
+        return await self._run(
+            self.store.get_upload_offset, container_key, object_key, upload_id)
+
+    async def commit_upload(self, container_key, object_key, upload_id):
+        return await self._run(
+            self.store.commit_upload, container_key, object_key, upload_id)
+
+    async def abort_upload(self, container_key, object_key, upload_id):
+        return await self._run(
+            self.store.abort_upload, container_key, object_key, upload_id)
+
+    async def list_object_keys_for_container(self, container_key):
+        return await self._run(self.store.list_object_keys_for_container, container_key)
+
+    async def iter_object_keys_for_container(self, container_key):
+        object_keys = await self._run(
+            self.store.iter_object_keys_for_container, container_key)
+        async for object_key in iterate_in_executor(self.executor, object_keys):
+            yield object_key
+
+    async def list_object_info_for_container(self, container_key):
+        return await self._run(self.store.list_object_info_for_container, container_key)
+
+    async def iter_container_data(self, container_key, translations=None):
+        chunks = await self._run(
+            self.store.iter_container_data, container_key, translations)
+        async for chunk in iterate_in_executor(self.executor, chunks):
+            yield chunk
+
+    async def list_container_keys(self):
+        return await self._run(self.store.list_container_keys)
+
+    async def create_container(self, container_key):
+        return await self._run(self.store.create_container, container_key)
+
+    async def delete_container(self, container_key):
+        return await self._run(self.store.delete_container, container_key)
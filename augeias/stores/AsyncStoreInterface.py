@@ -0,0 +1,225 @@
+"""
+This module defines the interface for stores that are used from asyncio code.
+"""
+
+from abc import ABCMeta, abstractmethod
+
+
+class AsyncIStore(metaclass=ABCMeta):
+    """
+    The asynchronous counterpart of
+    :class:`~augeias.stores.StoreInterface.IStore`.
+
+    Every method is a coroutine with the same arguments and result as the
+    method of the same name of `IStore`. Objects are read as asynchronous
+    iterators of chunks instead of file-like objects.
+    """
+
+    @abstractmethod
+    async def create_object(self, container_key, object_key, object_data):
+        """
+        Save a new object in the data store.
+
+        :param str container_key: Key of the container to create an object in.
+        :param str object_key: Key of the object to create.
+        :param object_data: The data for the object to create, as bytes or a
+            binary file-like object.
+        :raises augeias.stores.error.NotFoundException: When the container could not be found.
+        """
+
+    @abstractmethod
+    async def delete_object(self, container_key, object_key):
+        """
+        Delete an object from the data store.
+
+        :param str container_key: Key of the container that the object lives in.
+        :param str object_key: Key of the object to delete.
+        :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
+        """
+
+    @abstractmethod
+    async def get_object(self, container_key, object_key):
+        """
+        Retrieve an object from the data store.
+
+        :param str container_key: Key of the container that the object lives in.
+        :param str object_key: Key of the object to retrieve.
+        :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
+        """
+
+    @abstractmethod
+    def iter_object(self, container_key, object_key, chunk_size=None):
+        """
+        Stream an object from the data store.
+
+        :param str container_key: Key of the container that the object lives in.
+        :param str object_key: Key of the object to retrieve.
+        :param int chunk_size: Number of bytes to read at a time.
+        :returns: An asynchronous iterator of byte strings.
+        :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
+        """
+
+    @abstractmethod
+    async def get_object_info(self, container_key, object_key):
+        """
+        Retrieve object info (mimetype, size, time last modification) from the data store.
+
+        :param str container_key: Key of the container that the object lives in.
+        :param str object_key: Key of the object to retrieve.
+        :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
+        """
+
+    @abstractmethod
+    async def stat_object(self, container_key, object_key):
+        """
+        Retrieve the size and time of last modification of an object.
+
+        :param str container_key: Key of the container that the object lives in.
+        :param str object_key: Key of the object to retrieve.
+        :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
+        """
+
+    @abstractmethod
+    async def update_object(self, container_key, object_key, object_data):
+        """
+        Update an object in the data store.
+
+        :param str container_key: Key of the container that the object lives in.
+        :param str object_key: Key of the object to update.
+        :param object_data: New data for the object, as bytes or a binary
+            file-like object.
+        :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
+        """
+
+    @abstractmethod
+    async def copy_object(self, source_store, source_container_key, source_object_key,
+                          container_key, object_key):
+        """
+        Copy an object, possibly from another store, to this store.
+
+        :param source_store: Store the object to copy lives in.
+        :param str source_container_key: Key of the container of the object to copy.
+        :param str source_object_key: Key of the object to copy.
+        :param str container_key: Key of the container to copy the object to.
+        :param str object_key: Key of the copy.
+        :raises augeias.stores.error.NotFoundException: When the source object or one of the containers could not be found.
+        """
+
+    @abstractmethod
+    async def create_upload(self, container_key, object_key):
+        """
+        Start a resumable upload of an object.
+
+        :param str container_key: Key of the container of the object.
+        :param str object_key: Key of the object to upload.
+        :returns: The id of the upload.
+        """
+
+    @abstractmethod
+    async def append_upload(self, container_key, object_key, upload_id, offset, data):
+        """
+        Add a chunk to a resumable upload.
+
+        :param str container_key: Key of the container of the object.
+        :param str object_key: Key of the object to upload.
+        :param str upload_id: Id of the upload.
+        :param int offset: Number of bytes received so far.
+        :param data: The chunk, as bytes or a binary file-like object.
+        :returns: The number of bytes received so far, including the chunk.
+        """
+
+    @abstractmethod
+    async def get_upload_offset(self, container_key, object_key, upload_id):
+        """
+        Find where a resumable upload continues.
+
+        :param str container_key: Key of the container of the object.
+        :param str object_key: Key of the object to upload.
+        :param str upload_id: Id of the upload.
+        :returns: The number of bytes received so far.
+        """
+
+    @abstractmethod
+    async def commit_upload(self, container_key, object_key, upload_id):
+        """
+        Replace the object with the data of a resumable upload.
+
+        :param str container_key: Key of the container of the object.
+        :param str object_key: Key of the object to upload.
+        :param str upload_id: Id of the upload.
+        """
+
+    @abstractmethod
+    async def abort_upload(self, container_key, object_key, upload_id):
+        """
+        End a resumable upload without changing the object.
+
+        :param str container_key: Key of the container of the object.
+        :param str object_key: Key of the object to upload.
+        :param str upload_id: Id of the upload.
+        """
+
+    @abstractmethod
+    async def list_object_keys_for_container(self, container_key):
+        """
+        List all object keys for a container in the data store.
+
+        :param str container_key: Key of the container to list the objects for.
+        :raises augeias.stores.error.NotFoundException: When the container could not be found.
+        """
+
+    @abstractmethod
+    def iter_object_keys_for_container(self, container_key):
+        """
+        Iterate over the object keys of a container, in no particular order.
+
+        :param str container_key: Key of the container to list the objects for.
+        :returns: An asynchronous iterator of object keys.
+        :raises augeias.stores.error.NotFoundException: When the container could not be found.
+        """
+
+    @abstractmethod
+    async def list_object_info_for_container(self, container_key):
+        """
+        Retrieve the object info of all objects in a container.
+
+        :param str container_key: Key of the container to list the objects for.
+        :raises augeias.stores.error.NotFoundException: When the container could not be found.
+        """
+
+    @abstractmethod
+    def iter_container_data(self, container_key, translations=None):
+        """
+        Stream a zip file of the requested objects of a container.
+
+        :param container_key: Key of the container which must be retrieved.
+        :param translations: Dict of object IDs and file names to use for them.
+        :returns: An asynchronous iterator of byte strings.
+        :raises augeias.stores.error.NotFoundException: When the container or
+            one of the requested objects could not be found.
+        """
+
+    @abstractmethod
+    async def list_container_keys(self):
+        """
+        List the keys of all containers in the data store.
+
+        :raises NotImplementedError: When the store can not list its containers.
+        """
+
+    @abstractmethod
+    async def create_container(self, container_key):
+        """
+        Create a new container in the data store.
+
+        :param str container_key: Key of the container to create.
+        """
+
+    @abstractmethod
+    async def delete_container(self, container_key):
+        """
+        Delete a container and all it's objects in the data store.
+
+        :param str container_key: Key of the container to delete.
+        :raises augeias.stores.error.NotFoundException: When the container could not be found.
+        """
@@ -0,0 +1,284 @@
+"""
+This module provides a store that keeps small objects of another store in
+memory.
+"""
+import collections
+import threading
+from io import BytesIO
+
+from augeias.stores.StoreDecorator import StoreDecorator
+from augeias.stores.StoreInterface import ObjectHandle
+
+#: Number of bytes an entry is accounted for on top of its data.
+ENTRY_OVERHEAD = 512
+
+_CacheEntry = collections.namedtuple('_CacheEntry', ['data', 'info', 'stat', 'cost'])
+
+
+class CachingStore(StoreDecorator):
+    """
+    Keeps the data and the info of small objects of another store in memory.
+
+    The cache is a segmented LRU: an object enters a probationary segment
+    and moves to a protected segment when it is read again, so objects that
+    are read once, eg. while a container is downloaded, do not push out the
+    objects that are read often. Objects are invalidated when they are
+    written or deleted through this store.
+
+    The cache only sees changes made through it. When several processes
+    write to the same store, set `revalidate` to compare the size and time
+    of last modification of a cached object with the wrapped store before
+    it is used.
+
+    :param IStore store: The store to cache objects of.
+    :param int max_bytes: Maximum number of bytes to keep in memory.
+    :param int max_object_size: Objects larger than this are not cached.
+    :param float protected_ratio: Part of `max_bytes` for objects that have
+        been read more than once.
+    :param bool revalidate: Check cached objects against the wrapped store.
+    """
+
+    def __init__(self, store, max_bytes=64 * 1024 * 1024,
+                 max_object_size=1024 * 1024, protected_ratio=0.8,
+                 revalidate=False):
+        super().__init__(store)
+        self.max_bytes = max_bytes
+        self.max_object_size = max_object_size
+        self.max_protected_bytes = int(max_bytes * protected_ratio)
+        self.revalidate = revalidate
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._probation = collections.OrderedDict()
+        self._protected = collections.OrderedDict()
+        self._probation_bytes = 0
+        self._protected_bytes = 0
+        self._container_keys = collections.defaultdict(set)
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def stats(self):
+        """
+        Counters to size the cache with.
+
+        :returns: A dict with the number of `hits`, `misses` and `evictions`,
+            and the number of `entries` and `bytes` in the cache.
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._probation) + len(self._protected),
+                'bytes': self._probation_bytes + self._protected_bytes
+            }
+
+    def _get(self, key, *fields):
+        """
+        Look up a cached object and count the hit or the miss.
+
+        :return: The entry of the object when it has all `fields`, otherwise
+            `None`.
+        """
+        if self.revalidate:
+            fields += ('stat',)
+        with self._lock:
+            entry = self._protected.get(key)
+            if entry is not None:
+                self._protected.move_to_end(key)
+            else:
+                entry = self._probation.get(key)
+            if entry is None or any(getattr(entry, field) is None for field in fields):
+                self.misses += 1
+                return None
+        if self.revalidate and entry.stat != self.store.stat_object(*key):
+            self._invalidate(*key)
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            if key in self._probation:
+                self._promote(key)
+            self.hits += 1
+        return entry
+
+    def _promote(self, key):
+        entry = self._probation.pop(key)
+        self._probation_bytes -= entry.cost
+        self._protected[key] = entry
+        self._protected_bytes += entry.cost
+        while self._protected_bytes > self.max_protected_bytes:
+            demoted_key, demoted = self._protected.popitem(last=False)
+            self._protected_bytes -= demoted.cost
+            self._probation[demoted_key] = demoted
+            self._probation_bytes += demoted.cost
+
+    def _put(self, key, generation, data=None, info=None, stat=None):
+        """
+        Add what was read about an object, unless the object was changed
+        after the read started.
+        """
+        with self._lock:
+            if generation != self._generation:
+                return
+            old = self._remove(key)
+            if old is not None and (stat is None or old.stat == stat):
+                data = data if data is not None else old.data
+                info = info if info is not None else old.info
+                stat = stat if stat is not None else old.stat
+            cost = ENTRY_OVERHEAD + (len(data) if data is not None else 0)
+            if cost > self.max_bytes:
+                return
+            self._probation[key] = _CacheEntry(data, info, stat, cost)
+            self._probation_bytes += cost
+            self._container_keys[key[0]].add(key[1])
+            while self._probation_bytes + self._protected_bytes > self.max_bytes:
+                segment = self._probation if self._probation else self._protected
+                self._remove(next(iter(segment)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        for segment in (self._probation, self._protected):
+            entry = segment.pop(key, None)
+            if entry is not None:
+                if segment is self._probation:
+                    self._probation_bytes -= entry.cost
+                else:
+                    self._protected_bytes -= entry.cost
+                keys = self._container_keys[key[0]]
+                keys.discard(key[1])
+                if not keys:
+                    del self._container_keys[key[0]]
+                return entry
+        return None
+
+    def _invalidate(self, container_key, object_key=None):
+        with self._lock:
+            self._generation += 1
+            if object_key is not None:
+                self._remove((container_key, object_key))
+            else:
+                for key in list(self._container_keys.get(container_key, ())):
+                    self._remove((container_key, key))
+
+    def invalidate(self, container_key, object_key=None):
+        """
+        Remove an object, or all objects of a container, from the cache.
+
+        :param str container_key: Key of the container.
+        :param str object_key: Key of the object, or `None` for all objects
+            of the container.
+        """
+        self._invalidate(container_key, object_key)
+
+    def get_object(self, container_key, object_key):
+        with self.open_object_handle(container_key, object_key) as handle:
+            return handle.read()
+
+    def open_object(self, container_key, object_key):
+        return self.open_object_handle(container_key, object_key).file
+
+    def _get_handle(self, key):
+        entry = self._get(key, 'data', 'info', 'stat')
+        if entry is None:
+            return None
+        return ObjectHandle(BytesIO(entry.data), entry.stat['size'],
+                            entry.stat['mtime'], entry.info['mime'])
+
+    def _put_handle(self, key, generation, handle):
+        """
+        Cache the data of an opened object when it is small enough.
+
+        :return: A handle to use instead of `handle`.
+        """
+        if handle.size > self.max_object_size:
+            return handle
+        with handle:
+            data = handle.read()
+        self._put(key, generation, data=data, info=handle.info,
+                  stat={'size': handle.size, 'mtime': handle.mtime})
+        return ObjectHandle(BytesIO(data), handle.size, handle.mtime, handle.mime)
+
+    def open_object_handle(self, container_key, object_key):
+        key = (container_key, object_key)
+        handle = self._get_handle(key)
+        if handle is not None:
+            return handle
+        generation = self._generation
+        return self._put_handle(key, generation,
+                                self.store.open_object_handle(container_key, object_key))
+
+    def open_encoded_object_handle(self, container_key, object_key, encodings):
+        # Cached objects are served decoded. Others are opened with the
+        # encodings, and only cached when they are the same for all of them.
+        key = (container_key, object_key)
+        handle = self._get_handle(key)
+        if handle is not None:
+            return handle
+        generation = self._generation
+        handle = self.store.open_encoded_object_handle(container_key, object_key, encodings)
+        if handle.encoding is not None or handle.negotiated:
+            return handle
+        return self._put_handle(key, generation, handle)
+
+    def get_object_info(self, container_key, object_key):
+        key = (container_key, object_key)
+        entry = self._get(key, 'info')
+        if entry is not None:
+            return dict(entry.info)
+        generation = self._generation
+        stat = self.store.stat_object(container_key, object_key) if self.revalidate else None
+        info = self.store.get_object_info(container_key, object_key)
+        self._put(key, generation, info=dict(info), stat=stat)
+        return info
+
+    def stat_object(self, container_key, object_key):
+        key = (container_key, object_key)
+        entry = self._get(key, 'stat')
+        if entry is not None:
+            return dict(entry.stat)
+        generation = self._generation
+        stat = self.store.stat_object(container_key, object_key)
+        self._put(key, generation, stat=dict(stat))
+        return stat
+
+    def create_object(self, container_key, object_key, object_data):
+        try:
+            return self.store.create_object(container_key, object_key, object_data)
+        finally:
+            self._invalidate(container_key, object_key)
+
+    def update_object(self, container_key, object_key, object_data):
+        try:
+            return self.store.update_object(container_key, object_key, object_data)
+        finally:
+            self._invalidate(container_key, object_key)
+
+    def copy_object(self, source_store, source_container_key, source_object_key,
+                    container_key, object_key):
+        try:
+            return super().copy_object(
+                source_store, source_container_key, source_object_key,
+                container_key, object_key)
+        finally:
+            self._invalidate(container_key, object_key)
+
+    def commit_upload(self, container_key, object_key, upload_id, encode=None):
+        try:
+            return self.store.commit_upload(container_key, object_key, upload_id, encode)
+        finally:
+            self._invalidate(container_key, object_key)
+
+    def delete_object(self, container_key, object_key):
+        try:
+            return self.store.delete_object(container_key, object_key)
+        finally:
+            self._invalidate(container_key, object_key)
+
+    def delete_container(self, container_key):
+        try:
+            return self.store.delete_container(container_key)
+        finally:
+            self._invalidate(container_key)
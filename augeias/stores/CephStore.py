@@ -1,34 +1,515 @@
+"""
+This module provides a store that keeps its objects in Ceph, or another
+object storage, through the S3 protocol of the RADOS Gateway.
+
+It needs `boto3`, install it with::
+
+    pip install augeias[ceph]
+"""
+import datetime
+import functools
+import io
+import itertools
+import logging
+from io import BytesIO
+
+from augeias.stores.PairTreeFileSystemStore import MIME_SNIFF_SIZE
+from augeias.stores.PairTreeFileSystemStore import _sniff_mime
+from augeias.stores.PairTreeFileSystemStore import _validate_data
 from augeias.stores.StoreInterface import IStore
+from augeias.stores.StoreInterface import ObjectHandle
+from augeias.stores.error import NotFoundException
+from augeias.zipstream import ZipMember
+from augeias.zipstream import stream_zip
+
+try:
+    import boto3
+    from botocore.config import Config
+except ImportError:  # pragma: no cover
+    boto3 = None
+
+log = logging.getLogger(__name__)
+
+#: Objects larger than this are uploaded in parts of this size.
+MULTIPART_CHUNK_SIZE = 8 * 1024 * 1024
+
+#: Objects larger than this are copied in parts of this size. A single copy
+#: request can copy at most 5 GB.
+COPY_PART_SIZE = 1024 * 1024 * 1024
+
+#: Maximum number of keys that can be deleted with one request.
+DELETE_BATCH_SIZE = 1000
+
+NOT_FOUND_CODES = frozenset(['404', 'NoSuchKey', 'NotFound', 'NoSuchUpload'])
+
+
+def _is_not_found(error):
+    code = getattr(error, 'response', {}).get('Error', {}).get('Code')
+    return code in NOT_FOUND_CODES
+
+
+class _ObjectReader(io.RawIOBase):
+    """
+    A seekable file-like object for an object in the object storage.
+
+    Data is read from a single response while it is read sequentially. A
+    seek closes the response; the next read requests the object from the
+    new position on with a ranged GET.
+    """
+
+    def __init__(self, store, key, size, body=None):
+        self._store = store
+        self._key = key
+        self._size = size
+        self._body = body
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._size
+        if offset < 0:
+            raise ValueError('negative seek position %d' % offset)
+        if offset != self._position:
+            self._close_body()
+            self._position = offset
+        return self._position
+
+    def readinto(self, buffer):
+        if self._position >= self._size or not len(buffer):
+            return 0
+        if self._body is None:
+            self._body = self._store._get(
+                self._key, Range=f'bytes={self._position}-')['Body']
+        data = self._body.read(len(buffer))
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def _close_body(self):
+        if self._body is not None:
+            self._body.close()
+            self._body = None
+
+    def close(self):
+        self._close_body()
+        super().close()
 
 
 class CephStore(IStore):
+    """
+    Keeps objects in a bucket of an S3 compatible object storage, such as
+    the RADOS Gateway of Ceph.
+
+    A container is a prefix in the bucket. It exists when an empty object
+    named after the prefix exists, so empty containers can be listed too.
+
+    The client keeps a pool of connections that is shared by all threads.
+    Objects larger than `multipart_chunk_size` are uploaded in parts, so
+    they are never held in memory at once.
+
+    :param str bucket: Name of the bucket to keep the objects in.
+    :param str endpoint_url: URL of the object storage.
+    :param client: An S3 client, eg. from :func:`boto3.client`. Created from
+        `endpoint_url` and `client_kwargs` when it is not given.
+    :param int max_pool_connections: Size of the connection pool of the
+        created client.
+    :param int multipart_chunk_size: Size of the parts of an upload.
+    :param int copy_part_size: Size of the parts of a copy within the
+        object storage, at most 5 GB.
+    :param client_kwargs: Further arguments for :func:`boto3.client`, eg.
+        `aws_access_key_id` and `aws_secret_access_key`.
+    """
+
+    def __init__(self, bucket, endpoint_url=None, client=None,
+                 max_pool_connections=10,
+                 multipart_chunk_size=MULTIPART_CHUNK_SIZE,
+                 copy_part_size=COPY_PART_SIZE, **client_kwargs):
+        if client is None:
+            if boto3 is None:  # pragma: no cover
+                raise ImportError('CephStore needs boto3: pip install augeias[ceph]')
+            client = boto3.client(
+                's3', endpoint_url=endpoint_url,
+                config=Config(max_pool_connections=max_pool_connections),
+                **client_kwargs)
+        self.client = client
+        self.bucket = bucket
+        self.multipart_chunk_size = multipart_chunk_size
+        self.copy_part_size = copy_part_size
+
+    def _container_prefix(self, container_key):
+        return container_key + '/'
+
+    def _object_key(self, container_key, object_key):
+        return self._container_prefix(container_key) + object_key
+
+    def _call(self, method, **kwargs):
+        """
+        Call the client for the bucket of the store.
+
+        :raises augeias.stores.error.NotFoundException: When the client
+            reports that the key does not exist.
+        """
+        try:
+            return getattr(self.client, method)(Bucket=self.bucket, **kwargs)
+        except Exception as e:
+            if _is_not_found(e):
+                raise NotFoundException
+            raise
+
+    def _get(self, key, **kwargs):
+        return self._call('get_object', Key=key, **kwargs)
+
+    def _head(self, key):
+        return self._call('head_object', Key=key)
+
+    def _check_container(self, container_key):
+        self._head(self._container_prefix(container_key))
+
+    def _iter_keys(self, prefix, delimiter=None):
+        """
+        Iterate over the keys with a prefix, a page of keys at a time. With a
+        `delimiter`, the common prefixes are produced instead.
+        """
+        kwargs = {'Prefix': prefix}
+        if delimiter is not None:
+            kwargs['Delimiter'] = delimiter
+        while True:
+            page = self._call('list_objects_v2', **kwargs)
+            if delimiter is not None:
+                for common_prefix in page.get('CommonPrefixes', []):
+                    yield common_prefix['Prefix']
+            else:
+                for content in page.get('Contents', []):
+                    yield content['Key']
+            if not page.get('IsTruncated'):
+                return
+            kwargs['ContinuationToken'] = page['NextContinuationToken']
 
-    def __init__(self):
-        pass
+    def _upload(self, container_key, object_key, object_data):
+        """
+        Upload an object with a single request, or in parts when it is
+        larger than a part.
+        """
+        _validate_data(object_data)
+        self._check_container(container_key)
+        key = self._object_key(container_key, object_key)
+        if not hasattr(object_data, 'read'):
+            object_data = BytesIO(object_data)
+        read_chunk = functools.partial(_read_full, object_data, self.multipart_chunk_size)
+        first_chunk = read_chunk()
+        mime = _sniff_mime(first_chunk[:MIME_SNIFF_SIZE])
+        second_chunk = read_chunk()
+        if not second_chunk:
+            self._call('put_object', Key=key, Body=first_chunk, ContentType=mime)
+            return
+        upload_id = self._call('create_multipart_upload', Key=key,
+                               ContentType=mime)['UploadId']
+        try:
+            parts = []
+            chunks = itertools.chain([first_chunk, second_chunk], iter(read_chunk, b''))
+            for part_number, chunk in enumerate(chunks, 1):
+                part = self._call('upload_part', Key=key, UploadId=upload_id,
+                                  PartNumber=part_number, Body=chunk)
+                parts.append({'PartNumber': part_number, 'ETag': part['ETag']})
+            self._call('complete_multipart_upload', Key=key, UploadId=upload_id,
+                       MultipartUpload={'Parts': parts})
+        except BaseException:
+            self._abort_multipart_upload(key, upload_id)
+            raise
+
+    def _abort_multipart_upload(self, key, upload_id):
+        """
+        Abort a multipart upload that failed. An error while aborting is
+        logged, so it does not hide the error the upload failed with.
+        """
+        try:
+            self._call('abort_multipart_upload', Key=key, UploadId=upload_id)
+        except Exception:
+            log.warning('Could not abort multipart upload %s of %s', upload_id, key,
+                        exc_info=True)
+
+    def create_object(self, container_key, object_key, object_data):
+        """
+        Save a new object in the data store.
+
+        :param str container_key: Key of the container to create an object in.
+        :param str object_key: Key of the object to create.
+        :param object_data: The data for the object to create, as bytes or a
+            binary file-like object.
+        :raises augeias.stores.error.NotFoundException: When the container could not be found.
+        """
+        self._upload(container_key, object_key, object_data)
+
+    def update_object(self, container_key, object_key, object_data):
+        """
+        Update an object in the data store.
+
+        :param str container_key: Key of the container that the object lives in.
+        :param str object_key: Key of the object to update.
+        :param object_data: New data for the object, as bytes or a binary
+            file-like object.
+        :raises augeias.stores.error.NotFoundException: When the container could not be found.
+        """
+        self._upload(container_key, object_key, object_data)
+
+    def copy_object(self, source_store, source_container_key, source_object_key,
+                    container_key, object_key):
+        """
+        Copy an object, possibly from another store, to this store. An
+        existing object is replaced.
+
+        Objects in the same object storage are copied by the object storage
+        itself, in parts when they are larger than `copy_part_size`. Objects
+        of other stores are streamed.
+
+        :param IStore source_store: Store the object to copy lives in.
+        :param str source_container_key: Key of the container of the object to copy.
+        :param str source_object_key: Key of the object to copy.
+        :param str container_key: Key of the container to copy the object to.
+        :param str object_key: Key of the copy.
+        :raises augeias.stores.error.NotFoundException: When the source object or one of the containers could not be found.
+        """
+        if not isinstance(source_store, CephStore) or source_store.client is not self.client:
+            return super().copy_object(
+                source_store, source_container_key, source_object_key,
+                container_key, object_key)
+        source_key = source_store._object_key(source_container_key, source_object_key)
+        source = source_store._head(source_key)
+        self._check_container(container_key)
+        key = self._object_key(container_key, object_key)
+        copy_source = {'Bucket': source_store.bucket, 'Key': source_key}
+        size = source['ContentLength']
+        if size <= self.copy_part_size:
+            self._call('copy_object', Key=key, CopySource=copy_source)
+            return
+        upload_id = self._call(
+            'create_multipart_upload', Key=key,
+            ContentType=source.get('ContentType') or 'application/octet-stream')['UploadId']
+        try:
+            parts = []
+            for part_number, start in enumerate(range(0, size, self.copy_part_size), 1):
+                stop = min(start + self.copy_part_size, size)
+                part = self._call('upload_part_copy', Key=key, UploadId=upload_id,
+                                  PartNumber=part_number, CopySource=copy_source,
+                                  CopySourceRange=f'bytes={start}-{stop - 1}')
+                parts.append({'PartNumber': part_number,
+                              'ETag': part['CopyPartResult']['ETag']})
+            self._call('complete_multipart_upload', Key=key, UploadId=upload_id,
+                       MultipartUpload={'Parts': parts})
+        except BaseException:
+            self._abort_multipart_upload(key, upload_id)
+            raise
+
+    def delete_object(self, container_key, object_key):
+        """
+        Delete an object from the data store.
+
+        :param str container_key: Key of the container that the object lives in.
+        :param str object_key: Key of the object to delete.
+        :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
+        """
+        key = self._object_key(container_key, object_key)
+        self._head(key)
+        self._call('delete_object', Key=key)
 
     def get_object(self, container_key, object_key):
-        pass
+        """
+        Retrieve an object from the data store.
+
+        :param str container_key: Key of the container that the object lives in.
+        :param str object_key: Key of the object to retrieve.
+        :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
+        """
+        body = self._get(self._object_key(container_key, object_key))['Body']
+        try:
+            return body.read()
+        finally:
+            body.close()
+
+    def open_object(self, container_key, object_key):
+        """
+        Open an object in the data store for reading.
+
+        The object is streamed while it is read. Seeking makes the next read
+        request the object from the new position on.
+
+        :param str container_key: Key of the container that the object lives in.
+        :param str object_key: Key of the object to open.
+        :returns: A seekable binary file-like object. The caller must close it.
+        :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
+        """
+        return self.open_object_handle(container_key, object_key).file
+
+    def open_object_handle(self, container_key, object_key):
+        """
+        Open an object in the data store for reading, together with its
+        metadata, with a single request.
+
+        :param str container_key: Key of the container that the object lives in.
+        :param str object_key: Key of the object to open.
+        :returns: The opened object. The caller must close it.
+        :rtype: augeias.stores.StoreInterface.ObjectHandle
+        :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
+        """
+        key = self._object_key(container_key, object_key)
+        response = self._get(key)
+        size = response['ContentLength']
+        reader = io.BufferedReader(_ObjectReader(self, key, size, response['Body']))
+        return ObjectHandle(reader, size, response['LastModified'].timestamp(),
+                            response.get('ContentType') or 'application/octet-stream')
 
     def get_object_info(self, container_key, object_key):
-        pass
+        """
+        Retrieve object info (mimetype, size, time last modification) from the data store.
 
-    def create_object(self, container_key, object_key, object_data):
-        pass
+        :param str container_key: Key of the container that the object lives in.
+        :param str object_key: Key of the object to retrieve.
+        :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
+        """
+        response = self._head(self._object_key(container_key, object_key))
+        return {
+            'time_last_modification': datetime.datetime.fromtimestamp(
+                response['LastModified'].timestamp()).isoformat(),
+            'size': response['ContentLength'],
+            'mime': response.get('ContentType') or 'application/octet-stream'
+        }
+
+    def stat_object(self, container_key, object_key):
+        """
+        Retrieve the size and time of last modification of an object.
+
+        :param str container_key: Key of the container that the object lives in.
+        :param str object_key: Key of the object to retrieve.
+        :returns: A dict with the `size` in bytes and the `mtime` as a POSIX
+            timestamp.
+        :rtype: dict
+        :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
+        """
+        response = self._head(self._object_key(container_key, object_key))
+        return {'size': response['ContentLength'],
+                'mtime': response['LastModified'].timestamp()}
 
     def list_object_keys_for_container(self, container_key):
-        pass
+        """
+        List all object keys for a container in the data store.
 
-    def delete_object(self, container_key, object_key):
-        pass
+        :param str container_key: Key of the container to list the objects for.
+        :returns: A list of object keys.
+        :rtype: list
+        :raises augeias.stores.error.NotFoundException: When the container could not be found.
+        """
+        return list(self.iter_object_keys_for_container(container_key))
 
-    def update_object(self, container_key, object_key, object_data):
-        pass
+    def iter_object_keys_for_container(self, container_key):
+        """
+        Iterate over the object keys of a container, a page of keys at a
+        time.
+
+        :param str container_key: Key of the container to list the objects for.
+        :returns: An iterator of object keys.
+        :raises augeias.stores.error.NotFoundException: When the container could not be found.
+        """
+        self._check_container(container_key)
+        prefix = self._container_prefix(container_key)
+        return (key[len(prefix):] for key in self._iter_keys(prefix)
+                if key != prefix and '/' not in key[len(prefix):])
+
+    def list_container_keys(self):
+        """
+        List the keys of all containers in the data store.
+
+        :returns: A list of container keys.
+        :rtype: list
+        """
+        return [prefix[:-1] for prefix in self._iter_keys('', delimiter='/')]
 
     def get_container_data(self, container_key, translations=None):
-        pass
+        """
+        Find a container and return a zip file of the requested objects.
+        If translations exist, only the files within translations.keys() will be provided
+
+        :param container_key: Key of the container which must be retrieved.
+        :param translations: Dict of object IDs and file names to use for them.
+        :return: a zip file containing all files of the container.
+        """
+        in_memory_file = BytesIO()
+        for chunk in self.iter_container_data(container_key, translations):
+            in_memory_file.write(chunk)
+        in_memory_file.seek(0)
+        return in_memory_file
+
+    def iter_container_data(self, container_key, translations=None):
+        """
+        Find a container and stream a zip file of the requested objects.
+        If translations exist, only the files within translations.keys() will be provided
+
+        :param container_key: Key of the container which must be retrieved.
+        :param translations: Dict of object IDs and file names to use for them.
+        :return: an iterator of byte strings that make up the zip file.
+        :raises augeias.stores.error.NotFoundException: When the container or
+            one of the requested objects could not be found.
+        """
+        translations = translations or {}
+        object_list = list(translations) if translations else \
+            self.list_object_keys_for_container(container_key)
+        members = []
+        for object_key in object_list:
+            object_stat = self.stat_object(container_key, object_key)
+            members.append(ZipMember(
+                name=translations.get(object_key, object_key),
+                size=object_stat['size'],
+                mtime=object_stat['mtime'],
+                open=functools.partial(self.open_object, container_key, object_key)
+            ))
+        return stream_zip(members)
 
     def create_container(self, container_key):
-        pass
+        """
+        Create a new container in the data store.
+
+        :param str container_key: Key of the container to create.
+        """
+        self._call('put_object', Key=self._container_prefix(container_key), Body=b'')
 
     def delete_container(self, container_key):
-        pass
+        """
+        Delete a container and all it's objects in the data store.
+
+        :param str container_key: Key of the container to delete.
+        :raises augeias.stores.error.NotFoundException: When the container could not be found.
+        """
+        self._check_container(container_key)
+        prefix = self._container_prefix(container_key)
+        batch = []
+        for key in self._iter_keys(prefix):
+            batch.append({'Key': key})
+            if len(batch) == DELETE_BATCH_SIZE:
+                self._call('delete_objects', Delete={'Objects': batch, 'Quiet': True})
+                batch = []
+        if batch:
+            self._call('delete_objects', Delete={'Objects': batch, 'Quiet': True})
+
+
+def _read_full(f, size):
+    """
+    Read `size` bytes from a file-like object, or less at its end.
+    """
+    chunks = []
+    while size > 0:
+        chunk = f.read(size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
@@ -0,0 +1,489 @@
+"""
+This module provides a store that compresses the objects of another store.
+
+Objects can be compressed with `gzip`, or with `zstd` when `zstandard` is
+installed::
+
+    pip install augeias[zstd]
+"""
+import collections
+import functools
+import gzip
+import io
+import struct
+import tempfile
+import zlib
+from io import BytesIO
+
+from augeias.stores.PairTreeFileSystemStore import MIME_SNIFF_SIZE
+from augeias.stores.PairTreeFileSystemStore import _sniff_mime
+from augeias.stores.StoreDecorator import StoreDecorator
+from augeias.stores.StoreInterface import CHUNK_SIZE
+from augeias.stores.StoreInterface import IStore
+from augeias.stores.StoreInterface import ObjectHandle
+from augeias.zipstream import ZipMember
+from augeias.zipstream import stream_zip
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+#: Start of an object that is kept in an envelope by a :class:`CompressingStore`.
+MAGIC = b'\x89AUGZ\r\n\x1a'
+
+#: Header of an envelope: the magic, the id of the codec, the size of the
+#: original data and the length of its mimetype, which follows the header.
+_HEADER = struct.Struct('>8sBQH')
+
+#: Number of bytes that are compressed to find out whether an object
+#: compresses well.
+SAMPLE_SIZE = 64 * 1024
+
+#: Compressed objects are spooled in memory up to this size before they are
+#: written to the wrapped store, larger objects are spooled to disk.
+SPOOL_SIZE = 1024 * 1024
+
+#: Mimetypes of data that is compressed already.
+COMPRESSED_MIMES = frozenset([
+    'application/epub+zip',
+    'application/gzip',
+    'application/java-archive',
+    'application/pdf',
+    'application/vnd.rar',
+    'application/x-7z-compressed',
+    'application/x-bzip2',
+    'application/x-gzip',
+    'application/x-rar',
+    'application/x-xz',
+    'application/zip',
+    'application/zstd',
+    'image/avif',
+    'image/gif',
+    'image/heic',
+    'image/jp2',
+    'image/jpeg',
+    'image/png',
+    'image/webp',
+])
+
+#: Prefixes of mimetypes of data that is compressed already.
+COMPRESSED_MIME_PREFIXES = (
+    'audio/',
+    'video/',
+    'application/vnd.oasis.opendocument.',
+    'application/vnd.openxmlformats-officedocument.',
+)
+
+_Codec = collections.namedtuple('_Codec', ['id', 'name', 'compressobj', 'open_reader'])
+
+
+def _gzip_compressobj(level):
+    return zlib.compressobj(6 if level is None else level, zlib.DEFLATED, 31)
+
+
+def _zstd_compressobj(level):
+    return zstandard.ZstdCompressor(level=3 if level is None else level).compressobj()
+
+
+def _zstd_reader(f):
+    if zstandard is None:  # pragma: no cover
+        raise ImportError('Reading zstd objects needs zstandard: pip install augeias[zstd]')
+    return zstandard.ZstdDecompressor().stream_reader(f, closefd=False)
+
+
+IDENTITY = _Codec(0, 'identity', None, None)
+
+#: The codecs objects can be compressed with, by content coding.
+CODECS = {
+    'gzip': _Codec(1, 'gzip', _gzip_compressobj,
+                   lambda f: gzip.GzipFile(fileobj=f, mode='rb')),
+    'zstd': _Codec(2, 'zstd', _zstd_compressobj, _zstd_reader),
+}
+
+_CODECS_BY_ID = {codec.id: codec for codec in [IDENTITY, *CODECS.values()]}
+
+
+class CompressingStore(StoreDecorator):
+    """
+    Compresses objects before they are written to another store, when that
+    is worthwhile.
+
+    Objects whose mimetype is a compressed format, and objects of which the
+    first :data:`SAMPLE_SIZE` bytes do not shrink to `max_ratio` of their
+    size, are written unchanged. Other objects are written in an envelope
+    that holds their codec, size and mimetype, followed by the compressed
+    data. Objects that were written without this store keep working.
+
+    Objects are decoded while they are read. With
+    :meth:`open_encoded_object_handle` the compressed data is handed out as
+    it is stored, so it can be sent with a `Content-Encoding`.
+
+    Resumable uploads are received unchanged and compressed while they are
+    committed, so the wrapped store must support `encode` in
+    :meth:`~augeias.stores.StoreInterface.IStore.commit_upload`.
+
+    :param IStore store: The store to write the objects to.
+    :param str encoding: The codec to compress with, `gzip` or `zstd`.
+    :param int level: The compression level, the default of the codec when
+        it is not given.
+    :param int min_size: Objects smaller than this are not compressed.
+    :param float max_ratio: Objects are only compressed when their sample
+        shrinks to this part of its size.
+    """
+
+    transparent = False
+
+    #: The representation of an object depends on `Accept-Encoding`.
+    negotiates_encoding = True
+
+    def __init__(self, store, encoding='gzip', level=None, min_size=1024,
+                 max_ratio=0.9):
+        super().__init__(store)
+        if encoding not in CODECS:
+            raise ValueError(f'Unknown encoding {encoding}')
+        if encoding == 'zstd' and zstandard is None:  # pragma: no cover
+            raise ImportError('The zstd encoding needs zstandard: pip install augeias[zstd]')
+        self.codec = CODECS[encoding]
+        self.level = level
+        self.min_size = min_size
+        self.max_ratio = max_ratio
+
+    def _choose_codec(self, head, mime):
+        """
+        :return: The codec to write an object with, given its first bytes
+            and its mimetype, or `None` to write it unchanged.
+        """
+        if len(head) >= self.min_size and not _is_compressed(mime):
+            sample = head[:SAMPLE_SIZE]
+            compressor = self.codec.compressobj(self.level)
+            compressed_size = len(compressor.compress(sample)) + len(compressor.flush())
+            if compressed_size <= len(sample) * self.max_ratio:
+                return self.codec
+        if head.startswith(MAGIC):
+            # would be mistaken for an envelope
+            return IDENTITY
+        return None
+
+    def _encode(self, object_data):
+        """
+        :return: A binary file-like object with the data to write to the
+            wrapped store. The caller must close it.
+        """
+        if not hasattr(object_data, 'read'):
+            object_data = BytesIO(object_data)
+        head = _read_head(object_data, MIME_SNIFF_SIZE)
+        mime = _sniff_mime(head)
+        codec = self._choose_codec(head, mime)
+        if codec is None:
+            return _PrefixedReader(head, object_data)
+        return self._envelope(codec, mime, head, object_data)
+
+    def _encode_upload(self, upload):
+        """
+        :return: The data to write for a committed upload, or `None` when it
+            is written unchanged.
+        """
+        head = _read_head(upload, MIME_SNIFF_SIZE)
+        mime = _sniff_mime(head)
+        codec = self._choose_codec(head, mime)
+        if codec is None:
+            return None
+        return self._envelope(codec, mime, head, upload)
+
+    def _envelope(self, codec, mime, head, object_data):
+        """
+        :return: A spooled file with the envelope and the encoded data, of
+            which `head` has already been read from `object_data`.
+        """
+        mime = mime.encode('ascii')
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        try:
+            spool.write(_HEADER.pack(MAGIC, codec.id, 0, len(mime)) + mime)
+            compressor = codec.compressobj(self.level) if codec.compressobj else None
+            size = 0
+            chunk = head
+            while chunk:
+                size += len(chunk)
+                spool.write(compressor.compress(chunk) if compressor else chunk)
+                chunk = object_data.read(CHUNK_SIZE)
+            if compressor:
+                spool.write(compressor.flush())
+            spool.seek(0)
+            spool.write(_HEADER.pack(MAGIC, codec.id, size, len(mime)))
+            spool.seek(0)
+        except BaseException:
+            spool.close()
+            raise
+        return spool
+
+    def _open_envelope(self, container_key, object_key):
+        """
+        Open an object of the wrapped store and read its envelope.
+
+        :return: The opened object and the envelope as returned by
+            :func:`_read_envelope`, or `None` when the object is not in an
+            envelope.
+        """
+        handle = self.store.open_object_handle(container_key, object_key)
+        try:
+            envelope = _read_envelope(handle.file)
+            if envelope is None:
+                handle.file.seek(0)
+        except BaseException:
+            handle.close()
+            raise
+        return handle, envelope
+
+    def create_object(self, container_key, object_key, object_data):
+        with self._encode(object_data) as data:
+            return self.store.create_object(container_key, object_key, data)
+
+    def update_object(self, container_key, object_key, object_data):
+        with self._encode(object_data) as data:
+            return self.store.update_object(container_key, object_key, data)
+
+    def copy_object(self, source_store, source_container_key, source_object_key,
+                    container_key, object_key):
+        while isinstance(source_store, StoreDecorator) and source_store.transparent:
+            source_store = source_store.store
+        if isinstance(source_store, CompressingStore):
+            # envelopes describe themselves, they are copied as they are
+            return self.store.copy_object(
+                source_store.store, source_container_key, source_object_key,
+                container_key, object_key)
+        return IStore.copy_object(
+            self, source_store, source_container_key, source_object_key,
+            container_key, object_key)
+
+    def commit_upload(self, container_key, object_key, upload_id, encode=None):
+        if encode is not None:
+            raise ValueError('An upload to a CompressingStore can not be encoded by another store')
+        return self.store.commit_upload(container_key, object_key, upload_id, self._encode_upload)
+
+    def get_object(self, container_key, object_key):
+        with self.open_object_handle(container_key, object_key) as handle:
+            return handle.read()
+
+    def open_object(self, container_key, object_key):
+        return self.open_object_handle(container_key, object_key).file
+
+    def open_object_handle(self, container_key, object_key):
+        return self.open_encoded_object_handle(container_key, object_key, ())
+
+    def open_encoded_object_handle(self, container_key, object_key, encodings):
+        handle, envelope = self._open_envelope(container_key, object_key)
+        if envelope is None:
+            return handle
+        codec, size, mime, offset = envelope
+        encoded_size = handle.size - offset
+        if codec is IDENTITY:
+            fileobj = _Window(handle.file, offset, encoded_size)
+            return ObjectHandle(fileobj, size, handle.mtime, mime)
+        if codec.name in encodings:
+            fileobj = _Window(handle.file, offset, encoded_size)
+            return ObjectHandle(fileobj, encoded_size, handle.mtime, mime,
+                                encoding=codec.name, negotiated=True)
+        fileobj = _DecodingReader(handle.file, offset, size, codec.open_reader)
+        return ObjectHandle(fileobj, size, handle.mtime, mime, negotiated=True)
+
+    def open_archive_member(self, container_key, object_key, file_name):
+        return IStore.open_archive_member(self, container_key, object_key, file_name)
+
+    def get_object_info(self, container_key, object_key):
+        handle, envelope = self._open_envelope(container_key, object_key)
+        with handle:
+            info = handle.info
+        if envelope is not None:
+            codec, size, mime, offset = envelope
+            info.update(size=size, mime=mime)
+        return info
+
+    def stat_object(self, container_key, object_key):
+        handle, envelope = self._open_envelope(container_key, object_key)
+        with handle:
+            size = envelope[1] if envelope is not None else handle.size
+            return {'size': size, 'mtime': handle.mtime}
+
+    def list_object_info_for_container(self, container_key):
+        return IStore.list_object_info_for_container(self, container_key)
+
+    def get_container_data(self, container_key, translations=None):
+        in_memory_file = BytesIO()
+        for chunk in self.iter_container_data(container_key, translations):
+            in_memory_file.write(chunk)
+        in_memory_file.seek(0)
+        return in_memory_file
+
+    def iter_container_data(self, container_key, translations=None):
+        translations = translations or {}
+        object_list = list(translations) if translations else \
+            self.list_object_keys_for_container(container_key)
+        members = []
+        for object_key in object_list:
+            object_stat = self.stat_object(container_key, object_key)
+            members.append(ZipMember(
+                name=translations.get(object_key, object_key),
+                size=object_stat['size'],
+                mtime=object_stat['mtime'],
+                open=functools.partial(self.open_object, container_key, object_key)
+            ))
+        return stream_zip(members)
+
+
+def _is_compressed(mime):
+    return mime in COMPRESSED_MIMES or mime.startswith(COMPRESSED_MIME_PREFIXES)
+
+
+def _read_head(f, size):
+    head = bytearray()
+    while len(head) < size:
+        chunk = f.read(size - len(head))
+        if not chunk:
+            break
+        head += chunk
+    return bytes(head)
+
+
+def _read_envelope(f):
+    """
+    Read the header of an envelope from the start of an object.
+
+    :return: The codec, the size and the mimetype of the original data and
+        the offset of the encoded data, or `None` when the object is not in
+        an envelope.
+    """
+    header = _read_head(f, _HEADER.size)
+    if len(header) < _HEADER.size or not header.startswith(MAGIC):
+        return None
+    magic, codec_id, size, mime_length = _HEADER.unpack(header)
+    mime = _read_head(f, mime_length).decode('ascii')
+    return _CODECS_BY_ID[codec_id], size, mime, _HEADER.size + mime_length
+
+
+class _PrefixedReader(io.RawIOBase):
+    """
+    A file-like object that reads bytes that were read from a file already,
+    followed by the rest of the file.
+    """
+
+    def __init__(self, prefix, fileobj):
+        self._prefix = memoryview(prefix)
+        self._file = fileobj
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self._prefix:
+            n = min(len(b), len(self._prefix))
+            b[:n] = self._prefix[:n]
+            self._prefix = self._prefix[n:]
+            return n
+        data = self._file.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+
+class _Window(io.RawIOBase):
+    """
+    A seekable file-like object for the part of a file that starts at
+    `offset`. The file must be positioned at `offset`.
+    """
+
+    def __init__(self, fileobj, offset, size):
+        self._file = fileobj
+        self._offset = offset
+        self._size = size
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._size
+        if offset < 0:
+            raise ValueError('negative seek position %d' % offset)
+        if offset != self._position:
+            self._file.seek(self._offset + offset)
+            self._position = offset
+        return self._position
+
+    def readinto(self, b):
+        data = self._file.read(max(min(len(b), self._size - self._position), 0))
+        b[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+        super().close()
+
+
+class _DecodingReader(io.RawIOBase):
+    """
+    A seekable file-like object that decodes the part of a file that starts
+    at `offset`. The file must be positioned at `offset`.
+
+    Seeking forward decodes the data in between, seeking backward decodes
+    the data again from the start.
+    """
+
+    def __init__(self, fileobj, offset, size, open_reader):
+        self._file = fileobj
+        self._offset = offset
+        self._size = size
+        self._open_reader = open_reader
+        self._reader = open_reader(fileobj)
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._size
+        if offset < 0:
+            raise ValueError('negative seek position %d' % offset)
+        if offset < self._position:
+            self._reader.close()
+            self._file.seek(self._offset)
+            self._reader = self._open_reader(self._file)
+            self._position = 0
+        while self._position < offset:
+            skipped = self._reader.read(min(CHUNK_SIZE, offset - self._position))
+            if not skipped:
+                break
+            self._position += len(skipped)
+        self._position = offset
+        return self._position
+
+    def readinto(self, b):
+        data = self._reader.read(len(b))
+        b[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self._reader.close()
+            self._file.close()
+        super().close()
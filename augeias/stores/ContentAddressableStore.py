@@ -0,0 +1,537 @@
+"""
+This module provides a filesystem based store that keeps every distinct
+content only once.
+"""
+import contextlib
+import datetime
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from io import BytesIO
+from urllib.parse import quote
+from urllib.parse import unquote
+
+from augeias.stores.PairTreeFileSystemStore import CHUNK_SIZE
+from augeias.stores.PairTreeFileSystemStore import MIME_SNIFF_SIZE
+from augeias.stores.PairTreeFileSystemStore import _fsync_dir
+from augeias.stores.PairTreeFileSystemStore import _remove_if_exists
+from augeias.stores.PairTreeFileSystemStore import _sniff_mime
+from augeias.stores.PairTreeFileSystemStore import _validate_data
+from augeias.stores.StoreInterface import IStore
+from augeias.stores.StoreInterface import ObjectHandle
+from augeias.stores.error import NotFoundException
+from augeias.zipstream import ZipMember
+from augeias.zipstream import stream_zip
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+#: Number of seconds after which a temporary file is considered abandoned.
+TEMP_FILE_MAX_AGE = 24 * 60 * 60
+
+
+def _quote_name(key):
+    """Quote a key as a file name, a key like `..` included."""
+    name = quote(key, safe='')
+    return '%2E' + name[1:] if name.startswith('.') else name
+
+
+class ContentAddressableStore(IStore):
+    """
+    Provides a filesystem based store that deduplicates objects.
+
+    The data of an object is stored once per distinct content, as a blob
+    named after its SHA-256 digest. Every container has a manifest with an
+    entry per object key that points to a digest, and every blob keeps count
+    of the manifest entries that refer to it. A blob is removed as soon as
+    nothing refers to it anymore, so storing or copying an object that is
+    already in the store only writes metadata.
+
+    Layout of `store_dir`::
+
+        blobs/ab/cd/abcd...             the data of a blob
+        blobs/ab/cd/abcd....refs        the number of references to it
+        containers/<key>/               the manifest of a container
+        containers/<key>/<object>.json  the entry of an object
+        tmp/                            data that is being written
+
+    Every entry is a file of its own, so reading or changing an object does
+    not depend on the number of objects in its container. Changes to entries
+    and reference counts are serialized with a lock file, so several
+    processes can share a store.
+
+    :param str store_dir: Directory to keep the store in.
+    :param bool fsync: Flush written blobs to disk before they are used.
+    """
+
+    def __init__(self, store_dir, fsync=False):
+        self.store_dir = store_dir
+        self.fsync = fsync
+        self._blob_dir = os.path.join(store_dir, 'blobs')
+        self._container_dir = os.path.join(store_dir, 'containers')
+        self._temp_dir = os.path.join(store_dir, 'tmp')
+        for path in (self._blob_dir, self._container_dir, self._temp_dir):
+            os.makedirs(path, exist_ok=True)
+        self._lock_path = os.path.join(store_dir, 'lock')
+        self._thread_lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def _lock(self):
+        with self._thread_lock, open(self._lock_path, 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            yield
+
+    def _blob_path(self, digest):
+        return os.path.join(self._blob_dir, digest[:2], digest[2:4], digest)
+
+    def _refs_path(self, digest):
+        return self._blob_path(digest) + '.refs'
+
+    def _manifest_path(self, container_key):
+        return os.path.join(self._container_dir, _quote_name(container_key))
+
+    def _entry_path(self, container_key, object_key):
+        return os.path.join(self._manifest_path(container_key),
+                            _quote_name(object_key) + '.json')
+
+    def _write_json(self, path, data):
+        temp_path = os.path.join(self._temp_dir, uuid.uuid4().hex)
+        with open(temp_path, 'x') as f:
+            json.dump(data, f)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_path, path)
+
+    def _check_container(self, container_key):
+        if not os.path.isdir(self._manifest_path(container_key)):
+            raise NotFoundException
+
+    def _get_entry(self, container_key, object_key):
+        try:
+            with open(self._entry_path(container_key, object_key)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise NotFoundException
+
+    def _iter_entries(self, container_key):
+        """
+        :returns: An iterator of tuples of the object key and the entry of
+            every object in a container.
+        :raises augeias.stores.error.NotFoundException: When the container could not be found.
+        """
+        try:
+            entries = os.scandir(self._manifest_path(container_key))
+        except FileNotFoundError:
+            raise NotFoundException
+        return self._read_entries(entries)
+
+    @staticmethod
+    def _read_entries(entries):
+        with entries:
+            for dir_entry in entries:
+                if not dir_entry.name.endswith('.json'):
+                    continue
+                try:
+                    with open(dir_entry.path) as f:
+                        entry = json.load(f)
+                except FileNotFoundError:
+                    # deleted while the container was listed
+                    continue
+                yield unquote(dir_entry.name[:-len('.json')]), entry
+
+    def _read_refs(self, digest):
+        try:
+            with open(self._refs_path(digest)) as f:
+                return int(f.read())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _add_ref(self, digest, count=1):
+        """
+        Change the number of references to a blob and remove the blob when
+        none are left. Call this while holding the lock.
+        """
+        refs = self._read_refs(digest) + count
+        if refs > 0:
+            temp_path = os.path.join(self._temp_dir, uuid.uuid4().hex)
+            with open(temp_path, 'x') as f:
+                f.write(str(refs))
+            os.replace(temp_path, self._refs_path(digest))
+        else:
+            _remove_if_exists(self._blob_path(digest))
+            _remove_if_exists(self._refs_path(digest))
+
+    def _write_blob(self, object_data):
+        """
+        Write data to a temporary file while computing its digest and
+        detecting its MIME type.
+
+        :return: A tuple with the path of the temporary file, the digest, the
+            size and the MIME type of the data.
+        """
+        temp_path = os.path.join(self._temp_dir, uuid.uuid4().hex)
+        sha256 = hashlib.sha256()
+        try:
+            with open(temp_path, 'xb') as f:
+                if hasattr(object_data, 'read'):
+                    head = bytearray()
+                    chunk = object_data.read(CHUNK_SIZE)
+                    while chunk:
+                        if len(head) < MIME_SNIFF_SIZE:
+                            head += chunk[:MIME_SNIFF_SIZE - len(head)]
+                        sha256.update(chunk)
+                        f.write(chunk)
+                        chunk = object_data.read(CHUNK_SIZE)
+                else:
+                    head = object_data[:MIME_SNIFF_SIZE]
+                    sha256.update(object_data)
+                    f.write(object_data)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+                size = f.tell()
+        except BaseException:
+            _remove_if_exists(temp_path)
+            raise
+        return temp_path, sha256.hexdigest(), size, _sniff_mime(bytes(head))
+
+    def _set_entry(self, container_key, object_key, entry, temp_path=None):
+        """
+        Point an object key to a blob, moving `temp_path` in place as the
+        blob when it is not stored yet.
+        """
+        digest = entry['digest']
+        entry_path = self._entry_path(container_key, object_key)
+        with self._lock():
+            self._check_container(container_key)
+            if temp_path is not None:
+                blob_path = self._blob_path(digest)
+                if os.path.exists(blob_path):
+                    os.remove(temp_path)
+                else:
+                    os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                    os.replace(temp_path, blob_path)
+                    if self.fsync:
+                        _fsync_dir(os.path.dirname(blob_path))
+            elif not os.path.exists(self._blob_path(digest)):
+                # the object that was copied has been deleted meanwhile
+                raise NotFoundException
+            self._add_ref(digest)
+            try:
+                old_entry = self._get_entry(container_key, object_key)
+            except NotFoundException:
+                old_entry = None
+            self._write_json(entry_path, entry)
+            if old_entry is not None:
+                self._add_ref(old_entry['digest'], -1)
+
+    def _store_object(self, container_key, object_key, object_data):
+        _validate_data(object_data)
+        self._check_container(container_key)
+        temp_path, digest, size, mime = self._write_blob(object_data)
+        try:
+            self._set_entry(container_key, object_key, {
+                'digest': digest,
+                'size': size,
+                'mime': mime,
+                'mtime': time.time()
+            }, temp_path)
+        finally:
+            _remove_if_exists(temp_path)
+
+    def get_digest(self, container_key, object_key):
+        """
+        Retrieve the SHA-256 digest of an object.
+
+        :param str container_key: Key of the container that the object lives in.
+        :param str object_key: Key of the object.
+        :returns: The hexadecimal digest.
+        :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
+        """
+        return self._get_entry(container_key, object_key)['digest']
+
+    def create_object(self, container_key, object_key, object_data):
+        """
+        Save a new object in the data store
+
+        :param str container_key: Key of the container to create an object in.
+        :param str object_key: Key of the object to create.
+        :param object_data: The data for the object to create, as bytes or a
+            binary file-like object.
+        :raises augeias.stores.error.NotFoundException: When the container could not be found.
+        """
+        self._store_object(container_key, object_key, object_data)
+
+    def update_object(self, container_key, object_key, object_data):
+        """
+        Update an object in the data store.
+
+        :param str container_key: Key of the container that the object lives in.
+        :param str object_key: Key of the object to update.
+        :param object_data: New data for the object, as bytes or a binary
+            file-like object.
+        :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
+        """
+        self._store_object(container_key, object_key, object_data)
+
+    def copy_object(self, source_store, source_container_key, source_object_key,
+                    container_key, object_key):
+        """
+        Copy an object, possibly from another store, to this store. An
+        existing object is replaced.
+
+        Within the same store only the entry and the reference count are
+        written. Objects from other stores are streamed.
+
+        :param IStore source_store: Store the object to copy lives in.
+        :param str source_container_key: Key of the container of the object to copy.
+        :param str source_object_key: Key of the object to copy.
+        :param str container_key: Key of the container to copy the object to.
+        :param str object_key: Key of the copy.
+        :raises augeias.stores.error.NotFoundException: When the source object or one of the containers could not be found.
+        """
+        if not isinstance(source_store, ContentAddressableStore) or \
+                os.path.realpath(source_store.store_dir) != os.path.realpath(self.store_dir):
+            return super().copy_object(
+                source_store, source_container_key, source_object_key,
+                container_key, object_key)
+        entry = dict(source_store._get_entry(source_container_key, source_object_key))
+        entry['mtime'] = time.time()
+        self._set_entry(container_key, object_key, entry)
+
+    def delete_object(self, container_key, object_key):
+        """
+        Delete an object from the data store. Its data is removed when no
+        other object has the same content.
+
+        :param str container_key: Key of the container that the object lives in.
+        :param str object_key: Key of the object to delete.
+        :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
+        """
+        with self._lock():
+            entry = self._get_entry(container_key, object_key)
+            os.remove(self._entry_path(container_key, object_key))
+            self._add_ref(entry['digest'], -1)
+
+    def get_object(self, container_key, object_key):
+        """
+        Retrieve an object from the data store.
+
+        :param str container_key: Key of the container that the object lives in.
+        :param str object_key: Key of the object to retrieve.
+        :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
+        """
+        with self.open_object(container_key, object_key) as f:
+            return f.read()
+
+    def open_object(self, container_key, object_key):
+        """
+        Open an object in the data store for reading.
+
+        :param str container_key: Key of the container that the object lives in.
+        :param str object_key: Key of the object to open.
+        :returns: A binary file object. The caller must close it.
+        :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
+        """
+        return self.open_object_handle(container_key, object_key).file
+
+    def open_object_handle(self, container_key, object_key):
+        """
+        Open an object in the data store for reading, together with its
+        metadata.
+
+        :param str container_key: Key of the container that the object lives in.
+        :param str object_key: Key of the object to open.
+        :returns: The opened object. The caller must close it.
+        :rtype: augeias.stores.StoreInterface.ObjectHandle
+        :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
+        """
+        entry = self._get_entry(container_key, object_key)
+        try:
+            f = open(self._blob_path(entry['digest']), 'rb')
+        except FileNotFoundError:
+            # deleted after the entry was read
+            raise NotFoundException
+        return ObjectHandle(f, entry['size'], entry['mtime'], entry['mime'])
+
+    def stat_object(self, container_key, object_key):
+        """
+        Retrieve the size and time of last modification of an object.
+
+        :param str container_key: Key of the container that the object lives in.
+        :param str object_key: Key of the object to retrieve.
+        :returns: A dict with the `size` in bytes and the `mtime` as a POSIX
+            timestamp.
+        :rtype: dict
+        :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
+        """
+        entry = self._get_entry(container_key, object_key)
+        return {'size': entry['size'], 'mtime': entry['mtime']}
+
+    def get_object_info(self, container_key, object_key):
+        """
+        Retrieve object info (mimetype, size, time last modification) from the data store.
+
+        :param str container_key: Key of the container that the object lives in.
+        :param str object_key: Key of the object to retrieve.
+        :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
+        """
+        entry = self._get_entry(container_key, object_key)
+        return {
+            'time_last_modification': datetime.datetime.fromtimestamp(entry['mtime']).isoformat(),
+            'size': entry['size'],
+            'mime': entry['mime']
+        }
+
+    def list_object_keys_for_container(self, container_key):
+        """
+        List all object keys for a container in the data store.
+
+        :param str container_key: Key of the container to list the objects for.
+        :returns: A list of container keys.
+        :rtype: lst
+        :raises augeias.stores.error.NotFoundException: When the container could not be found.
+        """
+        return [object_key for object_key, _ in self._iter_entries(container_key)]
+
+    def list_object_info_for_container(self, container_key):
+        """
+        Retrieve the object info of all objects in a container from the
+        entries of its manifest.
+
+        :param str container_key: Key of the container to list the objects for.
+        :returns: A dict with the object info for every object key.
+        :rtype: dict
+        :raises augeias.stores.error.NotFoundException: When the container could not be found.
+        """
+        return {
+            object_key: {
+                'time_last_modification': datetime.datetime.fromtimestamp(entry['mtime']).isoformat(),
+                'size': entry['size'],
+                'mime': entry['mime']
+            }
+            for object_key, entry in self._iter_entries(container_key)
+        }
+
+    def get_container_data(self, container_key, translations=None):
+        """
+        Find a container and return a zip file of the requested objects.
+        If translations exist, only the files within translations.keys() will be provided
+
+        :param container_key: Key of the container which must be retrieved.
+        :param translations: Dict of object IDs and file names to use for them.
+        :return: a zip file containing all files of the container.
+        """
+        in_memory_file = BytesIO()
+        for chunk in self.iter_container_data(container_key, translations):
+            in_memory_file.write(chunk)
+        in_memory_file.seek(0)
+        return in_memory_file
+
+    def iter_container_data(self, container_key, translations=None):
+        """
+        Find a container and stream a zip file of the requested objects.
+        If translations exist, only the files within translations.keys() will be provided
+
+        :param container_key: Key of the container which must be retrieved.
+        :param translations: Dict of object IDs and file names to use for them.
+        :return: an iterator of byte strings that make up the zip file.
+        :raises augeias.stores.error.NotFoundException: When the container or
+            one of the requested objects could not be found.
+        """
+        translations = translations or {}
+        if translations:
+            self._check_container(container_key)
+            entries = [(object_key, self._get_entry(container_key, object_key))
+                       for object_key in translations]
+        else:
+            entries = list(self._iter_entries(container_key))
+        members = []
+        for object_key, entry in entries:
+            members.append(ZipMember(
+                name=translations.get(object_key, object_key),
+                size=entry['size'],
+                mtime=entry['mtime'],
+                open=functools.partial(open, self._blob_path(entry['digest']), 'rb')
+            ))
+        return stream_zip(members)
+
+    def list_container_keys(self):
+        """
+        List the keys of all containers in the data store.
+
+        :returns: A list of container keys.
+        :rtype: list
+        """
+        with os.scandir(self._container_dir) as entries:
+            return [unquote(entry.name) for entry in entries if entry.is_dir()]
+
+    def create_container(self, container_key):
+        """
+        Create a new container in the data store.
+
+        :param str container_key: Key of the container to create.
+        """
+        with self._lock():
+            os.makedirs(self._manifest_path(container_key), exist_ok=True)
+
+    def delete_container(self, container_key):
+        """
+        Delete a container and all it's objects in the data store.
+
+        :param str container_key: Key of the container to delete.
+        :raises augeias.stores.error.NotFoundException: When the container could not be found.
+        """
+        with self._lock():
+            entries = list(self._iter_entries(container_key))
+            for object_key, _ in entries:
+                os.remove(self._entry_path(container_key, object_key))
+            os.rmdir(self._manifest_path(container_key))
+            for _, entry in entries:
+                self._add_ref(entry['digest'], -1)
+
+    def collect_garbage(self):
+        """
+        Recount the references to every blob from the manifests, and remove
+        blobs nothing refers to and leftover temporary files.
+
+        Reference counts are kept up to date while the store is used, this
+        repairs them after eg. a crash between writing a manifest and a count.
+        Temporary files are removed when they are older than
+        :data:`TEMP_FILE_MAX_AGE`.
+
+        :returns: The number of blobs that were removed.
+        :rtype: int
+        """
+        removed = 0
+        with self._lock():
+            refs = {}
+            for container_key in self.list_container_keys():
+                for _, entry in self._iter_entries(container_key):
+                    refs[entry['digest']] = refs.get(entry['digest'], 0) + 1
+            for dir_path, _, file_names in os.walk(self._blob_dir):
+                for file_name in file_names:
+                    if file_name.endswith('.refs'):
+                        if file_name[:-len('.refs')] not in refs:
+                            os.remove(os.path.join(dir_path, file_name))
+                        continue
+                    if file_name in refs:
+                        if self._read_refs(file_name) != refs[file_name]:
+                            self._add_ref(file_name, refs[file_name] - self._read_refs(file_name))
+                    else:
+                        os.remove(os.path.join(dir_path, file_name))
+                        removed += 1
+            # files that are still being written are left alone
+            max_mtime = time.time() - TEMP_FILE_MAX_AGE
+            for entry in os.scandir(self._temp_dir):
+                if entry.stat().st_mtime < max_mtime:
+                    _remove_if_exists(entry.path)
+        return removed
@@ -0,0 +1,245 @@
+"""
+This module provides a store that records how long the operations of another
+store take and how many bytes they move.
+"""
+import functools
+from io import BytesIO
+
+from augeias.archives import ArchiveMember
+from augeias.metrics import REGISTRY
+from augeias.metrics import timed
+from augeias.stores.StoreDecorator import StoreDecorator
+from augeias.stores.StoreInterface import ObjectHandle
+
+
+class InstrumentedStore(StoreDecorator):
+    """
+    Records the duration, the errors and the number of bytes read and
+    written of every operation of another store, labeled with the name of
+    its collection.
+
+    Opening an object is timed until the object is open. The bytes that are
+    read from it are counted when it is closed.
+
+    :param IStore store: The store to instrument.
+    :param str collection: Name of the collection of the store.
+    :param augeias.metrics.MetricsRegistry metrics: The registry to record
+        the metrics in.
+    """
+
+    def __init__(self, store, collection, metrics=REGISTRY):
+        super().__init__(store)
+        self.collection = collection
+        self._duration = metrics.histogram(
+            'augeias_store_operation_duration_seconds',
+            'Time spent in operations of stores.',
+            ('collection', 'operation'))
+        self._errors = metrics.counter(
+            'augeias_store_operation_errors_total',
+            'Number of operations of stores that raised an error.',
+            ('collection', 'operation', 'error'))
+        self._transferred = metrics.counter(
+            'augeias_store_bytes_total',
+            'Number of bytes read from and written to stores.',
+            ('collection', 'operation', 'direction'))
+
+    def _call(self, operation, func, *args):
+        try:
+            with timed(self._duration, collection=self.collection, operation=operation):
+                return func(*args)
+        except Exception as e:
+            self._errors.inc(collection=self.collection, operation=operation,
+                             error=type(e).__name__)
+            raise
+
+    def _count(self, operation, direction, size):
+        self._transferred.inc(size, collection=self.collection, operation=operation,
+                              direction=direction)
+
+    def _write(self, operation, func, *args):
+        """
+        Call an operation that writes the data in its last argument, as bytes
+        or a binary file-like object, and count the bytes that are written.
+        """
+        *args, data = args
+        if not hasattr(data, 'read'):
+            result = self._call(operation, func, *args, data)
+            self._count(operation, 'written', len(data))
+            return result
+        counting = _CountingReader(data)
+        try:
+            return self._call(operation, func, *args, counting)
+        finally:
+            self._count(operation, 'written', counting.bytes)
+
+    def _open(self, operation, func, *args):
+        """
+        Call an operation that opens an object, and count the bytes that are
+        read from it once it is closed.
+        """
+        f = self._call(operation, func, *args)
+        report = functools.partial(self._count, operation, 'read')
+        if isinstance(f, (ObjectHandle, ArchiveMember)):
+            f.file = _CountingReader(f.file, report)
+            return f
+        return _CountingReader(f, report)
+
+    def create_object(self, container_key, object_key, object_data):
+        return self._write('create_object', self.store.create_object,
+                           container_key, object_key, object_data)
+
+    def delete_object(self, container_key, object_key):
+        return self._call('delete_object', self.store.delete_object, container_key, object_key)
+
+    def get_object(self, container_key, object_key):
+        data = self._call('get_object', self.store.get_object, container_key, object_key)
+        self._count('get_object', 'read', len(data))
+        return data
+
+    def open_object(self, container_key, object_key):
+        return self._open('open_object', self.store.open_object, container_key, object_key)
+
+    def open_object_handle(self, container_key, object_key):
+        return self._open('open_object_handle', self.store.open_object_handle,
+                          container_key, object_key)
+
+    def open_encoded_object_handle(self, container_key, object_key, encodings):
+        return self._open('open_encoded_object_handle', self.store.open_encoded_object_handle,
+                          container_key, object_key, encodings)
+
+    def open_archive_member(self, container_key, object_key, file_name):
+        return self._open('open_archive_member', self.store.open_archive_member,
+                          container_key, object_key, file_name)
+
+    def get_object_info(self, container_key, object_key):
+        return self._call('get_object_info', self.store.get_object_info,
+                          container_key, object_key)
+
+    def stat_object(self, container_key, object_key):
+        return self._call('stat_object', self.store.stat_object, container_key, object_key)
+
+    def update_object(self, container_key, object_key, object_data):
+        return self._write('update_object', self.store.update_object,
+                           container_key, object_key, object_data)
+
+    def copy_object(self, source_store, source_container_key, source_object_key,
+                    container_key, object_key):
+        return self._call(
+            'copy_object', super().copy_object, source_store, source_container_key,
+            source_object_key, container_key, object_key)
+
+    def create_upload(self, container_key, object_key):
+        return self._call('create_upload', self.store.create_upload, container_key, object_key)
+
+    def append_upload(self, container_key, object_key, upload_id, offset, data):
+        return self._write('append_upload', self.store.append_upload,
+                           container_key, object_key, upload_id, offset, data)
+
+    def get_upload_offset(self, container_key, object_key, upload_id):
+        return self._call('get_upload_offset', self.store.get_upload_offset,
+                          container_key, object_key, upload_id)
+
+    def commit_upload(self, container_key, object_key, upload_id, encode=None):
+        return self._call('commit_upload', self.store.commit_upload,
+                          container_key, object_key, upload_id, encode)
+
+    def abort_upload(self, container_key, object_key, upload_id):
+        return self._call('abort_upload', self.store.abort_upload,
+                          container_key, object_key, upload_id)
+
+    def list_object_keys_for_container(self, container_key):
+        return self._call('list_object_keys_for_container',
+                          self.store.list_object_keys_for_container, container_key)
+
+    def iter_object_keys_for_container(self, container_key):
+        return self._call('iter_object_keys_for_container',
+                          self.store.iter_object_keys_for_container, container_key)
+
+    def list_object_info_for_container(self, container_key):
+        return self._call('list_object_info_for_container',
+                          self.store.list_object_info_for_container, container_key)
+
+    def get_container_data(self, container_key, translations=None):
+        zip_file = self._call('get_container_data', self.store.get_container_data,
+                              container_key, translations)
+        if isinstance(zip_file, BytesIO):
+            self._count('get_container_data', 'read', zip_file.getbuffer().nbytes)
+        return zip_file
+
+    def iter_container_data(self, container_key, translations=None):
+        chunks = self._call('iter_container_data', self.store.iter_container_data,
+                            container_key, translations)
+        return self._iter_counting('iter_container_data', chunks)
+
+    def _iter_counting(self, operation, chunks):
+        size = 0
+        try:
+            for chunk in chunks:
+                size += len(chunk)
+                yield chunk
+        finally:
+            self._count(operation, 'read', size)
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+
+    def list_container_keys(self):
+        return self._call('list_container_keys', self.store.list_container_keys)
+
+    def create_container(self, container_key):
+        return self._call('create_container', self.store.create_container, container_key)
+
+    def delete_container(self, container_key):
+        return self._call('delete_container', self.store.delete_container, container_key)
+
+
+class _CountingReader:
+    """
+    Passes a binary file-like object through and counts the bytes that are
+    read from it. They are reported to `report`, if given, when it is closed.
+    """
+
+    def __init__(self, fileobj, report=None):
+        self._file = fileobj
+        self._report = report
+        self.bytes = 0
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        for line in self._file:
+            self.bytes += len(line)
+            yield line
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def read(self, *args):
+        data = self._file.read(*args)
+        self.bytes += len(data)
+        return data
+
+    def read1(self, *args):
+        data = self._file.read1(*args)
+        self.bytes += len(data)
+        return data
+
+    def readinto(self, b):
+        n = self._file.readinto(b)
+        self.bytes += n or 0
+        return n
+
+    def readline(self, *args):
+        data = self._file.readline(*args)
+        self.bytes += len(data)
+        return data
+
+    def close(self):
+        if self._report is not None:
+            self._report(self.bytes)
+            self._report = None
+        self._file.close()
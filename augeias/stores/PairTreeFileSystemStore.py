@@ -2,17 +2,81 @@
 This module provide a simple filesystem based store
 """
 import datetime
+import functools
+import hashlib
+import json
 import magic
 import os
+import re
+import shutil
+import stat
+import time
+import uuid
 from io import BytesIO
 from pairtree import ObjectNotFoundException
 from pairtree import PairtreeStorageFactory
 from pairtree import PartNotFoundException
 from pairtree import id2path
-from zipfile import ZipFile
+from pairtree import path2id
+from urllib.parse import quote
+from urllib.parse import unquote
 
+from augeias.archives import CheckpointCache
+from augeias.archives import build_tar_index
+from augeias.archives import open_archive_member
+from augeias.executor import make_executor
+from augeias.metadata_index import MetadataIndex
+from augeias.metrics import MIME_DETECTION_SECONDS
+from augeias.metrics import REGISTRY
 from augeias.stores.StoreInterface import IStore
+from augeias.stores.StoreInterface import ObjectHandle
 from augeias.stores.error import NotFoundException
+from augeias.stores.error import OffsetMismatchException
+from augeias.tracing import span
+from augeias.zipstream import ZipMember
+from augeias.zipstream import stream_zip
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+CHUNK_SIZE = 64 * 1024
+
+#: Files in a container starting with this prefix are managed by the store
+#: itself and are never listed as objects.
+INTERNAL_PREFIX = '.augeias'
+
+#: Directory in a container with the metadata the store records per object.
+META_DIR = INTERNAL_PREFIX
+
+#: Directory in a container with the indexes of tar archive objects.
+ARCHIVE_INDEX_DIR = os.path.join(META_DIR, 'archives')
+
+#: ioctl request to share the data of a file with another one (Linux).
+FICLONE = 0x40049409
+
+#: Maximum number of bytes to copy with one call to :func:`os.copy_file_range`.
+COPY_FILE_RANGE_SIZE = 1024 * 1024 * 1024
+
+#: Number of bytes used to detect the MIME type of an object.
+MIME_SNIFF_SIZE = 1048576
+
+#: Ids of resumable uploads, which are part of the name of their staging file.
+UPLOAD_ID_PATTERN = re.compile('[0-9a-f]{32}')
+
+#: Prefix of the names of the staging files of resumable uploads.
+UPLOAD_PREFIX = f'{INTERNAL_PREFIX}-upload-'
+
+#: Path, relative to the store directory, of the SQLite metadata index.
+METADATA_INDEX_PATH = os.path.join(INTERNAL_PREFIX, 'metadata.sqlite')
+
+#: Directory, relative to the store directory, with a file for every container.
+CONTAINER_INDEX_DIR = os.path.join(INTERNAL_PREFIX, 'containers')
+
+#: File, relative to the store directory, that is present once the container
+#: index has been built.
+CONTAINER_INDEX_BUILT = os.path.join(INTERNAL_PREFIX, 'containers.built')
 
 
 class PairTreeFileSystemStore(IStore):
@@ -20,17 +84,209 @@ class PairTreeFileSystemStore(IStore):
     Provides a filesystem based store.
 
     Will store your digital objects on disk using a PairTree.
+
+    Objects are written to a temporary file next to their final location
+    first and moved in place when complete, so readers never see a partially
+    written object.
+
+    :param str store_dir: Directory to keep the PairTree in.
+    :param str uri_base: Prefix for the PairTree identifiers.
+    :param bool fsync: Flush written objects to disk before moving them in
+        place. Slower, but an object survives a crash once it is visible.
+    :param int gzip_checkpoint_archives: Number of gzipped tar archives to
+        keep decompression checkpoints in memory for, at most
+        :data:`~augeias.archives.MAX_CHECKPOINTS` each.
+    :param int read_ahead: Number of objects to open concurrently while a
+        container is written as a zip file. Helps when opening a file is
+        slow, eg. on network storage. The threads are shared by all
+        downloads of the store.
+    :param bool metadata_index: Keep the containers and the metadata of the
+        objects in an SQLite database as well, see :meth:`rebuild_metadata_index`.
     """
 
-    def __init__(self, store_dir, uri_base='urn:x-vioe:'):
+    #: The metadata, indexes and uploads are kept next to the objects.
+    reserved_key_prefix = INTERNAL_PREFIX
+
+    def __init__(self, store_dir, uri_base='urn:x-vioe:', fsync=False,
+                 gzip_checkpoint_archives=16, read_ahead=0, metadata_index=False):
         sf = PairtreeStorageFactory()
         self.store = sf.get_store(store_dir=store_dir, uri_base=uri_base)
+        self.fsync = fsync
+        self.gzip_checkpoints = CheckpointCache(gzip_checkpoint_archives)
+        self.read_ahead = read_ahead
+        self.read_ahead_executor = make_executor(read_ahead) if read_ahead else None
+        self._container_index_dir = os.path.join(store_dir, CONTAINER_INDEX_DIR)
+        self._container_index_built = os.path.join(store_dir, CONTAINER_INDEX_BUILT)
+        self.metadata_index = None
+        if metadata_index:
+            os.makedirs(os.path.join(store_dir, INTERNAL_PREFIX), exist_ok=True)
+            self.metadata_index = MetadataIndex(os.path.join(store_dir, METADATA_INDEX_PATH))
 
-    def _get_container(self, container_key):
+    def _indexed(self):
+        """Whether questions can be answered from the metadata index."""
+        return self.metadata_index is not None and self.metadata_index.built
+
+    def _get_indexed_object(self, container_key, object_key):
+        """
+        :return: The metadata of an object from the metadata index, or
+            `None` when it is not used or does not have the object.
+        """
+        if not self._indexed():
+            return None
+        return self.metadata_index.get_object(container_key, object_key)
+
+    def _object_written(self, container_key, object_key, file_stat, mime):
+        if self.metadata_index is not None:
+            self.metadata_index.put_object(
+                container_key, object_key, file_stat.st_size,
+                file_stat.st_mtime_ns, mime)
+
+    def _container_path(self, container_key):
+        return os.path.join(self.store.store_dir, 'pairtree_root',
+                            id2path(container_key))
+
+    def _object_path(self, container_key, object_key):
+        return os.path.join(self._container_path(container_key), object_key)
+
+    def _meta_path(self, container_key, object_key):
+        return os.path.join(self._container_path(container_key), META_DIR,
+                            object_key + '.json')
+
+    def _archive_index_path(self, container_key, object_key):
+        return os.path.join(self._container_path(container_key),
+                            ARCHIVE_INDEX_DIR, object_key + '.json')
+
+    def _container_index_path(self, container_key):
+        return os.path.join(self._container_index_dir,
+                            quote(container_key, safe=''))
+
+    def _index_container(self, container_key):
+        os.makedirs(self._container_index_dir, exist_ok=True)
+        with open(self._container_index_path(container_key), 'a'):
+            pass
+
+    def _write_object(self, container_key, object_key, object_data):
+        """
+        Spool the data to a temporary file in the container and atomically
+        replace the object with it. The MIME type is detected from the first
+        bytes while they pass by and recorded next to the object.
+        """
+        container_path = self._container_path(container_key)
+        temp_path = os.path.join(
+            container_path, f'{INTERNAL_PREFIX}-tmp-{uuid.uuid4().hex}')
         try:
-            return self.store.get_object(container_key, False)
-        except ObjectNotFoundException:
+            with open(temp_path, 'xb') as f:
+                if hasattr(object_data, 'read'):
+                    head = bytearray()
+                    chunk = object_data.read(CHUNK_SIZE)
+                    while chunk:
+                        if len(head) < MIME_SNIFF_SIZE:
+                            head += chunk[:MIME_SNIFF_SIZE - len(head)]
+                        f.write(chunk)
+                        chunk = object_data.read(CHUNK_SIZE)
+                else:
+                    head = object_data[:MIME_SNIFF_SIZE]
+                    f.write(object_data)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+                file_stat = os.fstat(f.fileno())
+            self._move_in_place(temp_path, container_key, object_key, file_stat,
+                                _sniff_mime(bytes(head)))
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def _move_in_place(self, temp_path, container_key, object_key, file_stat, mime):
+        """
+        Record the metadata of a completely written file in the container and
+        atomically replace the object with it.
+        """
+        self._write_meta(container_key, object_key, file_stat, mime)
+        _remove_if_exists(self._archive_index_path(container_key, object_key))
+        os.replace(temp_path, self._object_path(container_key, object_key))
+        self._object_written(container_key, object_key, file_stat, mime)
+        if self.fsync:
+            _fsync_dir(self._container_path(container_key))
+
+    def _write_meta(self, container_key, object_key, file_stat, mime):
+        """
+        Record the MIME type of an object, together with the size and time of
+        last modification of the file it was detected for.
+        """
+        self._write_sidecar(self._meta_path(container_key, object_key),
+                            file_stat, {'mime': mime})
+
+    def _write_sidecar(self, path, file_stat, data):
+        """
+        Atomically write data about an object to a JSON file, together with
+        the size and time of last modification of the object it is about.
+        """
+        sidecar_dir = os.path.dirname(path)
+        os.makedirs(sidecar_dir, exist_ok=True)
+        temp_path = os.path.join(
+            sidecar_dir, f'{INTERNAL_PREFIX}-tmp-{uuid.uuid4().hex}')
+        with open(temp_path, 'x') as f:
+            json.dump(dict(
+                data, size=file_stat.st_size, mtime_ns=file_stat.st_mtime_ns
+            ), f)
+        os.replace(temp_path, path)
+
+    def _read_sidecar(self, path, file_stat):
+        """
+        Read data written by :meth:`_write_sidecar`.
+
+        :return: The data or `None` when it was not written or written for
+            another version of the object.
+        """
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('size') != file_stat.st_size or \
+                data.get('mtime_ns') != file_stat.st_mtime_ns:
+            return None
+        return data
+
+    def _read_mime(self, container_key, object_key, file_stat):
+        """
+        Read the recorded MIME type of an object.
+
+        :return: The MIME type or `None` when it was not recorded or recorded
+            for another version of the object.
+        """
+        meta = self._read_sidecar(
+            self._meta_path(container_key, object_key), file_stat)
+        return meta.get('mime') if meta else None
+
+    def _get_mime(self, container_key, object_key, file_stat):
+        mime = self._read_mime(container_key, object_key, file_stat)
+        if mime is None:
+            with open(self._object_path(container_key, object_key), 'rb') as f:
+                mime = _sniff_mime(f.read(MIME_SNIFF_SIZE))
+        return mime
+
+    def _stat(self, container_key, object_key):
+        try:
+            file_stat = os.stat(self._object_path(container_key, object_key))
+        except (FileNotFoundError, NotADirectoryError):
+            raise NotFoundException
+        if not stat.S_ISREG(file_stat.st_mode):
             raise NotFoundException
+        return file_stat
+
+    def _list_object_keys(self, container):
+        return [part for part in container.list_parts()
+                if not part.startswith(INTERNAL_PREFIX)]
+
+    def _get_container(self, container_key):
+        with span('pairtree.get_container', container=container_key):
+            try:
+                return self.store.get_object(container_key, False)
+            except ObjectNotFoundException:
+                raise NotFoundException
 
     def get_object(self, container_key, object_key):
         """
@@ -42,30 +298,222 @@ class PairTreeFileSystemStore(IStore):
         """
         container = self._get_container(container_key)
         try:
-            return container.get_bytestream(object_key)
+            with span('pairtree.get_bytestream', object=object_key):
+                return container.get_bytestream(object_key)
+        except PartNotFoundException:
+            raise NotFoundException
+
+    def open_object(self, container_key, object_key):
+        """
+        Open an object in the data store for reading.
+
+        :param str container_key: Key of the container that the object lives in.
+        :param str object_key: Key of the object to open.
+        :returns: A binary file object. The caller must close it.
+        :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
+        """
+        container = self._get_container(container_key)
+        try:
+            with span('pairtree.get_bytestream', object=object_key, streamable=True):
+                return container.get_bytestream(object_key, streamable=True)
         except PartNotFoundException:
             raise NotFoundException
 
+    def open_object_handle(self, container_key, object_key):
+        """
+        Open an object in the data store for reading, together with its
+        metadata. The metadata is taken from the opened file, so it always
+        matches the data that will be read.
+
+        :param str container_key: Key of the container that the object lives in.
+        :param str object_key: Key of the object to open.
+        :returns: The opened object. The caller must close it.
+        :rtype: augeias.stores.StoreInterface.ObjectHandle
+        :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
+        """
+        try:
+            f = open(self._object_path(container_key, object_key), 'rb')
+        except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+            raise NotFoundException
+        try:
+            file_stat = os.fstat(f.fileno())
+            if not stat.S_ISREG(file_stat.st_mode):
+                raise NotFoundException
+            mime = self._read_mime(container_key, object_key, file_stat)
+            if mime is None:
+                mime = _sniff_mime(f.read(MIME_SNIFF_SIZE))
+                f.seek(0)
+        except BaseException:
+            f.close()
+            raise
+        return ObjectHandle(f, file_stat.st_size, file_stat.st_mtime_ns / 1e9, mime)
+
+    def open_archive_member(self, container_key, object_key, file_name):
+        """
+        Open a single file in a zip or tar archive object for reading.
+
+        A tar archive is indexed the first time a file is opened from it and
+        the index is kept next to the object, so later calls seek straight to
+        the file. Gzipped tars are decompressed from the nearest checkpoint
+        kept in memory for the most recently used archives.
+
+        :param str container_key: Key of the container that the object lives in.
+        :param str object_key: Key of the archive object.
+        :param str file_name: Name of the file in the archive.
+        :returns: The opened file, with its `size`. The caller must close it.
+        :rtype: augeias.archives.ArchiveMember
+        :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
+        :raises KeyError: When the archive has no file with that name.
+        """
+        try:
+            f = open(self._object_path(container_key, object_key), 'rb')
+        except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+            raise NotFoundException
+        try:
+            file_stat = os.fstat(f.fileno())
+            if not stat.S_ISREG(file_stat.st_mode):
+                raise NotFoundException
+            checkpoints = self.gzip_checkpoints.get(
+                (container_key, object_key),
+                (file_stat.st_size, file_stat.st_mtime_ns))
+            index_path = self._archive_index_path(container_key, object_key)
+            index = self._read_sidecar(index_path, file_stat)
+            if index is None:
+                index = build_tar_index(f, checkpoints)
+                if index is not None:
+                    self._write_sidecar(index_path, file_stat, index)
+            return open_archive_member(f, file_name, index, checkpoints)
+        except BaseException:
+            f.close()
+            raise
+
+    def stat_object(self, container_key, object_key):
+        """
+        Retrieve the size and time of last modification of an object.
+
+        :param str container_key: Key of the container that the object lives in.
+        :param str object_key: Key of the object to retrieve.
+        :returns: A dict with the `size` in bytes and the `mtime` as a POSIX
+            timestamp.
+        :rtype: dict
+        :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
+        """
+        indexed = self._get_indexed_object(container_key, object_key)
+        if indexed is not None:
+            return {'size': indexed['size'], 'mtime': indexed['mtime_ns'] / 1e9}
+        file_stat = self._stat(container_key, object_key)
+        return {'size': file_stat.st_size, 'mtime': file_stat.st_mtime_ns / 1e9}
+
     def get_object_info(self, container_key, object_key):
         """
         Retrieve object info (mimetype, size, time last modification) from the data store.
 
+        The mimetype is detected when the object is written. For objects
+        written by older versions it is detected from their first MiB.
+
         :param str container_key: Key of the container that the object lives in.
         :param str object_key: Key of the object to retrieve.
         :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
         """
-        # todo magic.from_buffer(open(file_path).read(1048576), mime=True) cannot microsoft mimetypes
-        # https://stackoverflow.com/questions/17779560/django-python-magic-identify-ppt-docx-word-uploaded-file-as-application-zip
-        file_path = '/'.join([self.store.store_dir,
-                              'pairtree_root', id2path(container_key), object_key])
-        if not os.path.exists(file_path):
-            raise NotFoundException
-        file_stat = os.stat(file_path)
-        return {
-            'time_last_modification': datetime.datetime.fromtimestamp(file_stat.st_mtime).isoformat(),
+        indexed = self._get_indexed_object(container_key, object_key)
+        if indexed is not None:
+            return _object_info(indexed)
+        file_stat = self._stat(container_key, object_key)
+        return _object_info({
+            'mtime_ns': file_stat.st_mtime_ns,
             'size': file_stat.st_size,
-            'mime': magic.from_buffer(open(file_path, 'rb').read(1048576), mime=True) or 'application/octet-stream'
-        }
+            'mime': self._get_mime(container_key, object_key, file_stat)
+        })
+
+    def backfill_mime_types(self):
+        """
+        Record the mimetype of every object that does not have one recorded
+        yet, eg. because it was written by an older version.
+
+        :returns: The number of objects that were updated.
+        :rtype: int
+        """
+        count = 0
+        for container_key in self.store.list_ids():
+            container = self._get_container(container_key)
+            for object_key in self._list_object_keys(container):
+                try:
+                    file_stat = self._stat(container_key, object_key)
+                except NotFoundException:
+                    continue
+                if self._read_mime(container_key, object_key, file_stat) is not None:
+                    continue
+                with open(self._object_path(container_key, object_key), 'rb') as f:
+                    mime = _sniff_mime(f.read(MIME_SNIFF_SIZE))
+                    file_stat = os.fstat(f.fileno())
+                self._write_meta(container_key, object_key, file_stat, mime)
+                count += 1
+        return count
+
+    def _walk_container_keys(self):
+        """
+        Find the containers by walking the directories of the PairTree.
+
+        A directory is taken to be a container when it holds an object or no
+        other containers. An empty container whose key is the start of the
+        key of another container can not be told apart from the directories
+        of that container and is not found.
+        """
+        root = os.path.join(self.store.store_dir, 'pairtree_root')
+        for dirpath, dirnames, filenames in os.walk(root):
+            shorties = [name for name in dirnames
+                        if len(name) <= self.store.shorty_length]
+            if dirpath != root and \
+                    (filenames or not dirnames or len(shorties) < len(dirnames)):
+                yield path2id(os.path.relpath(dirpath, root))
+            dirnames[:] = shorties
+
+    def rebuild_container_index(self):
+        """
+        Build the index of the containers from the directories of the
+        PairTree, eg. for a store written by an older version. Containers
+        that are in the index are kept as long as their directory exists.
+
+        Containers that are created or deleted while the index is rebuilt
+        may be missed or listed after they are deleted. Rebuild the index
+        while the store is not written to.
+
+        :returns: The number of containers in the index.
+        :rtype: int
+        """
+        container_keys = set(self._walk_container_keys())
+        os.makedirs(self._container_index_dir, exist_ok=True)
+        with os.scandir(self._container_index_dir) as entries:
+            for entry in entries:
+                container_key = unquote(entry.name)
+                if os.path.isdir(self._container_path(container_key)):
+                    container_keys.add(container_key)
+                else:
+                    _remove_if_exists(entry.path)
+        for container_key in container_keys:
+            self._index_container(container_key)
+        with open(self._container_index_built, 'a'):
+            pass
+        return len(container_keys)
+
+    def list_container_keys(self):
+        """
+        List the keys of all containers in the data store.
+
+        The containers are listed from an index that is kept up to date when
+        containers are created and deleted. The index is built the first
+        time, see :meth:`rebuild_container_index`.
+
+        :returns: A list of container keys.
+        :rtype: list
+        """
+        if self._indexed():
+            return self.metadata_index.list_container_keys()
+        if not os.path.exists(self._container_index_built):
+            self.rebuild_container_index()
+        with os.scandir(self._container_index_dir) as entries:
+            return [unquote(entry.name) for entry in entries
+                    if not entry.name.startswith(INTERNAL_PREFIX)]
 
     def create_object(self, container_key, object_key, object_data):
         """
@@ -73,12 +521,13 @@ class PairTreeFileSystemStore(IStore):
 
         :param str container_key: Key of the container to create an object in.
         :param str object_key: Key of the object to create.
-        :param str object_data: The data for the object to create.
+        :param object_data: The data for the object to create, as bytes or a
+            binary file-like object.
         :raises augeias.stores.error.NotFoundException: When the container could not be found.
         """
         _validate_data(object_data)
-        container = self._get_container(container_key)
-        container.add_bytestream(object_key, object_data)
+        self._get_container(container_key)
+        self._write_object(container_key, object_key, object_data)
 
     def update_object(self, container_key, object_key, object_data):
         """
@@ -86,12 +535,221 @@ class PairTreeFileSystemStore(IStore):
 
         :param str container_key: Key of the container that the object lives in.
         :param str object_key: Key of the object to update.
-        :param str object_data: New data for the object.
+        :param object_data: New data for the object, as bytes or a binary
+            file-like object.
         :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
         """
         _validate_data(object_data)
-        container = self.store.get_object(container_key, False)
-        container.add_bytestream(object_key, object_data)
+        self._get_container(container_key)
+        self._write_object(container_key, object_key, object_data)
+
+    def copy_object(self, source_store, source_container_key, source_object_key,
+                    container_key, object_key):
+        """
+        Copy an object, possibly from another store, to this store. An
+        existing object is replaced.
+
+        When the source is a filesystem store as well, the copy is made by
+        the filesystem: a hard link when both are on the same filesystem, a
+        reflink or an in-kernel copy otherwise. Hard links are safe because
+        objects are never modified in place. Other stores are streamed.
+
+        :param IStore source_store: Store the object to copy lives in.
+        :param str source_container_key: Key of the container of the object to copy.
+        :param str source_object_key: Key of the object to copy.
+        :param str container_key: Key of the container to copy the object to.
+        :param str object_key: Key of the copy.
+        :raises augeias.stores.error.NotFoundException: When the source object or one of the containers could not be found.
+        """
+        if not isinstance(source_store, PairTreeFileSystemStore):
+            return super().copy_object(
+                source_store, source_container_key, source_object_key,
+                container_key, object_key)
+        source_stat = source_store._stat(source_container_key, source_object_key)
+        mime = source_store._get_mime(
+            source_container_key, source_object_key, source_stat)
+        self._get_container(container_key)
+        source_path = source_store._object_path(source_container_key, source_object_key)
+        object_path = self._object_path(container_key, object_key)
+        if os.path.exists(object_path) and os.path.samefile(source_path, object_path):
+            return
+        container_path = self._container_path(container_key)
+        temp_path = os.path.join(
+            container_path, f'{INTERNAL_PREFIX}-tmp-{uuid.uuid4().hex}')
+        try:
+            if _copy_file(source_path, temp_path) != 'link' and self.fsync:
+                with open(temp_path, 'rb') as f:
+                    os.fsync(f.fileno())
+            self._move_in_place(temp_path, container_key, object_key,
+                                os.stat(temp_path), mime)
+        except BaseException:
+            _remove_if_exists(temp_path)
+            raise
+
+    def _upload_path(self, container_key, object_key, upload_id):
+        """
+        The staging file of an upload. Its name includes a digest of the
+        object key, so an upload can only be used for the object it was
+        created for.
+        """
+        if not UPLOAD_ID_PATTERN.fullmatch(upload_id):
+            raise NotFoundException
+        digest = hashlib.sha1(object_key.encode('utf-8')).hexdigest()
+        return os.path.join(self._container_path(container_key),
+                            f'{UPLOAD_PREFIX}{upload_id}-{digest}')
+
+    def _open_upload(self, container_key, object_key, upload_id):
+        """
+        Open the staging file of an upload, locked against other chunks and
+        commits of the same upload.
+        """
+        upload_path = self._upload_path(container_key, object_key, upload_id)
+        try:
+            f = open(upload_path, 'r+b')
+        except (FileNotFoundError, NotADirectoryError):
+            raise NotFoundException
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            # committed or aborted while waiting for the lock
+            if not os.path.exists(upload_path) or \
+                    not os.path.samestat(os.fstat(f.fileno()), os.stat(upload_path)):
+                raise NotFoundException
+        except BaseException:
+            f.close()
+            raise
+        return f
+
+    def create_upload(self, container_key, object_key):
+        """
+        Start a resumable upload of an object.
+
+        The chunks are appended to a staging file next to the object, which
+        is moved in place when the upload is committed.
+
+        :param str container_key: Key of the container of the object.
+        :param str object_key: Key of the object to upload.
+        :returns: The id of the upload.
+        :rtype: str
+        :raises augeias.stores.error.NotFoundException: When the container could not be found.
+        """
+        self._get_container(container_key)
+        upload_id = uuid.uuid4().hex
+        with open(self._upload_path(container_key, object_key, upload_id), 'xb'):
+            pass
+        return upload_id
+
+    def append_upload(self, container_key, object_key, upload_id, offset, data):
+        """
+        Add a chunk to a resumable upload.
+
+        The data that is received before a connection drops is kept, ask
+        :meth:`get_upload_offset` where to continue.
+
+        :param str container_key: Key of the container of the object.
+        :param str object_key: Key of the object to upload.
+        :param str upload_id: Id of the upload.
+        :param int offset: Number of bytes received so far.
+        :param data: The chunk, as bytes or a binary file-like object.
+        :returns: The number of bytes received so far, including the chunk.
+        :rtype: int
+        :raises augeias.stores.error.NotFoundException: When the upload could not be found.
+        :raises augeias.stores.error.OffsetMismatchException: When `offset`
+            is not the number of bytes received so far.
+        """
+        with self._open_upload(container_key, object_key, upload_id) as f:
+            size = os.fstat(f.fileno()).st_size
+            if offset != size:
+                raise OffsetMismatchException(size)
+            f.seek(size)
+            if hasattr(data, 'read'):
+                shutil.copyfileobj(data, f, CHUNK_SIZE)
+            else:
+                f.write(data)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+            return f.tell()
+
+    def get_upload_offset(self, container_key, object_key, upload_id):
+        """
+        Find where a resumable upload continues.
+
+        :param str container_key: Key of the container of the object.
+        :param str object_key: Key of the object to upload.
+        :param str upload_id: Id of the upload.
+        :returns: The number of bytes received so far.
+        :rtype: int
+        :raises augeias.stores.error.NotFoundException: When the upload could not be found.
+        """
+        try:
+            return os.stat(self._upload_path(container_key, object_key, upload_id)).st_size
+        except (FileNotFoundError, NotADirectoryError):
+            raise NotFoundException
+
+    def commit_upload(self, container_key, object_key, upload_id, encode=None):
+        """
+        Atomically replace the object with the data of a resumable upload.
+
+        :param str container_key: Key of the container of the object.
+        :param str object_key: Key of the object to upload.
+        :param str upload_id: Id of the upload.
+        :param encode: Changes the data while it is moved in place, see
+            :meth:`augeias.stores.StoreInterface.IStore.commit_upload`.
+        :raises augeias.stores.error.NotFoundException: When the upload could not be found.
+        """
+        with self._open_upload(container_key, object_key, upload_id) as f:
+            encoded = encode(f) if encode is not None else None
+            if encoded is not None:
+                with encoded:
+                    self._write_object(container_key, object_key, encoded)
+                os.remove(self._upload_path(container_key, object_key, upload_id))
+                return
+            f.seek(0)
+            head = f.read(MIME_SNIFF_SIZE)
+            if self.fsync:
+                os.fsync(f.fileno())
+            self._move_in_place(
+                self._upload_path(container_key, object_key, upload_id), container_key,
+                object_key, os.fstat(f.fileno()), _sniff_mime(head))
+
+    def abort_upload(self, container_key, object_key, upload_id):
+        """
+        End a resumable upload and remove the data received so far.
+
+        :param str container_key: Key of the container of the object.
+        :param str object_key: Key of the object to upload.
+        :param str upload_id: Id of the upload.
+        :raises augeias.stores.error.NotFoundException: When the upload could not be found.
+        """
+        with self._open_upload(container_key, object_key, upload_id):
+            os.remove(self._upload_path(container_key, object_key, upload_id))
+
+    def expire_uploads(self, max_age):
+        """
+        Remove the staging files of resumable uploads that did not receive
+        a chunk for `max_age` seconds. Uploads that are being written to are
+        skipped.
+
+        :param float max_age: Age in seconds after which an upload is
+            abandoned.
+        :returns: The number of removed uploads.
+        :rtype: int
+        """
+        deadline = time.time() - max_age
+        count = 0
+        for container_key in self.list_container_keys():
+            try:
+                entries = os.scandir(self._container_path(container_key))
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            with entries:
+                paths = [entry.path for entry in entries
+                         if entry.name.startswith(UPLOAD_PREFIX) and
+                         entry.stat().st_mtime < deadline]
+            for path in paths:
+                count += _remove_abandoned_upload(path, deadline)
+        return count
 
     def list_object_keys_for_container(self, container_key):
         """
@@ -102,8 +760,152 @@ class PairTreeFileSystemStore(IStore):
         :rtype: lst
         :raises augeias.stores.error.NotFoundException: When the container could not be found.
         """
+        if self._indexed():
+            return list(self._list_indexed_objects(container_key))
         container = self._get_container(container_key)
-        return container.list_parts()
+        return self._list_object_keys(container)
+
+    def iter_object_keys_for_container(self, container_key):
+        """
+        Iterate over the object keys of a container while its directory is
+        read, in no particular order.
+
+        :param str container_key: Key of the container to list the objects for.
+        :returns: An iterator of object keys.
+        :raises augeias.stores.error.NotFoundException: When the container could not be found.
+        """
+        if self._indexed():
+            return iter(self._list_indexed_objects(container_key))
+        try:
+            entries = os.scandir(self._container_path(container_key))
+        except (FileNotFoundError, NotADirectoryError):
+            raise NotFoundException
+        return _iter_object_keys(entries)
+
+    def list_object_info_for_container(self, container_key):
+        """
+        Retrieve the object info of all objects in a container.
+
+        The container is listed once. The recorded mimetypes are used, only
+        objects without one are read.
+
+        :param str container_key: Key of the container to list the objects for.
+        :returns: A dict with the object info for every object key.
+        :rtype: dict
+        :raises augeias.stores.error.NotFoundException: When the container could not be found.
+        """
+        if self._indexed():
+            return {
+                object_key: _object_info(indexed)
+                for object_key, indexed in self._list_indexed_objects(container_key).items()
+            }
+        return {
+            object_key: _object_info(scanned)
+            for object_key, scanned in self._scan_container(container_key).items()
+        }
+
+    def _list_indexed_objects(self, container_key):
+        objects = self.metadata_index.list_objects(container_key)
+        if not objects and not self.metadata_index.has_container(container_key):
+            raise NotFoundException
+        return objects
+
+    def _scan_container(self, container_key, detect_mime=True):
+        """
+        Read the metadata of the objects of a container from the filesystem,
+        with a single listing of the container.
+
+        :param bool detect_mime: Whether to include the mimetype, which is
+            read from the recorded mimetype or detected.
+        :return: A dict with the `size`, `mtime_ns` and `mime` of every
+            object, by object key.
+        """
+        try:
+            entries = list(os.scandir(self._container_path(container_key)))
+        except (FileNotFoundError, NotADirectoryError):
+            raise NotFoundException
+        objects = {}
+        for entry in entries:
+            if entry.name.startswith(INTERNAL_PREFIX) or not entry.is_file(follow_symlinks=False):
+                continue
+            file_stat = entry.stat(follow_symlinks=False)
+            objects[entry.name] = {
+                'size': file_stat.st_size,
+                'mtime_ns': file_stat.st_mtime_ns,
+                'mime': self._get_mime(container_key, entry.name, file_stat)
+                if detect_mime else None
+            }
+        return objects
+
+    def _list_stored_container_keys(self):
+        self.rebuild_container_index()
+        with os.scandir(self._container_index_dir) as entries:
+            return [unquote(entry.name) for entry in entries
+                    if not entry.name.startswith(INTERNAL_PREFIX)]
+
+    def rebuild_metadata_index(self):
+        """
+        Reconcile the metadata index with the filesystem: every container
+        and object is (re)indexed and what no longer exists is removed. The
+        index is used to answer questions from then on.
+
+        :returns: The number of objects in the index.
+        :rtype: int
+        :raises ValueError: When the store does not keep a metadata index.
+        """
+        if self.metadata_index is None:
+            raise ValueError('This store does not keep a metadata index')
+        container_keys = self._list_stored_container_keys()
+        count = 0
+        for container_key in container_keys:
+            try:
+                objects = self._scan_container(container_key)
+            except NotFoundException:
+                continue
+            self.metadata_index.replace_container(container_key, objects)
+            count += len(objects)
+        for container_key in set(self.metadata_index.list_container_keys()) - set(container_keys):
+            self.metadata_index.remove_container(container_key)
+        self.metadata_index.mark_built()
+        return count
+
+    def verify_metadata_index(self):
+        """
+        Compare the metadata index with the filesystem, without changing it.
+
+        :returns: A list of `(container_key, object_key, problem)` for every
+            difference, where `problem` is `missing` when the index lacks a
+            container or an object, `outdated` when it has another size or
+            time of last modification for an object, and `deleted` when it
+            has a container or an object that no longer exists. The
+            `object_key` is `None` for containers.
+        :rtype: list
+        :raises ValueError: When the store does not keep a metadata index.
+        """
+        if self.metadata_index is None:
+            raise ValueError('This store does not keep a metadata index')
+        problems = []
+        container_keys = self._list_stored_container_keys()
+        indexed_container_keys = set(self.metadata_index.list_container_keys())
+        for container_key in sorted(indexed_container_keys - set(container_keys)):
+            problems.append((container_key, None, 'deleted'))
+        for container_key in sorted(container_keys):
+            if container_key not in indexed_container_keys:
+                problems.append((container_key, None, 'missing'))
+            indexed = self.metadata_index.list_objects(container_key)
+            try:
+                stored = self._scan_container(container_key, detect_mime=False)
+            except NotFoundException:
+                continue
+            for object_key in sorted(set(indexed) | set(stored)):
+                if object_key not in indexed:
+                    problems.append((container_key, object_key, 'missing'))
+                elif object_key not in stored:
+                    problems.append((container_key, object_key, 'deleted'))
+                elif (indexed[object_key]['size'], indexed[object_key]['mtime_ns']) != \
+                        (stored[object_key]['size'], stored[object_key]['mtime_ns']):
+                    problems.append((container_key, object_key, 'outdated'))
+        return problems
 
     def delete_object(self, container_key, object_key):
         """
@@ -118,6 +920,11 @@ class PairTreeFileSystemStore(IStore):
             container.del_file(object_key)
         except PartNotFoundException:
             raise NotFoundException
+        _remove_if_exists(self._meta_path(container_key, object_key))
+        _remove_if_exists(self._archive_index_path(container_key, object_key))
+        self.gzip_checkpoints.discard((container_key, object_key))
+        if self.metadata_index is not None:
+            self.metadata_index.remove_object(container_key, object_key)
 
     def get_container_data(self, container_key, translations=None):
         """
@@ -128,25 +935,46 @@ class PairTreeFileSystemStore(IStore):
         :param translations: Dict of object IDs and file names to use for them.
         :return: a zip file containing all files of the container.
         """
-        translations = translations or {}
-        container = self.store.get_object(
-            container_key,
-            create_if_doesnt_exist=False
-        )
-        object_list = translations.keys() if translations else container.list_parts()
         in_memory_file = BytesIO()
-        try:
-            with ZipFile(in_memory_file, 'w') as zf:
-                for object_key in object_list:
-                    zf.writestr(
-                        translations.get(object_key, object_key),
-                        container.get_bytestream(object_key)
-                    )
-        except PartNotFoundException:
-            raise NotFoundException
+        for chunk in self.iter_container_data(container_key, translations):
+            in_memory_file.write(chunk)
         in_memory_file.seek(0)
         return in_memory_file
 
+    def iter_container_data(self, container_key, translations=None):
+        """
+        Find a container and stream a zip file of the requested objects.
+        If translations exist, only the files within translations.keys() will be provided
+
+        The objects are read from disk in chunks while the zip file is being
+        consumed. With `read_ahead`, the next objects are opened concurrently.
+
+        :param container_key: Key of the container which must be retrieved.
+        :param translations: Dict of object IDs and file names to use for them.
+        :return: an iterator of byte strings that make up the zip file.
+        :raises augeias.stores.error.NotFoundException: When the container or
+            one of the requested objects could not be found.
+        """
+        translations = translations or {}
+        container = self._get_container(container_key)
+        object_list = list(translations) if translations else self._list_object_keys(container)
+        stat_object = functools.partial(self.stat_object, container_key)
+        if self.read_ahead_executor is not None:
+            object_stats = self.read_ahead_executor.map(stat_object, object_list)
+        else:
+            object_stats = map(stat_object, object_list)
+        members = [
+            ZipMember(
+                name=translations.get(object_key, object_key),
+                size=object_stat['size'],
+                mtime=object_stat['mtime'],
+                open=functools.partial(self.open_object, container_key, object_key)
+            )
+            for object_key, object_stat in zip(object_list, object_stats)
+        ]
+        return stream_zip(members, executor=self.read_ahead_executor,
+                          read_ahead=self.read_ahead)
+
     def create_container(self, container_key):
         """
         Create a new container in the data store.
@@ -154,6 +982,9 @@ class PairTreeFileSystemStore(IStore):
         :param str container_key: Key of the container to create.
         """
         self.store.get_object(container_key)
+        self._index_container(container_key)
+        if self.metadata_index is not None:
+            self.metadata_index.add_container(container_key)
 
     def delete_container(self, container_key):
         """
@@ -166,6 +997,29 @@ class PairTreeFileSystemStore(IStore):
             self.store.delete_object(container_key)
         except ObjectNotFoundException:
             raise NotFoundException
+        finally:
+            _remove_if_exists(self._container_index_path(container_key))
+            if self.metadata_index is not None:
+                self.metadata_index.remove_container(container_key)
+
+
+def _object_info(metadata):
+    """
+    Turn the `size`, `mtime_ns` and `mime` of an object into object info.
+    """
+    return {
+        'time_last_modification': datetime.datetime.fromtimestamp(metadata['mtime_ns'] / 1e9).isoformat(),
+        'size': metadata['size'],
+        'mime': metadata['mime']
+    }
+
+
+def _iter_object_keys(entries):
+    with entries:
+        for entry in entries:
+            if not entry.name.startswith(INTERNAL_PREFIX) and \
+                    entry.is_file(follow_symlinks=False):
+                yield entry.name
 
 
 def _is_allowed_data(data):  # pragma: no cover
@@ -179,3 +1033,83 @@ def _is_allowed_data(data):  # pragma: no cover
 def _validate_data(data):
     if not _is_allowed_data(data):
         raise OSError('Data type is not allowed')
+
+
+def _sniff_mime(data):
+    # todo magic.from_buffer(open(file_path).read(1048576), mime=True) cannot microsoft mimetypes
+    # https://stackoverflow.com/questions/17779560/django-python-magic-identify-ppt-docx-word-uploaded-file-as-application-zip
+    with span('magic.from_buffer', size=len(data)), REGISTRY.timed(MIME_DETECTION_SECONDS):
+        return magic.from_buffer(data, mime=True) or 'application/octet-stream'
+
+
+def _remove_abandoned_upload(path, deadline):
+    """
+    Remove the staging file of an upload unless it is locked or was written
+    to after `deadline`.
+
+    :returns: 1 when the file was removed, otherwise 0.
+    """
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return 0
+    with f:
+        if fcntl is not None:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0
+        file_stat = os.fstat(f.fileno())
+        if file_stat.st_mtime >= deadline or not os.path.exists(path) or \
+                not os.path.samestat(file_stat, os.stat(path)):
+            return 0
+        os.remove(path)
+    return 1
+
+
+def _remove_if_exists(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _copy_file(source_path, target_path):
+    """
+    Copy a file as cheaply as the filesystem allows. Tries a hard link, a
+    reflink, :func:`os.copy_file_range` and finally a plain copy.
+
+    :return: The method that was used: `link`, `clone`, `copy_file_range`
+        or `copy`.
+    """
+    try:
+        os.link(source_path, target_path)
+        return 'link'
+    except OSError:
+        pass
+    with open(source_path, 'rb') as src, open(target_path, 'xb') as dst:
+        if fcntl is not None:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                return 'clone'
+            except OSError:
+                pass
+        if hasattr(os, 'copy_file_range'):
+            try:
+                while os.copy_file_range(src.fileno(), dst.fileno(), COPY_FILE_RANGE_SIZE):
+                    pass
+                return 'copy_file_range'
+            except OSError:
+                src.seek(0)
+                dst.seek(0)
+                dst.truncate()
+        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        return 'copy'
+
+
+def _fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,111 @@
+"""
+This module provides a base class for stores that add behaviour to another
+store.
+"""
+from augeias.stores.StoreInterface import IStore
+
+
+class StoreDecorator(IStore):
+    """
+    A store that passes every call on to the store it wraps.
+
+    Subclasses override the methods they add behaviour to. Methods that are
+    not part of :class:`~augeias.stores.StoreInterface.IStore` are looked up
+    on the wrapped store as well.
+
+    :param IStore store: The store to wrap.
+    """
+
+    #: Whether the decorator hands out the data of the wrapped store
+    #: unchanged. Objects are then copied from the wrapped store directly, so
+    #: it can copy them without reading them.
+    transparent = True
+
+    def __init__(self, store):
+        self.store = store
+
+    def __getattr__(self, name):
+        if name == 'store':
+            raise AttributeError(name)
+        return getattr(self.store, name)
+
+    @property
+    def reserved_key_prefix(self):
+        return self.store.reserved_key_prefix
+
+    def create_object(self, container_key, object_key, object_data):
+        return self.store.create_object(container_key, object_key, object_data)
+
+    def delete_object(self, container_key, object_key):
+        return self.store.delete_object(container_key, object_key)
+
+    def get_object(self, container_key, object_key):
+        return self.store.get_object(container_key, object_key)
+
+    def open_object(self, container_key, object_key):
+        return self.store.open_object(container_key, object_key)
+
+    def open_object_handle(self, container_key, object_key):
+        return self.store.open_object_handle(container_key, object_key)
+
+    def open_encoded_object_handle(self, container_key, object_key, encodings):
+        return self.store.open_encoded_object_handle(container_key, object_key, encodings)
+
+    def open_archive_member(self, container_key, object_key, file_name):
+        return self.store.open_archive_member(container_key, object_key, file_name)
+
+    def get_object_info(self, container_key, object_key):
+        return self.store.get_object_info(container_key, object_key)
+
+    def stat_object(self, container_key, object_key):
+        return self.store.stat_object(container_key, object_key)
+
+    def update_object(self, container_key, object_key, object_data):
+        return self.store.update_object(container_key, object_key, object_data)
+
+    def copy_object(self, source_store, source_container_key, source_object_key,
+                    container_key, object_key):
+        while isinstance(source_store, StoreDecorator) and source_store.transparent:
+            source_store = source_store.store
+        return self.store.copy_object(
+            source_store, source_container_key, source_object_key,
+            container_key, object_key)
+
+    def create_upload(self, container_key, object_key):
+        return self.store.create_upload(container_key, object_key)
+
+    def append_upload(self, container_key, object_key, upload_id, offset, data):
+        return self.store.append_upload(container_key, object_key, upload_id, offset, data)
+
+    def get_upload_offset(self, container_key, object_key, upload_id):
+        return self.store.get_upload_offset(container_key, object_key, upload_id)
+
+    def commit_upload(self, container_key, object_key, upload_id, encode=None):
+        return self.store.commit_upload(container_key, object_key, upload_id, encode)
+
+    def abort_upload(self, container_key, object_key, upload_id):
+        return self.store.abort_upload(container_key, object_key, upload_id)
+
+    def list_object_keys_for_container(self, container_key):
+        return self.store.list_object_keys_for_container(container_key)
+
+    def iter_object_keys_for_container(self, container_key):
+        return self.store.iter_object_keys_for_container(container_key)
+
+    def list_object_info_for_container(self, container_key):
+        return self.store.list_object_info_for_container(container_key)
+
+    def get_container_data(self, container_key, translations=None):
+        return self.store.get_container_data(container_key, translations)
+
+    def iter_container_data(self, container_key, translations=None):
+        return self.store.iter_container_data(container_key, translations)
+
+    def list_container_keys(self):
+        return self.store.list_container_keys()
+
+    def create_container(self, container_key):
+        return self.store.create_container(container_key)
+
+    def delete_container(self, container_key):
+        return self.store.delete_container(container_key)
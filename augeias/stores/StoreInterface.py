@@ -2,7 +2,62 @@
 This module defines the interface every store needs to adhere to.
 """
 
+import datetime
 from abc import ABCMeta, abstractmethod
+from io import BytesIO
+
+from augeias.archives import open_archive_member
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ObjectHandle:
+    """
+    An opened object together with its metadata.
+
+    A handle can be used as the binary file-like object it wraps. It closes
+    that object when it is used as a context manager.
+
+    :param fileobj: A binary file-like object with the data of the object.
+    :param int size: Size of the object in bytes.
+    :param float mtime: Time of last modification as a POSIX timestamp.
+    :param str mime: Mimetype of the object.
+    :param str encoding: Content coding of the data, eg. `gzip`, or `None`
+        when the data is not encoded. `size` is the size of the encoded data.
+    :param bool negotiated: Whether the data would have been encoded
+        differently for other accepted content codings.
+    """
+
+    def __init__(self, fileobj, size, mtime, mime, encoding=None, negotiated=False):
+        self.file = fileobj
+        self.size = size
+        self.mtime = mtime
+        self.mime = mime
+        self.encoding = encoding
+        self.negotiated = negotiated
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def __iter__(self):
+        return iter(self.file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.file.close()
+
+    @property
+    def info(self):
+        """
+        The object info as returned by :meth:`IStore.get_object_info`.
+        """
+        return {
+            'time_last_modification': datetime.datetime.fromtimestamp(self.mtime).isoformat(),
+            'size': self.size,
+            'mime': self.mime
+        }
 
 
 class IStore:
@@ -13,6 +68,11 @@ class IStore:
     """
     __metaclass__ = ABCMeta
 
+    #: Object keys that start with this prefix are reserved for the store
+    #: itself and can not be used for objects, `None` when no keys are
+    #: reserved.
+    reserved_key_prefix = None
+
     @abstractmethod
     def create_object(self, container_key, object_key, object_data):
         """
@@ -20,7 +80,8 @@ class IStore:
 
         :param str container_key: Key of the container to create an object in.
         :param str object_key: Key of the object to create.
-        :param str object_data: The data for the object to create.
+        :param object_data: The data for the object to create, as bytes or a
+            binary file-like object.
         :raises augeias.stores.error.NotFoundException: When the container could not be found.
         """
 
@@ -44,6 +105,89 @@ class IStore:
         :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
         """
 
+    def open_object(self, container_key, object_key):
+        """
+        Open an object in the data store for reading.
+
+        Stores that are able to stream their objects should override this. The
+        default implementation wraps the result of :meth:`get_object`.
+
+        :param str container_key: Key of the container that the object lives in.
+        :param str object_key: Key of the object to open.
+        :returns: A binary file-like object. The caller must close it. It
+            should be seekable, so parts of the object can be read without
+            reading everything before them.
+        :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
+        """
+        return BytesIO(self.get_object(container_key, object_key))
+
+    def open_object_handle(self, container_key, object_key):
+        """
+        Open an object in the data store for reading, together with its
+        metadata.
+
+        Stores should override this when they can retrieve the data and the
+        metadata in one go. The default implementation combines
+        :meth:`stat_object`, :meth:`get_object_info` and :meth:`open_object`.
+
+        :param str container_key: Key of the container that the object lives in.
+        :param str object_key: Key of the object to open.
+        :returns: The opened object. The caller must close it.
+        :rtype: ObjectHandle
+        :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
+        """
+        object_stat = self.stat_object(container_key, object_key)
+        object_info = self.get_object_info(container_key, object_key)
+        return ObjectHandle(
+            self.open_object(container_key, object_key),
+            size=object_info['size'],
+            mtime=object_stat['mtime'],
+            mime=object_info['mime']
+        )
+
+    def open_encoded_object_handle(self, container_key, object_key, encodings):
+        """
+        Open an object for reading, in one of the given content codings when
+        it is stored that way.
+
+        Stores that keep objects compressed should override this, so the
+        compressed data can be sent without decoding it. The default
+        implementation opens the object with :meth:`open_object_handle`.
+
+        :param str container_key: Key of the container that the object lives in.
+        :param str object_key: Key of the object to open.
+        :param encodings: The content codings the data may be returned in,
+            eg. `gzip`.
+        :returns: The opened object. Its `encoding` tells how its data is
+            encoded. The caller must close it.
+        :rtype: ObjectHandle
+        :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
+        """
+        return self.open_object_handle(container_key, object_key)
+
+    def open_archive_member(self, container_key, object_key, file_name):
+        """
+        Open a single file in a zip or tar archive object for reading.
+
+        Stores that can index their archives should override this. The
+        default implementation looks the file up in :meth:`open_object`.
+
+        :param str container_key: Key of the container that the object lives in.
+        :param str object_key: Key of the archive object.
+        :param str file_name: Name of the file in the archive.
+        :returns: The opened file, with its `size`. Closing it also closes the
+            object. The caller must close it.
+        :rtype: augeias.archives.ArchiveMember
+        :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
+        :raises KeyError: When the archive has no file with that name.
+        """
+        archive_file = self.open_object(container_key, object_key)
+        try:
+            return open_archive_member(archive_file, file_name)
+        except BaseException:
+            archive_file.close()
+            raise
+
     @abstractmethod
     def get_object_info(self, container_key, object_key):
         """
@@ -54,6 +198,29 @@ class IStore:
         :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
         """
 
+    def stat_object(self, container_key, object_key):
+        """
+        Retrieve the size and time of last modification of an object.
+
+        This is meant to be cheaper than :meth:`get_object_info`, it is used
+        to answer conditional requests. Stores should override it when they
+        can do so without inspecting the content of the object.
+
+        :param str container_key: Key of the container that the object lives in.
+        :param str object_key: Key of the object to retrieve.
+        :returns: A dict with the `size` in bytes and the `mtime` as a POSIX
+            timestamp.
+        :rtype: dict
+        :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
+        """
+        object_info = self.get_object_info(container_key, object_key)
+        time_last_modification = object_info['time_last_modification']
+        time_format = '%Y-%m-%dT%H:%M:%S'
+        if '.' in time_last_modification:
+            time_format += '.%f'
+        mtime = datetime.datetime.strptime(time_last_modification, time_format)
+        return {'size': object_info['size'], 'mtime': mtime.timestamp()}
+
     @abstractmethod
     def update_object(self, container_key, object_key, object_data):
         """
@@ -61,10 +228,109 @@ class IStore:
 
         :param str container_key: Key of the container that the object lives in.
         :param str object_key: Key of the object to update.
-        :param str object_data: New data for the object.
+        :param object_data: New data for the object, as bytes or a binary
+            file-like object.
         :raises augeias.stores.error.NotFoundException: When the object or container could not be found.
         """
 
+    def copy_object(self, source_store, source_container_key, source_object_key,
+                    container_key, object_key):
+        """
+        Copy an object, possibly from another store, to this store. An
+        existing object is replaced.
+
+        Stores should override this when they can copy objects without
+        passing their data through Python. The default implementation streams
+        the object from :meth:`open_object` to :meth:`update_object`.
+
+        :param IStore source_store: Store the object to copy lives in.
+        :param str source_container_key: Key of the container of the object to copy.
+        :param str source_object_key: Key of the object to copy.
+        :param str container_key: Key of the container to copy the object to.
+        :param str object_key: Key of the copy.
+        :raises augeias.stores.error.NotFoundException: When the source object or one of the containers could not be found.
+        """
+        with source_store.open_object(source_container_key, source_object_key) as f:
+            self.update_object(container_key, object_key, f)
+
+    def create_upload(self, container_key, object_key):
+        """
+        Start a resumable upload of an object. The data is sent in chunks
+        with :meth:`append_upload` and becomes the object with
+        :meth:`commit_upload`.
+
+        :param str container_key: Key of the container of the object.
+        :param str object_key: Key of the object to upload.
+        :returns: The id of the upload.
+        :rtype: str
+        :raises augeias.stores.error.NotFoundException: When the container could not be found.
+        :raises NotImplementedError: When the store does not support resumable uploads.
+        """
+        raise NotImplementedError('This store does not support resumable uploads')
+
+    def append_upload(self, container_key, object_key, upload_id, offset, data):
+        """
+        Add a chunk to a resumable upload.
+
+        :param str container_key: Key of the container of the object.
+        :param str object_key: Key of the object to upload.
+        :param str upload_id: Id of the upload.
+        :param int offset: Position of the chunk in the object. It must be the
+            number of bytes received so far.
+        :param data: The chunk, as bytes or a binary file-like object.
+        :returns: The number of bytes received so far, including the chunk.
+        :rtype: int
+        :raises augeias.stores.error.NotFoundException: When the upload could not be found.
+        :raises augeias.stores.error.OffsetMismatchException: When `offset`
+            is not the number of bytes received so far.
+        :raises NotImplementedError: When the store does not support resumable uploads.
+        """
+        raise NotImplementedError('This store does not support resumable uploads')
+
+    def get_upload_offset(self, container_key, object_key, upload_id):
+        """
+        Find where a resumable upload continues, eg. after a failed chunk.
+
+        :param str container_key: Key of the container of the object.
+        :param str object_key: Key of the object to upload.
+        :param str upload_id: Id of the upload.
+        :returns: The number of bytes received so far.
+        :rtype: int
+        :raises augeias.stores.error.NotFoundException: When the upload could not be found.
+        :raises NotImplementedError: When the store does not support resumable uploads.
+        """
+        raise NotImplementedError('This store does not support resumable uploads')
+
+    def commit_upload(self, container_key, object_key, upload_id, encode=None):
+        """
+        Replace the object with the data of a resumable upload, and end the
+        upload.
+
+        :param str container_key: Key of the container of the object.
+        :param str object_key: Key of the object to upload.
+        :param str upload_id: Id of the upload.
+        :param encode: Used by a decorating store to change the data while it
+            is moved in place. A callable that is given the upload as a binary
+            file and returns the data to write instead, as a binary file-like
+            object that is closed afterwards, or `None` to keep the upload as
+            it is.
+        :raises augeias.stores.error.NotFoundException: When the upload could not be found.
+        :raises NotImplementedError: When the store does not support resumable uploads.
+        """
+        raise NotImplementedError('This store does not support resumable uploads')
+
+    def abort_upload(self, container_key, object_key, upload_id):
+        """
+        End a resumable upload without changing the object.
+
+        :param str container_key: Key of the container of the object.
+        :param str object_key: Key of the object to upload.
+        :param str upload_id: Id of the upload.
+        :raises augeias.stores.error.NotFoundException: When the upload could not be found.
+        :raises NotImplementedError: When the store does not support resumable uploads.
+        """
+        raise NotImplementedError('This store does not support resumable uploads')
+
     @abstractmethod
     def list_object_keys_for_container(self, container_key):
         """
@@ -76,6 +342,39 @@ class IStore:
         :raises augeias.stores.error.NotFoundException: When the container could not be found.
         """
 
+    def iter_object_keys_for_container(self, container_key):
+        """
+        Iterate over the object keys of a container, in no particular order.
+
+        Stores should override this when they can produce the keys while the
+        container is being listed. The default implementation iterates over
+        the result of :meth:`list_object_keys_for_container`.
+
+        :param str container_key: Key of the container to list the objects for.
+        :returns: An iterator of object keys.
+        :raises augeias.stores.error.NotFoundException: When the container could not be found.
+        """
+        return iter(self.list_object_keys_for_container(container_key))
+
+    def list_object_info_for_container(self, container_key):
+        """
+        Retrieve the object info of all objects in a container.
+
+        Stores should override this when they can retrieve the info of all
+        objects at once. The default implementation calls
+        :meth:`get_object_info` for every object.
+
+        :param str container_key: Key of the container to list the objects for.
+        :returns: A dict with the object info, as returned by
+            :meth:`get_object_info`, for every object key.
+        :rtype: dict
+        :raises augeias.stores.error.NotFoundException: When the container could not be found.
+        """
+        return {
+            object_key: self.get_object_info(container_key, object_key)
+            for object_key in self.list_object_keys_for_container(container_key)
+        }
+
     @abstractmethod
     def get_container_data(self, container_key, translations=None):
         """
@@ -86,6 +385,33 @@ class IStore:
         :return: a zip file containing all files of the container.
         """
 
+    def iter_container_data(self, container_key, translations=None):
+        """
+        Find a container and stream a zip file of its contents.
+
+        Stores that can produce the zip file while it is being sent should
+        override this. The default implementation reads the result of
+        :meth:`get_container_data` in chunks.
+
+        :param container_key: Key of the container which must be retrieved.
+        :param translations: Dict of object IDs and file names to use for them.
+        :return: an iterator of byte strings that make up the zip file.
+        :raises augeias.stores.error.NotFoundException: When the container or
+            one of the requested objects could not be found.
+        """
+        zip_file = self.get_container_data(container_key, translations)
+        return iter(lambda: zip_file.read(CHUNK_SIZE), b'')
+
+    def list_container_keys(self):
+        """
+        List the keys of all containers in the data store.
+
+        :returns: A list of container keys.
+        :rtype: list
+        :raises NotImplementedError: When the store can not list its containers.
+        """
+        raise NotImplementedError('This store can not list its containers')
+
     @abstractmethod
     def create_container(self, container_key):
         """
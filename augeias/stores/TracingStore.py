@@ -0,0 +1,59 @@
+"""
+This module provides a store that traces the operations of another store.
+"""
+from augeias.stores.StoreDecorator import StoreDecorator
+from augeias.tracing import span
+
+
+def _traced(operation):
+    delegate = getattr(StoreDecorator, operation)
+
+    def method(self, *args, **kwargs):
+        with span('store.' + operation, collection=self.collection):
+            return delegate(self, *args, **kwargs)
+
+    method.__name__ = operation
+    method.__doc__ = delegate.__doc__
+    return method
+
+
+class TracingStore(StoreDecorator):
+    """
+    Starts a span, see :mod:`augeias.tracing`, for every operation of
+    another store. The spans the store starts itself become its children.
+
+    Opening an object or a zip of a container is traced until it is open,
+    not while it is being read.
+
+    :param IStore store: The store to trace.
+    :param str collection: Name of the collection of the store.
+    """
+
+    def __init__(self, store, collection):
+        super().__init__(store)
+        self.collection = collection
+
+    create_object = _traced('create_object')
+    delete_object = _traced('delete_object')
+    get_object = _traced('get_object')
+    open_object = _traced('open_object')
+    open_object_handle = _traced('open_object_handle')
+    open_encoded_object_handle = _traced('open_encoded_object_handle')
+    open_archive_member = _traced('open_archive_member')
+    get_object_info = _traced('get_object_info')
+    stat_object = _traced('stat_object')
+    update_object = _traced('update_object')
+    copy_object = _traced('copy_object')
+    create_upload = _traced('create_upload')
+    append_upload = _traced('append_upload')
+    get_upload_offset = _traced('get_upload_offset')
+    commit_upload = _traced('commit_upload')
+    abort_upload = _traced('abort_upload')
+    list_object_keys_for_container = _traced('list_object_keys_for_container')
+    iter_object_keys_for_container = _traced('iter_object_keys_for_container')
+    list_object_info_for_container = _traced('list_object_info_for_container')
+    get_container_data = _traced('get_container_data')
+    iter_container_data = _traced('iter_container_data')
+    list_container_keys = _traced('list_container_keys')
+    create_container = _traced('create_container')
+    delete_container = _traced('delete_container')
@@ -15,3 +15,19 @@ class NotFoundException(Exception):
 
     def __str__(self):
         return repr(self.value)
+
+
+class OffsetMismatchException(Exception):
+    """
+    Indicates that a chunk of an upload does not start where the data that
+    was received so far ends.
+
+    :param int offset: Number of bytes received so far.
+    """
+
+    def __init__(self, offset):
+        self.offset = offset
+        self.value = f'The upload continues at offset {offset}'
+
+    def __str__(self):
+        return repr(self.value)
@@ -0,0 +1,341 @@
+"""
+This module records traces of the work Augeias does for a request: nested
+spans with the time spent in the stores, in mimetype detection and in
+reading and writing archives.
+
+Tracing is disabled by default, :func:`span` then returns a span that does
+nothing. Enable it with `augeias.tracing` in the configuration file, set to
+`log` or `true` to log every span as JSON, to `opentelemetry` to hand the
+spans to the OpenTelemetry SDK, or to the dotted name of a :class:`SpanSink`.
+Every application keeps its sink in its registry, the spans of a request are
+reported to the sink of the application that handles it.
+"""
+import contextvars
+import json
+import logging
+import os
+import time
+import types
+
+from pyramid.events import ApplicationCreated
+from pyramid.settings import asbool
+from pyramid.settings import falsey
+from pyramid.settings import truthy
+
+log = logging.getLogger(__name__)
+
+_current_span = contextvars.ContextVar('augeias_current_span', default=None)
+
+_current_sink = contextvars.ContextVar('augeias_current_sink', default=None)
+
+
+class Span:
+    """
+    A timed operation, with the span that was current when it started as
+    its parent.
+
+    :param str name: Name of the operation.
+    :param Span parent: The parent span or `None` for the root of a trace.
+    :param SpanSink sink: The sink to report the span to.
+    :param dict attributes: Attributes of the span.
+    """
+
+    def __init__(self, name, parent, sink, attributes):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.attributes = attributes
+        self.error = None
+        self.start_time = time.time()
+        self.duration = None
+        self._start = time.perf_counter()
+        self._sink = sink
+        self._token = None
+        #: Data a sink keeps with the span, eg. the span of another library.
+        self.sink_data = None
+        sink.start(self)
+
+    def set_attribute(self, name, value):
+        self.attributes[name] = value
+
+    def end(self, error=None):
+        """
+        End the span and report it to the sink, only the first call counts.
+
+        :param BaseException error: The error the operation failed with.
+        """
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._start
+        if error is not None:
+            self.error = type(error).__name__
+        self._sink.end(self)
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_span.reset(self._token)
+        self.end(exc)
+
+
+class _NoopSpan:
+    """The span that is handed out when tracing is disabled."""
+
+    __slots__ = ()
+
+    def set_attribute(self, name, value):
+        pass
+
+    def end(self, error=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def span(name, **attributes):
+    """
+    Start a span that is the parent of the spans started in its `with`
+    block.
+
+    .. code-block:: python
+
+        with span('pairtree.get_container', container=container_key):
+            ...
+
+    Used without `with`, eg. for work that is interleaved with other work in
+    a generator, the span is not the parent of other spans and is ended with
+    :meth:`Span.end`.
+
+    :param str name: Name of the operation.
+    :param attributes: Attributes of the span.
+    :return: A :class:`Span`, or a span that does nothing when tracing is
+        disabled.
+    """
+    sink = _current_sink.get()
+    if sink is None:
+        return NOOP_SPAN
+    return Span(name, _current_span.get(), sink, attributes)
+
+
+def set_sink(sink):
+    """
+    Set the sink of the current context, eg. for work outside of a request.
+    While a request is handled, the sink of its application is current.
+
+    :param SpanSink sink: The sink to report spans to, `None` disables
+        tracing.
+    """
+    _current_sink.set(sink)
+
+
+def get_sink():
+    """:return: The sink of the current context.
+    :rtype: SpanSink"""
+    return _current_sink.get()
+
+
+class SpanSink:
+    """
+    Receives the spans of traces. Sinks are called from the threads that
+    handle requests.
+    """
+
+    def start(self, span):
+        """Called when `span` starts."""
+
+    def end(self, span):
+        """Called when `span` has ended."""
+
+
+class InMemorySink(SpanSink):
+    """Keeps the ended spans in :attr:`spans`, eg. for tests."""
+
+    def __init__(self):
+        self.spans = []
+
+    def end(self, span):
+        self.spans.append(span)
+
+    def names(self):
+        """:return: The names of the ended spans, in the order they ended."""
+        return [s.name for s in self.spans]
+
+
+class LoggingSink(SpanSink):
+    """
+    Logs every ended span as a line of JSON. The ids are formatted like
+    those of OpenTelemetry, so the lines can be joined with other traces.
+
+    :param logger: The logger to log to, `augeias.tracing` by default.
+    """
+
+    def __init__(self, logger=log):
+        self.logger = logger
+
+    def end(self, span):
+        self.logger.info(json.dumps({
+            'name': span.name,
+            'trace_id': span.trace_id,
+            'span_id': span.span_id,
+            'parent_id': span.parent.span_id if span.parent is not None else None,
+            'start': span.start_time,
+            'duration': span.duration,
+            'attributes': span.attributes,
+            'error': span.error,
+        }, default=str))
+
+
+class OpenTelemetrySink(SpanSink):
+    """
+    Hands the spans to the OpenTelemetry SDK, which exports them as it is
+    configured to. Needs `opentelemetry-api`.
+
+    :param tracer: The tracer to create spans with, the tracer of
+        `augeias` by default.
+    """
+
+    def __init__(self, tracer=None):
+        from opentelemetry import trace
+        self._trace = trace
+        self.tracer = tracer or trace.get_tracer('augeias')
+
+    def start(self, span):
+        parent = span.parent.sink_data if span.parent is not None else None
+        context = self._trace.set_span_in_context(parent) if parent is not None else None
+        span.sink_data = self.tracer.start_span(
+            span.name, context=context, start_time=int(span.start_time * 1e9))
+
+    def end(self, span):
+        otel_span = span.sink_data
+        otel_span.set_attributes({k: _otel_value(v) for k, v in span.attributes.items()})
+        if span.error is not None:
+            otel_span.set_status(self._trace.Status(self._trace.StatusCode.ERROR, span.error))
+        otel_span.end(end_time=int((span.start_time + span.duration) * 1e9))
+
+
+def _otel_value(value):
+    return value if isinstance(value, (bool, int, float, str)) else str(value)
+
+
+#: Sinks that can be configured by name.
+SINKS = {
+    'log': LoggingSink,
+    'opentelemetry': OpenTelemetrySink,
+}
+
+
+def tracing_tween_factory(handler, registry):
+    """
+    A tween that makes the sink of the application current and starts the
+    root span of the trace of every request, so the spans of a request are
+    grouped.
+
+    A body that is generated while it is sent, eg. a zip of a container, is
+    generated within the trace of the request, and the request span ends
+    when the body is closed.
+    """
+    sink = registry.tracing_sink
+
+    def tracing_tween(request):
+        token = _current_sink.set(sink)
+        try:
+            request_span = span('request', method=request.method, path=request.path)
+            span_token = _current_span.set(request_span)
+            try:
+                response = handler(request)
+                matched_route = getattr(request, 'matched_route', None)
+                if matched_route is not None:
+                    request_span.set_attribute('route', matched_route.name)
+                request_span.set_attribute('status', response.status_int)
+                streamed = isinstance(response.app_iter, types.GeneratorType)
+                if streamed:
+                    response.app_iter = _TracedBody(
+                        contextvars.copy_context(), response.app_iter, request_span)
+            except BaseException as e:
+                request_span.end(e)
+                raise
+            finally:
+                _current_span.reset(span_token)
+            if not streamed:
+                request_span.end()
+            return response
+        finally:
+            _current_sink.reset(token)
+
+    return tracing_tween
+
+
+class _TracedBody:
+    """
+    Generates a body in the context of its request, and ends the request
+    span when the body is closed.
+    """
+
+    def __init__(self, context, app_iter, request_span):
+        self._context = context
+        self._app_iter = app_iter
+        self._span = request_span
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return self._context.run(next, self._app_iter)
+        except StopIteration:
+            raise
+        except BaseException as e:
+            self._span.end(e)
+            raise
+
+    def close(self):
+        try:
+            self._context.run(self._app_iter.close)
+        finally:
+            self._span.end()
+
+
+def _trace_collections(event):
+    from augeias.stores.TracingStore import TracingStore
+
+    for collection in event.app.registry.collections.values():
+        if not isinstance(collection.object_store, TracingStore):
+            collection.object_store = TracingStore(collection.object_store, collection.name)
+
+
+def _configured_sink(config):
+    setting = config.get_settings().get('augeias.tracing')
+    if isinstance(setting, str):
+        setting = setting.strip()
+    if setting is None or isinstance(setting, bool) or \
+            (isinstance(setting, str) and setting.lower() in truthy | falsey | {''}):
+        if not asbool(setting):
+            return None
+        setting = 'log'
+    sink = SINKS.get(setting) or config.maybe_dotted(setting)
+    return sink() if callable(sink) else sink
+
+
+def includeme(config):
+    """
+    Keep the sink `augeias.tracing` names in the registry, start a trace for
+    every request and wrap the stores of all collections in a
+    :class:`~augeias.stores.TracingStore.TracingStore` once the application
+    has been created. Nothing is traced when `augeias.tracing` is false.
+    """
+    sink = _configured_sink(config)
+    if sink is None:
+        return
+    config.registry.tracing_sink = sink
+    config.add_tween('augeias.tracing.tracing_tween_factory')
+    config.add_subscriber(_trace_collections, ApplicationCreated)
@@ -1,15 +1,46 @@
+import heapq
 import io
+import json
+import shutil
 import tarfile
+import tempfile
 import uuid
 import zipfile
+from collections import namedtuple
+from urllib.parse import urlencode
 
 from pyramid.httpexceptions import HTTPBadRequest
 from pyramid.httpexceptions import HTTPLengthRequired
 from pyramid.httpexceptions import HTTPNotFound
+from pyramid.httpexceptions import HTTPUnsupportedMediaType
+from pyramid.response import FileIter
 from pyramid.response import Response
 from pyramid.view import view_config
 
+from augeias.archives import open_archive
+from augeias.archives import open_archive_member
+from augeias.archives import replace_zip_member
+from augeias.responses import BLOCK_SIZE
+from augeias.responses import is_conditional
+from augeias.responses import not_modified
+from augeias.responses import requested_ranges
+from augeias.responses import set_file_body
+from augeias.responses import set_object_validators
+from augeias.responses import weak_etag
 from augeias.stores.error import NotFoundException
+from augeias.stores.error import OffsetMismatchException
+
+
+ObjectLocation = namedtuple(
+    'ObjectLocation', ['object_store', 'container_key', 'object_key'])
+ObjectLocation.__doc__ = "An existing object to use as the data for another object."
+
+#: Content codings an object can be sent in as it is stored.
+CONTENT_CODINGS = ('zstd', 'gzip')
+
+#: Content types of tar archives that can be uploaded in bulk.
+TAR_CONTENT_TYPES = ('application/x-tar', 'application/x-gtar',
+                     'application/gzip', 'application/x-gzip')
 
 
 @view_config(context=NotFoundException, renderer='json')
@@ -18,6 +49,19 @@ def failed_not_found(exc, request):
     return {'message': exc.value}
 
 
+@view_config(context=NotImplementedError, renderer='json')
+def failed_not_implemented(exc, request):
+    request.response.status_int = 501
+    return {'message': str(exc)}
+
+
+@view_config(context=OffsetMismatchException, renderer='json')
+def failed_offset_mismatch(exc, request):
+    request.response.status_int = 409
+    request.response.headers['Upload-Offset'] = str(exc.offset)
+    return {'message': exc.value, 'offset': exc.offset}
+
+
 class ValidationFailure(Exception):
     def __init__(self, msg):
         self.msg = msg
@@ -57,10 +101,9 @@ class AugeiasView:
         collection = _retrieve_collection(self.request)
         container_key = self.request.matchdict['container_key']
         object_key = self.request.matchdict['object_key']
-        if len(object_key) < 3:
-            raise ValidationFailure('The object key must be 3 characters long')
-        collection.object_store.update_object(
-            container_key, object_key, object_data)
+        _validate_object_key(collection.object_store, object_key)
+        _write_object_data(
+            collection.object_store, container_key, object_key, object_data)
         res = Response(content_type='application/json', status=200)
         res.json_body = {
             'container_key': container_key,
@@ -78,6 +121,9 @@ class AugeiasView:
         Update a file in an archive object in the data store.
         """
         file_content = _get_object_data(self.request)
+        if isinstance(file_content, ObjectLocation):
+            file_content = file_content.object_store.get_object(
+                file_content.container_key, file_content.object_key)
         collection = _retrieve_collection(self.request)
         container_key = self.request.matchdict["container_key"]
         object_key = self.request.matchdict["object_key"]
@@ -85,15 +131,18 @@ class AugeiasView:
         if "new_file_name" not in self.request.params:
             raise HTTPBadRequest("new_file_name parameter is required")
         new_file_name = self.request.params["new_file_name"]
-        zip_content = collection.object_store.get_object(
-            container_key, object_key
-        )
-        new_archive = replace_file_in_zip(
-            zip_content, file_to_replace, file_content.read(), new_file_name
-        )
-        collection.object_store.update_object(
-            container_key, object_key, new_archive
-        )
+        size = None if isinstance(file_content, bytes) else self.request.content_length
+        with collection.object_store.open_object(container_key, object_key) as zip_file, \
+                tempfile.TemporaryFile() as new_archive:
+            try:
+                replace_zip_member(zip_file, file_to_replace, file_content,
+                                   new_file_name, new_archive, size)
+            except KeyError:
+                raise HTTPBadRequest("File to replace not found in archive")
+            new_archive.seek(0)
+            collection.object_store.update_object(
+                container_key, object_key, new_archive
+            )
         res = Response(content_type="application/json", status=200)
         res.json_body = {
             "container_key": container_key,
@@ -112,8 +161,8 @@ class AugeiasView:
         collection = _retrieve_collection(self.request)
         container_key = self.request.matchdict["container_key"]
         object_key = str(uuid.uuid4())
-        collection.object_store.update_object(
-            container_key, object_key, object_data)
+        _write_object_data(
+            collection.object_store, container_key, object_key, object_data)
         res = Response(content_type="application/json", status=201)
         res.json_body = {
             "container_key": container_key,
@@ -125,6 +174,146 @@ class AugeiasView:
         }
         return res
 
+    @view_config(route_name="bulk_upload", permission="edit")
+    def bulk_upload(self):
+        """
+        Write many objects to a container in one request.
+
+        The body may be:
+        - a multipart form (Content-Type: multipart/form-data), every part is
+            an object with the name of the part as object key,
+        - a tar archive (Content-Type: application/x-tar or application/gzip),
+            read as a stream,
+        - or a zip archive (Content-Type: application/zip).
+
+        Every file of an archive is an object with the name of the file as
+        object key. Objects are written one by one, without unpacking the
+        body in memory. The response lists the result for every object.
+        """
+        collection = _retrieve_collection(self.request)
+        container_key = self.request.matchdict["container_key"]
+        results = []
+        for object_key, object_data in _iter_bulk_objects(self.request):
+            result = {"container_key": container_key, "object_key": object_key}
+            try:
+                _validate_object_key(collection.object_store, object_key)
+            except ValidationFailure as e:
+                result["message"] = "Failed validation: %s" % e.msg
+            else:
+                collection.object_store.update_object(
+                    container_key, object_key, object_data)
+                result["uri"] = collection.uri_generator.generate_object_uri(
+                    collection=collection.name,
+                    container=container_key,
+                    object=object_key)
+            results.append(result)
+        res = Response(content_type="application/json", status=200)
+        res.json_body = results
+        return res
+
+    @view_config(route_name="create_upload", permission="edit")
+    def create_upload(self):
+        """
+        Start a resumable upload of an object.
+
+        The chunks are sent with `PUT` to the upload, each with the `offset`
+        at which it starts, and the object is written when the upload is
+        committed with a `POST`.
+        """
+        collection = _retrieve_collection(self.request)
+        container_key = self.request.matchdict["container_key"]
+        object_key = self.request.matchdict["object_key"]
+        _validate_object_key(collection.object_store, object_key)
+        upload_id = collection.object_store.create_upload(container_key, object_key)
+        res = self._upload_response(collection, upload_id, 0)
+        res.status_int = 201
+        res.location = res.json_body["uri"]
+        return res
+
+    @view_config(route_name="append_upload", permission="edit")
+    def append_upload(self):
+        """
+        Add a chunk to a resumable upload. The `offset` parameter is the
+        number of bytes that were received before the chunk.
+        """
+        collection = _retrieve_collection(self.request)
+        offset = self.request.params.get("offset")
+        if offset is None or not _is_integer(offset) or int(offset) < 0:
+            raise ValidationFailure("The offset must be a non-negative integer")
+        offset = collection.object_store.append_upload(
+            self.request.matchdict["container_key"],
+            self.request.matchdict["object_key"],
+            self.request.matchdict["upload_id"],
+            int(offset), self.request.body_file)
+        return self._upload_response(collection, self.request.matchdict["upload_id"], offset)
+
+    @view_config(route_name="get_upload_offset", permission="edit")
+    def get_upload_offset(self):
+        """Get the number of bytes that were received for a resumable upload."""
+        collection = _retrieve_collection(self.request)
+        upload_id = self.request.matchdict["upload_id"]
+        offset = collection.object_store.get_upload_offset(
+            self.request.matchdict["container_key"],
+            self.request.matchdict["object_key"],
+            upload_id)
+        return self._upload_response(collection, upload_id, offset)
+
+    @view_config(route_name="commit_upload", permission="edit")
+    def commit_upload(self):
+        """Write the object with the data of a resumable upload."""
+        collection = _retrieve_collection(self.request)
+        container_key = self.request.matchdict["container_key"]
+        object_key = self.request.matchdict["object_key"]
+        _validate_object_key(collection.object_store, object_key)
+        collection.object_store.commit_upload(
+            container_key, object_key, self.request.matchdict["upload_id"])
+        res = Response(content_type="application/json", status=200)
+        res.json_body = {
+            "container_key": container_key,
+            "object_key": object_key,
+            "uri": collection.uri_generator.generate_object_uri(
+                collection=collection.name,
+                container=container_key,
+                object=object_key)
+        }
+        return res
+
+    @view_config(route_name="abort_upload", permission="edit")
+    def abort_upload(self):
+        """End a resumable upload and discard the data received so far."""
+        collection = _retrieve_collection(self.request)
+        upload_id = self.request.matchdict["upload_id"]
+        collection.object_store.abort_upload(
+            self.request.matchdict["container_key"],
+            self.request.matchdict["object_key"],
+            upload_id)
+        res = Response(content_type="application/json", status=200)
+        res.json_body = {
+            "container_key": self.request.matchdict["container_key"],
+            "object_key": self.request.matchdict["object_key"],
+            "upload_id": upload_id,
+        }
+        return res
+
+    def _upload_response(self, collection, upload_id, offset):
+        container_key = self.request.matchdict["container_key"]
+        object_key = self.request.matchdict["object_key"]
+        res = Response(content_type="application/json", status=200)
+        res.headers["Upload-Offset"] = str(offset)
+        res.json_body = {
+            "container_key": container_key,
+            "object_key": object_key,
+            "upload_id": upload_id,
+            "offset": offset,
+            "uri": self.request.route_url(
+                "append_upload",
+                collection_key=collection.name,
+                container_key=container_key,
+                object_key=object_key,
+                upload_id=upload_id)
+        }
+        return res
+
     @view_config(route_name='delete_object', permission='edit')
     def delete_object(self):
         """delete an object from the data store"""
@@ -145,30 +334,62 @@ class AugeiasView:
 
     @view_config(route_name='get_object', permission='view')
     def get_object(self):
-        """retrieve an object from the data store"""
+        """
+        retrieve an object from the data store
+
+        Single and multiple byte ranges can be requested with a `Range` header.
+        Objects that are stored compressed are sent with a `Content-Encoding`
+        when the `Accept-Encoding` header allows it. A conditional request is
+        answered from a stat of the object when it is not modified.
+        """
         collection = _retrieve_collection(self.request)
         container_key = self.request.matchdict['container_key']
         object_key = self.request.matchdict['object_key']
-        object_data = collection.object_store.get_object(
-            container_key, object_key)
-        content_type = collection.object_store.get_object_info(
-            container_key, object_key)['mime']
-        res = Response(content_type=content_type, status=200)
-        res.body = object_data
+        if is_conditional(self.request):
+            object_stat = collection.object_store.stat_object(container_key, object_key)
+            res = Response(status=200)
+            if getattr(collection.object_store, 'negotiates_encoding', False):
+                res.vary = ('Accept-Encoding',)
+            set_object_validators(res, object_stat['size'], object_stat['mtime'])
+            if not_modified(self.request, res):
+                return res
+        handle = collection.object_store.open_encoded_object_handle(
+            container_key, object_key, _accepted_encodings(self.request))
+        try:
+            res = Response(content_type=handle.mime, status=200)
+            if handle.negotiated:
+                res.vary = ('Accept-Encoding',)
+            if handle.encoding is not None:
+                res.content_encoding = handle.encoding
+            set_object_validators(res, handle.size, handle.mtime, handle.encoding)
+            if not_modified(self.request, res):
+                handle.close()
+                return res
+            ranges = requested_ranges(self.request, res, handle.size)
+        except BaseException:
+            handle.close()
+            raise
+        set_file_body(self.request, res, handle, handle.size, ranges)
         return res
 
     @view_config(route_name='get_file_from_zip', permission='view')
     def get_object_from_archive(self):
-        """retrieve a file from an archive object from the data store"""
+        """
+        retrieve a file from an archive object from the data store
+
+        Only the requested file is read from the archive and it is streamed.
+        """
         collection = _retrieve_collection(self.request)
         container_key = self.request.matchdict['container_key']
         object_key = self.request.matchdict['object_key']
-        object_data = collection.object_store.get_object(
-            container_key, object_key
-        )
-        file = get_file_from_archive(object_data, self.request.matchdict['file_name'])
+        try:
+            member = collection.object_store.open_archive_member(
+                container_key, object_key, self.request.matchdict['file_name'])
+        except KeyError:
+            raise HTTPBadRequest("File not found in archive")
         res = Response(content_type='application/octet-stream', status=200)
-        res.body = file
+        res.app_iter = FileIter(member, BLOCK_SIZE)
+        res.content_length = member.size
         return res
 
     @view_config(route_name='get_object_info', permission='view')
@@ -178,18 +399,83 @@ class AugeiasView:
         container_key = self.request.matchdict['container_key']
         object_key = self.request.matchdict['object_key']
         res = Response(content_type='application/json', status=200)
+        object_stat = collection.object_store.stat_object(
+            container_key, object_key)
+        set_object_validators(res, object_stat['size'], object_stat['mtime'])
+        if not_modified(self.request, res):
+            return res
         res.json_body = collection.object_store.get_object_info(
             container_key, object_key)
         return res
 
     @view_config(route_name='list_object_keys_for_container', permission='view')
     def list_object_keys_for_container(self):
-        """list all object keys for a container in the data store"""
+        """
+        list all object keys for a container in the data store
+
+        With `include=info` the object info of every object is listed as well.
+        With `limit` and/or `cursor` the keys are sorted and listed a page at
+        a time. A `Link` header refers to the next page.
+        """
         collection = _retrieve_collection(self.request)
         container_key = self.request.matchdict['container_key']
+        limit, cursor = _get_page_parameters(self.request)
+        paged = limit is not None or cursor is not None
+        if self.request.params.get('include') == 'info':
+            return self._list_object_info_for_container(
+                collection, container_key, limit, cursor)
+        if paged:
+            object_keys, has_next = _page(
+                collection.object_store.iter_object_keys_for_container(container_key),
+                limit, cursor)
+        else:
+            object_keys = collection.object_store.list_object_keys_for_container(
+                container_key)
+            has_next = False
+        res = Response(content_type='application/json', status=200)
+        res.etag = weak_etag(*sorted(object_keys), has_next)
+        if has_next:
+            _set_next_link(self.request, res, object_keys[-1])
+        if not_modified(self.request, res):
+            return res
+        res.json_body = object_keys
+        return res
+
+    def _list_object_info_for_container(self, collection, container_key, limit, cursor):
+        object_info = collection.object_store.list_object_info_for_container(
+            container_key)
+        object_keys, has_next = _page(object_info, limit, cursor) \
+            if limit is not None or cursor is not None else (list(object_info), False)
         res = Response(content_type='application/json', status=200)
-        res.json_body = collection.object_store.list_object_keys_for_container(
+        res.etag = weak_etag(*sorted(
+            (object_key, object_info[object_key]['size'],
+             object_info[object_key]['time_last_modification'])
+            for object_key in object_keys
+        ), has_next)
+        if has_next:
+            _set_next_link(self.request, res, object_keys[-1])
+        if not_modified(self.request, res):
+            return res
+        res.json_body = [
+            dict(object_info[object_key], object_key=object_key)
+            for object_key in object_keys
+        ]
+        return res
+
+    @view_config(route_name='stream_object_keys_for_container', permission='view')
+    def stream_object_keys_for_container(self):
+        """
+        stream all object keys for a container as newline delimited JSON
+
+        The keys are sent while the container is listed, in no particular
+        order.
+        """
+        collection = _retrieve_collection(self.request)
+        container_key = self.request.matchdict['container_key']
+        object_keys = collection.object_store.iter_object_keys_for_container(
             container_key)
+        res = Response(content_type='application/x-ndjson', status=200)
+        res.app_iter = _iter_ndjson(object_keys)
         return res
 
     @view_config(route_name='get_container_data', permission='view')
@@ -198,9 +484,6 @@ class AugeiasView:
         parameters = self.request.GET
         collection = _retrieve_collection(self.request)
         container_key = self.request.matchdict['container_key']
-        zip_file = collection.object_store.get_container_data(
-            container_key, translations=parameters
-        )
         filename = str(container_key) + '.zip'
         disposition = (f'attachment; filename={filename}')
         res = Response(
@@ -208,7 +491,34 @@ class AugeiasView:
             status=200,
             content_disposition=disposition
         )
-        res.body = zip_file.read()
+        _set_container_validators(
+            res, collection.object_store, container_key, parameters)
+        if not_modified(self.request, res):
+            return res
+        res.app_iter = collection.object_store.iter_container_data(
+            container_key, translations=parameters
+        )
+        return res
+
+    @view_config(route_name='list_container_keys', permission='view')
+    def list_container_keys(self):
+        """
+        list the keys of the containers in a collection
+
+        The keys are sorted and listed a page at a time with `limit` and
+        `cursor`. A `Link` header refers to the next page.
+        """
+        collection = _retrieve_collection(self.request)
+        limit, cursor = _get_page_parameters(self.request)
+        container_keys, has_next = _page(
+            collection.object_store.list_container_keys(), limit, cursor)
+        res = Response(content_type='application/json', status=200)
+        res.etag = weak_etag(*container_keys, has_next)
+        if has_next:
+            _set_next_link(self.request, res, container_keys[-1])
+        if not_modified(self.request, res):
+            return res
+        res.json_body = container_keys
         return res
 
     @view_config(route_name='create_container', permission='edit')
@@ -268,6 +578,16 @@ def _is_integer(s):
         return False
 
 
+def _validate_object_key(store, object_key):
+    if len(object_key) < 3:
+        raise ValidationFailure('The object key must be 3 characters long')
+    if '/' in object_key:
+        raise ValidationFailure('The object key can not contain a /')
+    prefix = store.reserved_key_prefix
+    if prefix is not None and object_key.startswith(prefix):
+        raise ValidationFailure('The object key can not start with %s' % prefix)
+
+
 def _get_object_data(request):
     if request.content_type == 'application/json':
         return _get_object_data_from_json_body(request)
@@ -305,12 +625,127 @@ def _get_object_data_from_json_body(request):
         raise HTTPBadRequest('Collection {} was not found'.format(
             json_data['collection_key']))
     try:
-        object_data = collection.object_store.get_object(
+        collection.object_store.stat_object(
             json_data['container_key'], json_data['object_key'])
     except NotFoundException:
         raise HTTPBadRequest('Container - object ({} - {}) combination was not found in Collection {}'.format(
             json_data['container_key'], json_data['object_key'], json_data['collection_key']))
-    return object_data
+    return ObjectLocation(
+        collection.object_store, json_data['container_key'], json_data['object_key'])
+
+
+def _write_object_data(object_store, container_key, object_key, object_data):
+    """
+    Write object data as returned by :func:`_get_object_data`. An object in
+    a store is copied by the store itself.
+    """
+    if isinstance(object_data, ObjectLocation):
+        object_store.copy_object(
+            object_data.object_store, object_data.container_key,
+            object_data.object_key, container_key, object_key)
+    else:
+        object_store.update_object(container_key, object_key, object_data)
+
+
+def _iter_bulk_objects(request):
+    """
+    Yield the object key and the data of every object in the body of a bulk
+    upload.
+
+    A tar archive is read as a stream. A zip archive can only be read from
+    a seekable file, so it is written to a temporary file first.
+    """
+    if request.content_type == 'multipart/form-data':
+        for name, value in request.POST.items():
+            if isinstance(value, str):
+                yield name, value.encode('utf-8')
+            else:
+                yield name, value.file
+    elif request.content_type in TAR_CONTENT_TYPES:
+        try:
+            with tarfile.open(fileobj=request.body_file, mode='r|*') as archive:
+                for member in archive:
+                    if member.isfile():
+                        name = member.name[2:] if member.name.startswith('./') \
+                            else member.name
+                        yield name, archive.extractfile(member)
+        except tarfile.TarError as e:
+            raise HTTPBadRequest('Invalid tar archive: %s' % e)
+    elif request.content_type == 'application/zip':
+        with tempfile.TemporaryFile() as body:
+            shutil.copyfileobj(request.body_file, body)
+            body.seek(0)
+            try:
+                archive = zipfile.ZipFile(body)
+            except zipfile.BadZipFile as e:
+                raise HTTPBadRequest('Invalid zip archive: %s' % e)
+            with archive:
+                for info in archive.infolist():
+                    if not info.is_dir():
+                        with archive.open(info) as member:
+                            yield info.filename, member
+    else:
+        raise HTTPUnsupportedMediaType(
+            'The body must be a multipart form, a tar or a zip archive')
+
+
+def _accepted_encodings(request):
+    """
+    Get the content codings of :data:`CONTENT_CODINGS` the client accepts,
+    most preferred first. Without an `Accept-Encoding` header only the
+    identity is accepted.
+    """
+    if 'Accept-Encoding' not in request.headers:
+        return []
+    return [coding for coding, q in
+            request.accept_encoding.acceptable_offers(CONTENT_CODINGS)]
+
+
+def _get_page_parameters(request):
+    """
+    Get the `limit` and the `cursor` of a paged listing.
+    """
+    limit = request.params.get('limit')
+    if limit is not None:
+        if not _is_integer(limit) or int(limit) < 1:
+            raise ValidationFailure('The limit must be a positive integer')
+        limit = int(limit)
+    return limit, request.params.get('cursor')
+
+
+def _page(object_keys, limit, cursor):
+    """
+    Select a page of object or container keys in sorted order.
+
+    Only the keys of the page are kept in memory, not all keys.
+
+    :param object_keys: An iterable of keys, in any order.
+    :param int limit: Maximum number of keys of the page, or `None`.
+    :param str cursor: Only keys after this one are selected, or `None`.
+    :return: The sorted keys of the page and whether there are more keys.
+    """
+    if cursor is not None:
+        object_keys = (key for key in object_keys if key > cursor)
+    if limit is None:
+        return sorted(object_keys), False
+    page = heapq.nsmallest(limit + 1, object_keys)
+    return page[:limit], len(page) > limit
+
+
+def _set_next_link(request, response, cursor):
+    params = dict(request.GET, cursor=cursor)
+    response.headers['Link'] = '<{}?{}>; rel="next"'.format(
+        request.path_url, urlencode(params))
+
+
+def _iter_ndjson(items):
+    try:
+        for item in items:
+            yield json.dumps(item).encode('utf-8') + b'\n'
+    finally:
+        close = getattr(items, 'close', None)
+        if close is not None:
+            close()
 
 
 def _get_json_from_request(request):
@@ -324,6 +759,25 @@ def _get_json_from_request(request):
             detail="Request has incorrect json body. \n%s" % e)
 
 
+def _set_container_validators(response, object_store, container_key, translations):
+    """
+    Set a weak `ETag` and `Last-Modified` for a zip of (part of) a container,
+    based on the size and time of last modification of its objects.
+    """
+    object_keys = translations.keys() if translations else \
+        object_store.list_object_keys_for_container(container_key)
+    validators = []
+    for object_key in sorted(object_keys):
+        object_stat = object_store.stat_object(container_key, object_key)
+        validators.append((
+            object_key, translations.get(object_key, object_key),
+            object_stat['size'], object_stat['mtime']
+        ))
+    response.etag = weak_etag(*validators)
+    if validators:
+        response.last_modified = max(v[3] for v in validators)
+
+
 def _retrieve_collection(request):
     collection_name = request.matchdict['collection_key']
     if collection_name in request.registry.collections:
@@ -333,20 +787,24 @@ def _retrieve_collection(request):
     return collection
 
 
-def get_file_from_archive(archive_bytes, file_name):
+def get_file_from_archive(archive, file_name):
     """
     get a file from a zip/tar in the data store
 
-    :param container_key: key of the container in the data store
-    :param object_key: specific object key for the object in the container
+    :param archive: content of the archive, as bytes or a seekable file-like object
     :param file_name: name of the file to get from the zip
-    :return content of the file or None
+    :return content of the file
     """
-    archive_bytes_as_file = io.BytesIO(archive_bytes)
-    for name, file_bytes in get_archive_members(archive_bytes_as_file):
-        if name == file_name:
-            return file_bytes
-    raise HTTPBadRequest("File not found in archive")
+    if isinstance(archive, bytes):
+        archive = io.BytesIO(archive)
+    try:
+        member = open_archive_member(archive, file_name)
+    except KeyError:
+        raise HTTPBadRequest("File not found in archive")
+    try:
+        return member.read()
+    finally:
+        member.close()
 
 
 def get_archive_members(archive_content):
@@ -366,51 +824,23 @@ def get_archive_members(archive_content):
                 yield member.name, f.read()
 
 
-def open_archive(archive_content):
-    """
-    Open a zip or tar archive
-
-    :param archive_content: content of the archive
-    :return: the opened archive
-    """
-    if zipfile.is_zipfile(archive_content):
-        archive_content.seek(0)  # the zip check actually reads the bytes, so reset.
-        return zipfile.ZipFile(archive_content)
-    else:
-        archive_content.seek(0)
-        return tarfile.open(fileobj=archive_content)
-
-
 def replace_file_in_zip(zip_content, file_to_replace, file_content, new_file_name):
     """
     Replace a file in a zip file with new content
 
+    The other files are copied without decompressing them, see
+    :func:`augeias.archives.replace_zip_member`.
+
     :param zip_content: content of the original zip file
     :param file_to_replace: name of the file to replace
     :param file_content: content of the new file
     :param new_file_name: name of the new file
     :return: content of the updated zip file
     """
-    with io.BytesIO(zip_content) as original_zip_buffer:
-        with zipfile.ZipFile(original_zip_buffer, "r") as original_zip:
-            # Create a new in-memory zip file
-            with io.BytesIO() as new_zip_buffer:
-                with zipfile.ZipFile(
-                    new_zip_buffer, "a", zipfile.ZIP_DEFLATED
-                ) as new_zip:
-                    current_file_names = original_zip.namelist()
-                    if file_to_replace not in current_file_names:
-                        raise HTTPBadRequest("File to replace not found in archive")
-                    for filename in current_file_names:
-                        # Skip the file to be replaced
-                        if filename == file_to_replace:
-                            continue
-                        # Copy all other files
-                        content = original_zip.read(filename)
-                        new_zip.writestr(filename, content)
-                    # Add the new file
-                    new_zip.writestr(new_file_name, file_content)
-                # Get the content of the new zip file
-                updated_zip_content = new_zip_buffer.getvalue()
-
-    return updated_zip_content
+    with io.BytesIO(zip_content) as original_zip_buffer, io.BytesIO() as new_zip_buffer:
+        try:
+            replace_zip_member(original_zip_buffer, file_to_replace, file_content,
+                               new_file_name, new_zip_buffer)
+        except KeyError:
+            raise HTTPBadRequest("File to replace not found in archive")
+        return new_zip_buffer.getvalue()
@@ -0,0 +1,147 @@
+"""
+This module provides a zip writer that produces an archive as a stream of
+chunks, so it can be sent while it is being written.
+"""
+import collections
+import time
+import zipfile
+from collections import namedtuple
+from io import BytesIO
+
+from augeias.tracing import span
+
+CHUNK_SIZE = 64 * 1024
+
+#: Members up to this size are read into memory completely when they are read
+#: ahead, larger members are only opened.
+READ_AHEAD_MAX_SIZE = 1024 * 1024
+
+#: Earliest timestamp that can be stored in a zip file (1980-01-01).
+_ZIP_EPOCH = time.mktime((1980, 1, 1, 0, 0, 0, 0, 0, -1))
+
+ZipMember = namedtuple('ZipMember', ['name', 'size', 'mtime', 'open'])
+ZipMember.__doc__ = """
+A member to write to a zip stream.
+
+:param str name: Name of the file in the archive.
+:param int size: Size of the file in bytes.
+:param float mtime: Time of last modification as a POSIX timestamp.
+:param open: Callable without arguments that returns a binary file-like
+    object with the content of the file.
+"""
+
+
+class _ChunkWriter:
+    """
+    An unseekable file-like object that collects what is written to it.
+
+    :class:`zipfile.ZipFile` writes a data descriptor after every member when
+    the file it writes to can not seek, so nothing has to be patched after it
+    has been written.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _open_ahead(member):
+    src = member.open()
+    if member.size > READ_AHEAD_MAX_SIZE:
+        return src
+    with src:
+        return BytesIO(src.read())
+
+
+def _read_ahead(members, executor, read_ahead):
+    """
+    Open members in `executor`, up to `read_ahead` members ahead of the one
+    that is being consumed.
+
+    :return: A generator of `(member, opened file)` tuples, in the order of
+        `members`.
+    """
+    pending = collections.deque()
+    try:
+        for member in members:
+            pending.append((member, executor.submit(_open_ahead, member)))
+            if len(pending) > read_ahead:
+                member, future = pending.popleft()
+                yield member, future.result()
+        while pending:
+            member, future = pending.popleft()
+            yield member, future.result()
+    finally:
+        for _, future in pending:
+            if not future.cancel() and future.exception() is None:
+                future.result().close()
+
+
+def stream_zip(members, chunk_size=CHUNK_SIZE, executor=None, read_ahead=0):
+    """
+    Write a zip archive as a stream of chunks.
+
+    Every member is read in chunks of `chunk_size` and the written bytes are
+    yielded right away, so memory usage does not depend on the size of the
+    members. Zip64 extensions are used for members that need them.
+
+    With an `executor`, the next `read_ahead` members are opened concurrently
+    while a member is being written, and read completely when they are no
+    larger than :data:`READ_AHEAD_MAX_SIZE`. This hides the latency of
+    opening many small files. The members are written in the same order.
+
+    A `zip.write_member` span is reported for every member, see
+    :mod:`augeias.tracing`. It includes the time the consumer of the stream
+    spends between chunks.
+
+    :param members: An iterable of :class:`ZipMember`.
+    :param int chunk_size: Number of bytes to read from a member at a time.
+    :param executor: A :class:`concurrent.futures.Executor` to open members in.
+    :param int read_ahead: Number of members to open ahead.
+    :return: A generator of byte strings that make up the archive.
+    """
+    if executor is not None and read_ahead > 0:
+        opened = _read_ahead(members, executor, read_ahead)
+    else:
+        opened = ((member, None) for member in members)
+    writer = _ChunkWriter()
+    try:
+        with zipfile.ZipFile(writer, 'w') as zf:
+            for member, src in opened:
+                date_time = time.localtime(max(member.mtime, _ZIP_EPOCH))[:6]
+                zinfo = zipfile.ZipInfo(member.name, date_time)
+                # Knowing the size upfront lets zipfile decide whether zip64 is needed.
+                zinfo.file_size = member.size
+                # Not the parent of other spans, as it is open across yields.
+                member_span = span('zip.write_member', member=member.name, size=member.size)
+                try:
+                    with src or member.open() as src, zf.open(zinfo, 'w') as dst:
+                        chunk = src.read(chunk_size)
+                        while chunk:
+                            dst.write(chunk)
+                            yield writer.pop()
+                            chunk = src.read(chunk_size)
+                except BaseException as e:
+                    member_span.end(e)
+                    raise
+                member_span.end()
+                yield writer.pop()
+        yield writer.pop()
+    finally:
+        opened.close()
@@ -26,11 +26,10 @@ setup(name='augeias',
           "Framework :: Pyramid",
           "Topic :: Internet :: WWW/HTTP",
           "Topic :: Internet :: WWW/HTTP :: WSGI :: Application",
-          "Programming Language :: Python :: 3.6",
           "Programming Language :: Python :: 3.7",
           "Programming Language :: Python :: 3.8",
       ],
-      python_requires='>=3.6',
+      python_requires='>=3.7',
       author='Flanders Heritage Agency',
       author_email='ict@onroerenderfgoed.be',
       url='https://augeias.readthedocs.org',
@@ -40,6 +39,11 @@ setup(name='augeias',
       include_package_data=True,
       zip_safe=False,
       install_requires=requires,
+      extras_require={
+          'ceph': ['boto3'],
+          'zstd': ['zstandard'],
+          'opentelemetry': ['opentelemetry-api'],
+      },
       tests_require=requires,
       test_suite="augeias",
       entry_points="""\
@@ -47,5 +51,9 @@ setup(name='augeias',
       augeias = augeias.scaffolds:AugeiasTemplate
       [paste.app_factory]
       main = augeias:main
+      [console_scripts]
+      augeias_backfill_mime = augeias.scripts.backfill_mime:main
+      augeias_collect_garbage = augeias.scripts.collect_garbage:main
+      augeias_metadata_index = augeias.scripts.metadata_index:main
       """,
       )
@@ -0,0 +1,170 @@
+import gzip
+import io
+import os
+import tarfile
+import unittest
+import zipfile
+
+from augeias.archives import GzipCheckpoints
+from augeias.archives import GzipReader
+from augeias.archives import build_tar_index
+from augeias.archives import open_archive_member
+from augeias.archives import replace_zip_member
+from augeias.zipstream import ZipMember
+from augeias.zipstream import stream_zip
+
+
+def _zip(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        for name, data in files:
+            zf.writestr(name, data)
+    return buffer.getvalue()
+
+
+def _tar(files, mode='w'):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode=mode) as tf:
+        for name, data in files:
+            tarinfo = tarfile.TarInfo(name)
+            tarinfo.size = len(data)
+            tf.addfile(tarinfo, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+class OpenArchiveMemberTests(unittest.TestCase):
+
+    def test_open_zip_member_skips_other_members(self):
+        archive = bytearray(_zip([('first.txt', b'a' * 100), ('last.txt', b'last')]))
+        # corrupt the data of the first member, it should never be read
+        start = archive.index(b'a' * 100)
+        archive[start:start + 100] = b'b' * 100
+        archive_file = io.BytesIO(bytes(archive))
+        member = open_archive_member(archive_file, 'last.txt')
+        self.assertEqual(4, member.size)
+        self.assertEqual(b'last', member.read())
+        member.close()
+        self.assertTrue(archive_file.closed)
+
+    def test_open_tar_member(self):
+        archive_file = io.BytesIO(_tar([('first.txt', b'first'), ('last.txt', b'last')]))
+        member = open_archive_member(archive_file, 'last.txt')
+        self.assertEqual(4, member.size)
+        self.assertEqual(b'last', member.read())
+        member.close()
+        self.assertTrue(archive_file.closed)
+
+    def test_open_archive_member_not_found(self):
+        self.assertRaises(KeyError, open_archive_member,
+                          io.BytesIO(_zip([('a.txt', b'a')])), 'b.txt')
+        self.assertRaises(KeyError, open_archive_member,
+                          io.BytesIO(_tar([('a.txt', b'a')])), 'b.txt')
+
+    def test_open_indexed_tar_member(self):
+        archive_file = io.BytesIO(_tar([('first.txt', b'first'), ('last.txt', b'last')]))
+        index = build_tar_index(archive_file)
+        self.assertEqual('tar', index['format'])
+        member = open_archive_member(archive_file, 'last.txt', index)
+        self.assertEqual(b'la', member.read(2))
+        self.assertEqual(b'st', member.read())
+        self.assertEqual(b'', member.read())
+        self.assertRaises(KeyError, open_archive_member, archive_file, 'other.txt', index)
+
+    def test_open_indexed_gzip_member(self):
+        files = [(f'{i}.txt', os.urandom(10000)) for i in range(20)]
+        archive_file = io.BytesIO(_tar(files, 'w:gz'))
+        checkpoints = GzipCheckpoints(spacing=50000)
+        index = build_tar_index(archive_file, checkpoints)
+        self.assertEqual('gzip', index['format'])
+        self.assertEqual(20, len(index['members']))
+        self.assertGreater(len(checkpoints), 2)
+        for name, data in reversed(files):
+            member = open_archive_member(archive_file, name, index, checkpoints)
+            self.assertEqual(10000, member.size)
+            self.assertEqual(data, member.read())
+
+    def test_build_tar_index_not_a_tar(self):
+        self.assertIsNone(build_tar_index(io.BytesIO(_zip([('a.txt', b'a')]))))
+        self.assertIsNone(build_tar_index(io.BytesIO(b'not an archive' * 100)))
+        self.assertIsNone(build_tar_index(io.BytesIO(gzip.compress(b'not an archive' * 100))))
+
+
+class ReplaceZipMemberTests(unittest.TestCase):
+
+    def _zip(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as zf:
+            zf.writestr('stored.txt', b'stored' * 100, zipfile.ZIP_STORED)
+            zf.writestr('deflated.txt', b'deflated' * 100, zipfile.ZIP_DEFLATED)
+            zf.writestr('bzip2.txt', b'bzip2' * 100, zipfile.ZIP_BZIP2)
+            zf.writestr('old.txt', b'old')
+            zf.comment = b'comment'
+        return buffer.getvalue()
+
+    def test_replace_copies_other_members_as_they_are(self):
+        original = self._zip()
+        target = io.BytesIO()
+        replace_zip_member(io.BytesIO(original), 'old.txt', b'new', 'new.txt', target)
+        with zipfile.ZipFile(io.BytesIO(original)) as source, \
+                zipfile.ZipFile(target) as result:
+            self.assertIsNone(result.testzip())
+            self.assertEqual(
+                ['stored.txt', 'deflated.txt', 'bzip2.txt', 'new.txt'], result.namelist())
+            self.assertEqual(b'new', result.read('new.txt'))
+            self.assertEqual(b'comment', result.comment)
+            for name in ('stored.txt', 'deflated.txt', 'bzip2.txt'):
+                zinfo = source.getinfo(name)
+                self.assertEqual(zinfo.compress_type, result.getinfo(name).compress_type)
+                self.assertEqual(source.read(name), result.read(name))
+                start = zinfo.header_offset
+                raw = original[start:start + 30 + len(name) + zinfo.compress_size]
+                self.assertIn(raw, target.getvalue())
+
+    def test_replace_with_data_descriptors(self):
+        members = [
+            ZipMember(name, len(data), 0, lambda data=data: io.BytesIO(data))
+            for name, data in (('a.txt', b'a' * 100), ('b.txt', b'b'), ('c.txt', b'c'))
+        ]
+        original = b''.join(stream_zip(members))
+        target = io.BytesIO()
+        replace_zip_member(io.BytesIO(original), 'b.txt', io.BytesIO(b'new'), 'b.txt', target)
+        with zipfile.ZipFile(target) as result:
+            self.assertIsNone(result.testzip())
+            self.assertEqual(['a.txt', 'c.txt', 'b.txt'], result.namelist())
+            self.assertEqual(b'a' * 100, result.read('a.txt'))
+            self.assertEqual(b'new', result.read('b.txt'))
+
+    def test_replace_not_found(self):
+        self.assertRaises(KeyError, replace_zip_member, io.BytesIO(self._zip()),
+                          'other.txt', b'new', 'new.txt', io.BytesIO())
+
+
+class GzipReaderTests(unittest.TestCase):
+
+    def setUp(self):
+        self.data = os.urandom(300000)
+        self.compressed = gzip.compress(self.data[:100000]) + gzip.compress(self.data[100000:])
+
+    def test_read_concatenated_members(self):
+        reader = GzipReader(io.BytesIO(self.compressed + b'\0' * 10))
+        self.assertEqual(self.data, reader.read())
+
+    def test_read_from_checkpoint(self):
+        checkpoints = GzipCheckpoints(spacing=30000)
+        GzipReader(io.BytesIO(self.compressed), checkpoints).read()
+        self.assertGreater(len(checkpoints), 3)
+        for offset in (0, 1, 99999, 100000, 250000, 299999):
+            reader = GzipReader(io.BytesIO(self.compressed), checkpoints, offset)
+            self.assertEqual(self.data[offset:offset + 1000], reader.read(1000))
+
+    def test_checkpoints_are_limited(self):
+        checkpoints = GzipCheckpoints(spacing=10000, max_checkpoints=4)
+        GzipReader(io.BytesIO(self.compressed), checkpoints).read()
+        self.assertLessEqual(len(checkpoints), 4)
+        self.assertGreater(checkpoints.spacing, 10000)
+        for offset in (0, 99999, 100000, 250000, 299999):
+            reader = GzipReader(io.BytesIO(self.compressed), checkpoints, offset)
+            self.assertEqual(self.data[offset:offset + 1000], reader.read(1000))
+
+    def test_offset_beyond_end(self):
+        self.assertRaises(EOFError, GzipReader, io.BytesIO(self.compressed), None, 400000)
@@ -0,0 +1,119 @@
+import asyncio
+import os
+import unittest
+
+import tempdir
+
+from augeias.asgi import AsgiApp
+from augeias.asgi import build_environ
+from augeias.asgi import main
+from tests.test_functional import collections_include
+from tests.test_functional import settings
+
+
+def _request(app, method, path, body=b'', headers=(), query_string=b'', chunk_size=None):
+    chunk_size = chunk_size or len(body) or 1
+    messages = [
+        {'type': 'http.request', 'body': body[i:i + chunk_size],
+         'more_body': i + chunk_size < len(body)}
+        for i in range(0, max(len(body), 1), chunk_size)
+    ]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        'type': 'http',
+        'http_version': '1.1',
+        'method': method,
+        'path': path,
+        'root_path': '',
+        'scheme': 'http',
+        'query_string': query_string,
+        'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+        'client': ('127.0.0.1', 12345),
+        'server': ('localhost', 6543),
+    }
+    asyncio.run(app(scope, receive, send))
+    return sent
+
+
+class AsgiTests(unittest.TestCase):
+
+    def setUp(self):
+        self.temp = tempdir.TempDir()
+        store_dir = os.path.join(os.path.abspath(self.temp.name), 'test_data')
+        self.app = main({}, **dict(settings, **{'augeias.asgi.max_workers': '2'}))
+        collections_include(self.app.wsgi_app, store_dir)
+
+    def tearDown(self):
+        self.app.executor.shutdown()
+        self.temp.dissolve()
+
+    def test_put_and_get_object(self):
+        container = '/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID'
+        sent = _request(self.app, 'PUT', container)
+        self.assertEqual(200, sent[0]['status'])
+        data = os.urandom(200000)
+        sent = _request(self.app, 'PUT', container + '/200x300', data,
+                        headers=[('Content-Length', str(len(data)))], chunk_size=10000)
+        self.assertEqual(200, sent[0]['status'])
+        sent = _request(self.app, 'GET', container + '/200x300')
+        self.assertEqual('http.response.start', sent[0]['type'])
+        self.assertEqual(200, sent[0]['status'])
+        self.assertIn((b'content-length', str(len(data)).encode()), sent[0]['headers'])
+        self.assertGreater(len(sent), 3)
+        self.assertEqual(data, b''.join(message.get('body', b'') for message in sent[1:]))
+        self.assertFalse(sent[-1]['more_body'])
+
+    def test_not_found(self):
+        sent = _request(self.app, 'GET', '/collections/TEST_COLLECTION/containers/x/y')
+        self.assertEqual(404, sent[0]['status'])
+
+    def test_disconnect_before_body(self):
+        sent = []
+
+        async def receive():
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(self.app({'type': 'http', 'method': 'PUT', 'path': '/'}, receive, send))
+        self.assertEqual([], sent)
+
+    def test_lifespan(self):
+        messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        app = AsgiApp(self.app.wsgi_app, max_workers=1)
+        asyncio.run(app({'type': 'lifespan'}, receive, send))
+        self.assertEqual(['lifespan.startup.complete', 'lifespan.shutdown.complete'],
+                         [message['type'] for message in sent])
+
+    def test_build_environ(self):
+        environ = build_environ({
+            'type': 'http',
+            'method': 'GET',
+            'path': '/augeias/collections/é',
+            'root_path': '/augeias',
+            'query_string': b'a=1',
+            'headers': [(b'content-type', b'application/json'), (b'accept', b'a'),
+                        (b'accept', b'b')],
+        }, None)
+        self.assertEqual('/augeias', environ['SCRIPT_NAME'])
+        self.assertEqual('/collections/é'.encode('utf-8').decode('latin-1'), environ['PATH_INFO'])
+        self.assertEqual('a=1', environ['QUERY_STRING'])
+        self.assertEqual('application/json', environ['CONTENT_TYPE'])
+        self.assertEqual('a,b', environ['HTTP_ACCEPT'])
+        self.assertEqual('localhost', environ['SERVER_NAME'])
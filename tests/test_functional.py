@@ -1,19 +1,25 @@
 import ast
+import gzip
 import io
 import json
 import os
 import re
+import tarfile
 import unittest
 import zipfile
 from io import BytesIO
+from unittest import mock
 from zipfile import ZipFile
 
 import tempdir
 from pyramid.paster import get_appsettings
+from webob import Request
 from webtest import TestApp
 
 from augeias import main
 from augeias.collections import Collection
+from augeias.stores.CachingStore import CachingStore
+from augeias.stores.CompressingStore import CompressingStore
 from augeias.stores.PairTreeFileSystemStore import PairTreeFileSystemStore
 
 here = os.path.dirname(__file__)
@@ -121,9 +127,157 @@ class FunctionalTests(unittest.TestCase):
         res = self.testapp.get(
             '/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID/200x300')
         self.assertEqual('200 OK', res.status)
+        self.assertEqual('image/jpeg', res.content_type)
+        self.assertEqual(str(file_size), res.headers['Content-Length'])
         self.assertEqual(file_size, len(res.body))
         self.assertEqual(bdata, res.body)
 
+    def test_get_object_range(self):
+        self.testapp.put(
+            '/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID')
+        testdata = os.path.join(here, '../', 'fixtures/kasteel.jpg')
+        with open(testdata, 'rb') as f:
+            bdata = f.read()
+        self.testapp.put(
+            '/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID/200x300', bdata)
+
+        res = self.testapp.get(
+            '/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID/200x300',
+            headers={'Range': 'bytes=100-199'})
+        self.assertEqual('206 Partial Content', res.status)
+        self.assertEqual('bytes', res.headers['Accept-Ranges'])
+        self.assertEqual('bytes 100-199/11370', res.headers['Content-Range'])
+        self.assertEqual('image/jpeg', res.content_type)
+        self.assertEqual(bdata[100:200], res.body)
+
+        res = self.testapp.get(
+            '/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID/200x300',
+            headers={'Range': 'bytes=0-1,-2'})
+        self.assertEqual('206 Partial Content', res.status)
+        self.assertEqual('multipart/byteranges', res.content_type)
+        self.assertIn(bdata[:2], res.body)
+        self.assertIn(bdata[-2:], res.body)
+
+        res = self.testapp.get(
+            '/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID/200x300',
+            headers={'Range': 'bytes=20000-'}, status=416)
+        self.assertEqual('bytes */11370', res.headers['Content-Range'])
+
+        res = self.testapp.get(
+            '/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID/200x300',
+            headers={'Range': 'bytes=100-199', 'If-Range': '"outdated"'})
+        self.assertEqual('200 OK', res.status)
+        self.assertEqual(bdata, res.body)
+
+    def test_get_object_conditional(self):
+        self.testapp.put(
+            '/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID')
+        testdata = os.path.join(here, '../', 'fixtures/kasteel.jpg')
+        with open(testdata, 'rb') as f:
+            bdata = f.read()
+        self.testapp.put(
+            '/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID/200x300', bdata)
+        url = '/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID/200x300'
+
+        res = self.testapp.get(url)
+        etag = res.headers['ETag']
+        last_modified = res.headers['Last-Modified']
+        store = self.app.registry.collections['TEST_COLLECTION'].object_store
+        with mock.patch.object(store, 'open_encoded_object_handle') as open_handle:
+            res = self.testapp.get(url, headers={'If-None-Match': etag}, status=304)
+            self.assertEqual(b'', res.body)
+            self.assertEqual(etag, res.headers['ETag'])
+            self.assertNotIn('Vary', res.headers)
+            self.testapp.get(url, headers={'If-Modified-Since': last_modified}, status=304)
+            open_handle.assert_not_called()
+        res = self.testapp.get(url, headers={'If-None-Match': '"other"'})
+        self.assertEqual(bdata, res.body)
+        res = self.testapp.get(url, headers={'Range': 'bytes=0-9', 'If-Range': etag})
+        self.assertEqual('206 Partial Content', res.status)
+        self.assertEqual(bdata[:10], res.body)
+
+        res = self.testapp.get(url + '/meta')
+        self.assertEqual(etag, res.headers['ETag'])
+        self.testapp.get(url + '/meta', headers={'If-None-Match': etag}, status=304)
+
+        res = self.testapp.put(url, b'new data')
+        res = self.testapp.get(url, headers={'If-None-Match': etag})
+        self.assertEqual('200 OK', res.status)
+        self.assertNotEqual(etag, res.headers['ETag'])
+
+    def test_get_compressed_object(self):
+        collection = self.app.registry.collections['TEST_COLLECTION']
+        collection.object_store = CompressingStore(collection.object_store)
+        self.testapp.put('/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID')
+        url = '/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID/data.csv'
+        data = b''.join(b'%d;some;test;data\n' % i for i in range(1000))
+        self.testapp.put(url, data)
+
+        # webtest decodes the body, so look at the response of the app itself
+        res = Request.blank(url, headers={'Accept-Encoding': 'gzip, deflate'}).get_response(self.app)
+        self.assertEqual('gzip', res.headers['Content-Encoding'])
+        self.assertEqual('Accept-Encoding', res.headers['Vary'])
+        self.assertEqual(len(res.body), int(res.headers['Content-Length']))
+        self.assertEqual(data, gzip.decompress(res.body))
+        encoded_etag = res.headers['ETag']
+
+        res = self.testapp.get(url)
+        self.assertNotIn('Content-Encoding', res.headers)
+        self.assertEqual('Accept-Encoding', res.headers['Vary'])
+        self.assertEqual('text/plain', res.content_type)
+        self.assertEqual(data, res.body)
+        self.assertNotEqual(encoded_etag, res.headers['ETag'])
+        res = self.testapp.get(url, headers={'Accept-Encoding': 'gzip;q=0'})
+        self.assertEqual(data, res.body)
+        res = self.testapp.get(url, headers={'Range': 'bytes=100-199'})
+        self.assertEqual(data[100:200], res.body)
+        self.testapp.get(url, headers={'Accept-Encoding': 'gzip',
+                                       'If-None-Match': encoded_etag}, status=304)
+        res = self.testapp.get(url, headers={'If-None-Match': res.headers['ETag']}, status=304)
+        self.assertEqual('Accept-Encoding', res.headers['Vary'])
+        res = self.testapp.get(url + '/meta')
+        self.assertEqual(len(data), res.json_body['size'])
+
+    def test_get_compressed_object_through_cache(self):
+        collection = self.app.registry.collections['TEST_COLLECTION']
+        collection.object_store = CachingStore(CompressingStore(collection.object_store),
+                                               max_object_size=1024)
+        self.testapp.put('/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID')
+        url = '/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID/data.csv'
+        data = b''.join(b'%d;some;test;data\n' % i for i in range(10000))
+        self.testapp.put(url, data)
+
+        for _ in range(2):
+            res = Request.blank(url, headers={'Accept-Encoding': 'gzip'}).get_response(self.app)
+            self.assertEqual('gzip', res.headers['Content-Encoding'])
+            self.assertEqual('Accept-Encoding', res.headers['Vary'])
+            self.assertEqual(data, gzip.decompress(res.body))
+        self.assertEqual(data, self.testapp.get(url).body)
+
+    def test_get_container_conditional(self):
+        self.testapp.put(
+            '/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID')
+        self.testapp.put(
+            '/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID/001', b'data 1')
+        url = '/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID'
+        zip_header = {'Accept': 'application/zip'}
+
+        res = self.testapp.get(url)
+        etag = res.headers['ETag']
+        self.assertTrue(etag.startswith('W/'))
+        self.testapp.get(url, headers={'If-None-Match': etag}, status=304)
+
+        res = self.testapp.get(url, headers=zip_header)
+        zip_etag = res.headers['ETag']
+        self.assertIn('Last-Modified', res.headers)
+        self.testapp.get(url, headers=dict(zip_header, **{'If-None-Match': zip_etag}), status=304)
+        res = self.testapp.get(url + '?001=renamed', headers=dict(zip_header, **{'If-None-Match': zip_etag}))
+        self.assertEqual('200 OK', res.status)
+
+        self.testapp.put(url + '/002', b'data 2')
+        self.testapp.get(url, headers={'If-None-Match': etag}, status=200)
+        self.testapp.get(url, headers=dict(zip_header, **{'If-None-Match': zip_etag}), status=200)
+
     def test_get_object_info(self):
         # create container and add object
         cres = self.testapp.put(
@@ -185,6 +339,63 @@ class FunctionalTests(unittest.TestCase):
         _list = [i.strip() for i in _list]
         self.assertTrue('200x300' in _list and '400x600' in _list)
 
+        res = self.testapp.get(
+            '/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID?include=info')
+        self.assertEqual('200 OK', res.status)
+        object_info = {info['object_key']: info for info in res.json_body}
+        self.assertCountEqual(['200x300', '400x600'], object_info)
+        self.assertEqual(len(bdata), object_info['400x600']['size'])
+        self.assertEqual('image/jpeg', object_info['400x600']['mime'])
+        res = self.testapp.get(
+            '/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID?include=info',
+            headers={'If-None-Match': res.headers['ETag']})
+        self.assertEqual('304 Not Modified', res.status)
+
+    def test_list_object_keys_for_container_paged(self):
+        self.testapp.put('/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID')
+        for object_key in ('ddd', 'bbb', 'aaa', 'ccc', 'eee'):
+            self.testapp.put(
+                '/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID/' + object_key,
+                b'data')
+        res = self.testapp.get(
+            '/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID?limit=2')
+        self.assertEqual(['aaa', 'bbb'], res.json_body)
+        self.assertEqual(
+            '<http://localhost/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID'
+            '?limit=2&cursor=bbb>; rel="next"', res.headers['Link'])
+        res = self.testapp.get(
+            '/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID?limit=2&cursor=bbb')
+        self.assertEqual(['ccc', 'ddd'], res.json_body)
+        res = self.testapp.get(
+            '/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID?limit=2&cursor=ddd')
+        self.assertEqual(['eee'], res.json_body)
+        self.assertNotIn('Link', res.headers)
+        res = self.testapp.get(
+            '/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID'
+            '?include=info&limit=1&cursor=ddd')
+        self.assertEqual(['eee'], [info['object_key'] for info in res.json_body])
+        res = self.testapp.get(
+            '/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID?limit=0',
+            expect_errors=True)
+        self.assertEqual(400, res.status_code)
+
+    def test_stream_object_keys_for_container(self):
+        self.testapp.put('/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID')
+        for object_key in ('aaa', 'bbb'):
+            self.testapp.put(
+                '/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID/' + object_key,
+                b'data')
+        res = self.testapp.get(
+            '/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID',
+            headers={'Accept': 'application/x-ndjson'})
+        self.assertEqual('application/x-ndjson', res.content_type)
+        self.assertCountEqual(
+            ['aaa', 'bbb'], [json.loads(line) for line in res.text.splitlines()])
+        res = self.testapp.get(
+            '/collections/TEST_COLLECTION/containers/NO_CONTAINER',
+            headers={'Accept': 'application/x-ndjson'}, expect_errors=True)
+        self.assertEqual(404, res.status_code)
+
     def test_download_container_zip(self):
         # create container and add objects
         cres = self.testapp.put(
@@ -382,6 +593,26 @@ class FunctionalTests(unittest.TestCase):
             '/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID')
         self.assertEqual('200 OK', res.status)
 
+    def test_list_container_keys(self):
+        for container_key in ('ccc', 'aaa', 'bbb'):
+            self.testapp.put('/collections/TEST_COLLECTION/containers/' + container_key)
+        res = self.testapp.get('/collections/TEST_COLLECTION/containers')
+        self.assertEqual(['aaa', 'bbb', 'ccc'], res.json_body)
+        res = self.testapp.get('/collections/TEST_COLLECTION/containers?limit=2')
+        self.assertEqual(['aaa', 'bbb'], res.json_body)
+        self.assertIn('cursor=bbb', res.headers['Link'])
+        res = self.testapp.get('/collections/TEST_COLLECTION/containers?limit=2&cursor=bbb')
+        self.assertEqual(['ccc'], res.json_body)
+        self.assertNotIn('Link', res.headers)
+
+    def test_list_container_keys_not_implemented(self):
+        store = self.app.registry.collections['TEST_COLLECTION'].object_store
+        with mock.patch.object(store, 'list_container_keys',
+                               side_effect=NotImplementedError('Not supported')):
+            res = self.testapp.get('/collections/TEST_COLLECTION/containers', expect_errors=True)
+        self.assertEqual(501, res.status_code)
+        self.assertEqual({'message': 'Not supported'}, res.json_body)
+
     def test_create_container_with_id(self):
         res = self.testapp.post('/collections/TEST_COLLECTION/containers')
         self.assertEqual('201 Created', res.status)
@@ -484,6 +715,30 @@ class FunctionalTests(unittest.TestCase):
         )
         self.assertEqual(res.status_code, 400)
 
+    def test_get_file_from_tar(self):
+        self.testapp.put(
+            "/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID")
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w:gz") as tf:
+            for name in ("brug.jpg", "kasteel.jpg"):
+                tf.add(os.path.join(here, "../", "fixtures", name), arcname=name)
+        self.testapp.put(
+            "/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID/003",
+            buffer.getvalue()
+        )
+        res = self.testapp.get(
+            "/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID/003/kasteel.jpg"
+        )
+        self.assertEqual("200 OK", res.status)
+        with open(os.path.join(here, "../", "fixtures/kasteel.jpg"), "rb") as f:
+            self.assertEqual(f.read(), res.body)
+        self.assertEqual(str(len(res.body)), res.headers["Content-Length"])
+        res = self.testapp.get(
+            "/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID/003/lol.jpg",
+            expect_errors=True,
+        )
+        self.assertEqual(res.status_code, 400)
+
     def test_get_objects_as_zip(self):
         # create container and add object
         zip_header = {"Accept": "Application/zip"}
@@ -528,3 +783,172 @@ class FunctionalTests(unittest.TestCase):
             expect_errors=True,
         )
         self.assertEqual(res.status_code, 404)
+
+    def test_bulk_upload_tar(self):
+        self.testapp.put("/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID")
+        tar_content = io.BytesIO()
+        with tarfile.open(fileobj=tar_content, mode="w:gz") as tar:
+            for name, data in (("./001", b"first"), ("002", b"second"), ("x", b"short")):
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        res = self.testapp.post(
+            "/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID/bulk",
+            tar_content.getvalue(),
+            headers={"Content-Type": "application/gzip"},
+        )
+        self.assertEqual("200 OK", res.status)
+        self.assertEqual(["001", "002", "x"], [r["object_key"] for r in res.json_body])
+        self.assertEqual(
+            self.storage_location
+            + "collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID/001",
+            res.json_body[0]["uri"],
+        )
+        self.assertNotIn("uri", res.json_body[2])
+        self.assertIn("message", res.json_body[2])
+        res = self.testapp.get(
+            "/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID/002")
+        self.assertEqual(b"second", res.body)
+        res = self.testapp.get(
+            "/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID",
+            headers={"Accept": "application/json"},
+        )
+        self.assertCountEqual(["001", "002"], res.json_body)
+
+    def test_bulk_upload_zip(self):
+        self.testapp.put("/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID")
+        zip_content = io.BytesIO()
+        with zipfile.ZipFile(zip_content, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("dir/", b"")
+            zf.writestr("001", b"first")
+            zf.writestr("002", b"second")
+        res = self.testapp.post(
+            "/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID/bulk",
+            zip_content.getvalue(),
+            headers={"Content-Type": "application/zip"},
+        )
+        self.assertEqual(["001", "002"], [r["object_key"] for r in res.json_body])
+        res = self.testapp.get(
+            "/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID/001")
+        self.assertEqual(b"first", res.body)
+
+    def test_bulk_upload_multipart(self):
+        self.testapp.put("/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID")
+        res = self.testapp.post(
+            "/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID/bulk",
+            upload_files=[("001", "a.txt", b"first"), ("002", "b.txt", b"second")],
+        )
+        self.assertEqual(["001", "002"], [r["object_key"] for r in res.json_body])
+        res = self.testapp.get(
+            "/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID/002")
+        self.assertEqual(b"second", res.body)
+
+    def test_bulk_upload_invalid_body(self):
+        self.testapp.put("/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID")
+        res = self.testapp.post(
+            "/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID/bulk",
+            b"not a zip",
+            headers={"Content-Type": "application/zip"},
+            expect_errors=True,
+        )
+        self.assertEqual(400, res.status_code)
+        res = self.testapp.post(
+            "/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID/bulk",
+            b"data",
+            headers={"Content-Type": "application/octet-stream"},
+            expect_errors=True,
+        )
+        self.assertEqual(415, res.status_code)
+
+    def test_resumable_upload(self):
+        self.testapp.put("/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID")
+        res = self.testapp.post(
+            "/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID/200001/uploads")
+        self.assertEqual(201, res.status_code)
+        self.assertEqual(0, res.json_body["offset"])
+        upload_url = res.json_body["uri"]
+        self.assertEqual(upload_url, res.headers["Location"])
+        res = self.testapp.put(upload_url + "?offset=0", b"some ",
+                               headers={"Content-Type": "application/octet-stream"})
+        self.assertEqual(5, res.json_body["offset"])
+        self.assertEqual("5", res.headers["Upload-Offset"])
+        res = self.testapp.put(upload_url + "?offset=2", b"test data",
+                               headers={"Content-Type": "application/octet-stream"},
+                               expect_errors=True)
+        self.assertEqual(409, res.status_code)
+        self.assertEqual(5, res.json_body["offset"])
+        res = self.testapp.head(upload_url)
+        self.assertEqual("5", res.headers["Upload-Offset"])
+        self.testapp.put(upload_url + "?offset=5", b"test data",
+                         headers={"Content-Type": "application/octet-stream"})
+        self.assertEqual(14, self.testapp.get(upload_url).json_body["offset"])
+        res = self.testapp.post(upload_url)
+        self.assertEqual("200001", res.json_body["object_key"])
+        res = self.testapp.get(
+            "/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID/200001")
+        self.assertEqual(b"some test data", res.body)
+        res = self.testapp.get(upload_url, expect_errors=True)
+        self.assertEqual(404, res.status_code)
+
+    def test_update_object_reserved_key(self):
+        self.testapp.put("/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID")
+        for object_key in (".augeias", ".augeias-foo"):
+            res = self.testapp.put(
+                "/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID/" + object_key,
+                b"data", headers={"Content-Type": "application/octet-stream"}, status=400)
+            self.assertIn(".augeias", res.json_body["message"])
+        res = self.testapp.get("/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID")
+        self.assertEqual([], res.json_body)
+
+    def test_resumable_upload_other_object(self):
+        self.testapp.put("/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID")
+        res = self.testapp.post(
+            "/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID/aaa/uploads")
+        upload_url = res.json_body["uri"]
+        other_url = upload_url.replace("/aaa/", "/other/")
+        self.testapp.put(other_url + "?offset=0", b"data",
+                         headers={"Content-Type": "application/octet-stream"}, status=404)
+        self.testapp.post(other_url, status=404)
+        self.testapp.delete(other_url, status=404)
+        self.testapp.get(
+            "/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID/other", status=404)
+
+    def test_resumable_upload_abort(self):
+        self.testapp.put("/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID")
+        res = self.testapp.post(
+            "/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID/200001/uploads")
+        upload_url = res.json_body["uri"]
+        self.testapp.put(upload_url + "?offset=0", b"data",
+                         headers={"Content-Type": "application/octet-stream"})
+        res = self.testapp.put(upload_url, b"data", expect_errors=True)
+        self.assertEqual(400, res.status_code)
+        self.testapp.delete(upload_url)
+        res = self.testapp.post(upload_url, expect_errors=True)
+        self.assertEqual(404, res.status_code)
+        res = self.testapp.get(
+            "/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID/200001",
+            expect_errors=True)
+        self.assertEqual(404, res.status_code)
+
+    def test_resumable_upload_not_implemented(self):
+        store = self.app.registry.collections['TEST_COLLECTION'].object_store
+        with mock.patch.object(store, 'create_upload',
+                               side_effect=NotImplementedError('Not supported')):
+            res = self.testapp.post(
+                "/collections/TEST_COLLECTION/containers/TEST_CONTAINER_ID/200001/uploads",
+                expect_errors=True)
+        self.assertEqual(501, res.status_code)
+
+    def test_bulk_upload_unexisting_container(self):
+        tar_content = io.BytesIO()
+        with tarfile.open(fileobj=tar_content, mode="w") as tar:
+            info = tarfile.TarInfo("001")
+            info.size = 4
+            tar.addfile(info, io.BytesIO(b"data"))
+        res = self.testapp.post(
+            "/collections/TEST_COLLECTION/containers/NO_CONTAINER/bulk",
+            tar_content.getvalue(),
+            headers={"Content-Type": "application/x-tar"},
+            expect_errors=True,
+        )
+        self.assertEqual(404, res.status_code)
@@ -0,0 +1,48 @@
+import os
+import unittest
+
+import tempdir
+
+from augeias.metadata_index import MetadataIndex
+
+
+class TestMetadataIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.temp = tempdir.TempDir()
+        self.index = MetadataIndex(os.path.join(self.temp.name, 'metadata.sqlite'))
+
+    def tearDown(self):
+        self.index.close()
+        self.temp.dissolve()
+
+    def test_usage_scenario(self):
+        self.assertFalse(self.index.built)
+        self.index.add_container('empty')
+        self.index.put_object('testing', 'first', 10, 1000, 'text/plain')
+        self.index.put_object('testing', 'second', 20, 3000, 'image/jpeg')
+        self.index.put_object('other', 'third', 30, 2000, 'text/plain')
+        self.assertEqual(['empty', 'other', 'testing'], self.index.list_container_keys())
+        self.assertEqual({'size': 20, 'mtime_ns': 3000, 'mime': 'image/jpeg'},
+                         self.index.get_object('testing', 'second'))
+        self.assertEqual(['first', 'second'], list(self.index.list_objects('testing')))
+        self.assertEqual(
+            {'objects': 3, 'size': 60, 'mimes': {'text/plain': 2, 'image/jpeg': 1}},
+            self.index.summarize())
+        self.assertEqual(
+            {'objects': 0, 'size': 0, 'mimes': {}}, self.index.summarize('empty'))
+        self.assertEqual([('other', 'third'), ('testing', 'second')],
+                         self.index.list_modified_since(1000))
+        self.index.remove_object('testing', 'first')
+        self.assertIsNone(self.index.get_object('testing', 'first'))
+        self.index.remove_container('other')
+        self.assertFalse(self.index.has_container('other'))
+        self.assertIsNone(self.index.get_object('other', 'third'))
+        self.index.mark_built()
+        self.assertTrue(MetadataIndex(self.index.path).built)
+
+    def test_replace_container(self):
+        self.index.put_object('testing', 'first', 10, 1000, 'text/plain')
+        self.index.replace_container(
+            'testing', {'second': {'size': 20, 'mtime_ns': 3000, 'mime': 'image/jpeg'}})
+        self.assertEqual(['second'], list(self.index.list_objects('testing')))
@@ -0,0 +1,187 @@
+import os
+import unittest
+from io import BytesIO
+from unittest.mock import patch
+
+import tempdir
+from pyramid.config import Configurator
+from webtest import TestApp
+
+from augeias.collections.model import Collection
+from augeias.metrics import MIME_DETECTION_SECONDS
+from augeias.metrics import REGISTRY
+from augeias.metrics import MetricsRegistry
+from augeias.stores.CachingStore import CachingStore
+from augeias.stores.InstrumentedStore import InstrumentedStore
+from augeias.stores.PairTreeFileSystemStore import PairTreeFileSystemStore
+from augeias.stores.PairTreeFileSystemStore import _sniff_mime
+from augeias.stores.error import NotFoundException
+
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_counter(self):
+        counter = self.registry.counter('test_total', 'Number of tests.', ('name',))
+        counter.inc(name='first')
+        counter.inc(2, name='first')
+        counter.inc(name='with "quotes"\n')
+        self.assertIs(counter, self.registry.counter('test_total', 'Number of tests.', ('name',)))
+        self.assertEqual(
+            '# HELP test_total Number of tests.\n'
+            '# TYPE test_total counter\n'
+            'test_total{name="first"} 3\n'
+            'test_total{name="with \\"quotes\\"\\n"} 1\n',
+            self.registry.render())
+
+    def test_histogram(self):
+        histogram = self.registry.histogram('test_seconds', 'Duration of tests.',
+                                            buckets=(0.1, 1))
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+        self.assertEqual(
+            '# HELP test_seconds Duration of tests.\n'
+            '# TYPE test_seconds histogram\n'
+            'test_seconds_bucket{le="0.1"} 1\n'
+            'test_seconds_bucket{le="1"} 2\n'
+            'test_seconds_bucket{le="+Inf"} 3\n'
+            'test_seconds_sum 5.55\n'
+            'test_seconds_count 3\n',
+            self.registry.render())
+
+    def test_timed(self):
+        histogram = self.registry.histogram('test_seconds', 'Duration of tests.')
+        with self.registry.timed(histogram):
+            pass
+        self.registry.enabled = False
+        with self.registry.timed(histogram):
+            pass
+        self.assertIn('test_seconds_count 1', self.registry.render().splitlines())
+
+    def test_mime_detection_is_timed_when_enabled(self):
+        def count():
+            prefix = MIME_DETECTION_SECONDS.name + '_count '
+            lines = [line for line in REGISTRY.render().splitlines() if line.startswith(prefix)]
+            return int(lines[0][len(prefix):]) if lines else 0
+
+        with patch.object(REGISTRY, 'enabled', False):
+            before = count()
+            self.assertEqual('text/plain', _sniff_mime(b'some test data'))
+            self.assertEqual(before, count())
+        with patch.object(REGISTRY, 'enabled', True):
+            _sniff_mime(b'some test data')
+            self.assertEqual(before + 1, count())
+
+    def test_conflicting_metrics(self):
+        self.registry.counter('test_total', 'Number of tests.')
+        self.assertRaises(ValueError, self.registry.histogram, 'test_total', 'Tests.')
+        self.assertRaises(ValueError, self.registry.counter, 'test_total', 'Tests.', ('name',))
+        self.assertRaises(ValueError, self.registry.counter('other_total', 'Others.').inc,
+                          name='first')
+
+
+class TestInstrumentedStore(unittest.TestCase):
+
+    def setUp(self):
+        self.temp = tempdir.TempDir()
+        self.metrics = MetricsRegistry()
+        self.backing_store = PairTreeFileSystemStore(
+            os.path.join(os.path.abspath(self.temp.name), 'test_data'))
+        self.store = InstrumentedStore(self.backing_store, 'cheeses', self.metrics)
+        self.store.create_container('testing')
+
+    def tearDown(self):
+        self.temp.dissolve()
+
+    def test_operations_are_recorded(self):
+        self.store.create_object('testing', 'first', b'some test data')
+        self.store.update_object('testing', 'second', BytesIO(b'other data'))
+        self.assertEqual(b'some test data', self.store.get_object('testing', 'first'))
+        with self.store.open_object_handle('testing', 'second') as handle:
+            self.assertEqual(b'other data', handle.read())
+        self.assertRaises(NotFoundException, self.store.get_object_info, 'testing', 'third')
+        self.store.copy_object(self.store, 'testing', 'first', 'testing', 'copy')
+        self.assertEqual(2, os.stat(self.backing_store._object_path('testing', 'copy')).st_nlink)
+        metrics = self.metrics.render()
+        for line in [
+            'augeias_store_operation_duration_seconds_count'
+            '{collection="cheeses",operation="create_object"} 1',
+            'augeias_store_operation_duration_seconds_count'
+            '{collection="cheeses",operation="copy_object"} 1',
+            'augeias_store_bytes_total'
+            '{collection="cheeses",operation="create_object",direction="written"} 14',
+            'augeias_store_bytes_total'
+            '{collection="cheeses",operation="update_object",direction="written"} 10',
+            'augeias_store_bytes_total'
+            '{collection="cheeses",operation="get_object",direction="read"} 14',
+            'augeias_store_bytes_total'
+            '{collection="cheeses",operation="open_object_handle",direction="read"} 10',
+            'augeias_store_operation_errors_total'
+            '{collection="cheeses",operation="get_object_info",error="NotFoundException"} 1',
+        ]:
+            self.assertIn(line, metrics.splitlines())
+
+    def test_container_data_is_counted(self):
+        self.store.create_object('testing', 'first', b'some test data')
+        size = sum(len(chunk) for chunk in self.store.iter_container_data('testing'))
+        self.assertIn(
+            'augeias_store_bytes_total'
+            '{collection="cheeses",operation="iter_container_data",direction="read"} %d' % size,
+            self.metrics.render().splitlines())
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.temp = tempdir.TempDir()
+        config = Configurator(settings={'augeias.metrics': 'true'})
+        config.include('augeias')
+        self.store = CachingStore(PairTreeFileSystemStore(
+            os.path.join(os.path.abspath(self.temp.name), 'test_data')))
+        collection = Collection(name='cheeses', object_store=self.store)
+        config.registry.collections[collection.name] = collection
+        self.app = config.make_wsgi_app()
+        self.testapp = TestApp(self.app)
+
+    def tearDown(self):
+        self.temp.dissolve()
+
+    def test_metrics(self):
+        collection = self.app.registry.collections['cheeses']
+        self.assertIsInstance(collection.object_store, InstrumentedStore)
+        self.testapp.put('/collections/cheeses/containers/brie')
+        self.testapp.put('/collections/cheeses/containers/brie/wedge', b'some test data')
+        sent = sum(len(res.body) for res in [
+            self.testapp.get('/collections/cheeses/containers/brie/wedge'),
+            self.testapp.get('/collections/cheeses/containers/brie/wedge'),
+            self.testapp.get('/collections/cheeses/containers/brie/none', status=404),
+        ])
+        self.testapp.get('/collections/unknown/containers/brie/wedge', status=404)
+        res = self.testapp.get('/metrics')
+        self.assertEqual('text/plain; version=0.0.4; charset=utf-8', res.headers['Content-Type'])
+        lines = res.text.splitlines()
+        for line in [
+            'augeias_http_requests_total'
+            '{route="get_object",method="GET",status="200",collection="cheeses"} 2',
+            'augeias_http_requests_total'
+            '{route="get_object",method="GET",status="404",collection="cheeses"} 1',
+            'augeias_http_requests_total'
+            '{route="get_object",method="GET",status="404",collection=""} 1',
+            'augeias_http_request_duration_seconds_count'
+            '{route="update_object",method="PUT",collection="cheeses"} 1',
+            'augeias_http_request_bytes_total{route="update_object",collection="cheeses"} 14',
+            'augeias_http_response_bytes_total{route="get_object",collection="cheeses"} %d' % sent,
+            'augeias_cache_hits_total{collection="cheeses"} 1',
+        ]:
+            self.assertIn(line, lines)
+        self.assertIn('# TYPE augeias_store_operation_duration_seconds histogram', lines)
+        self.assertIn('# TYPE augeias_mime_detection_duration_seconds histogram', lines)
+
+    def test_metrics_are_disabled_by_default(self):
+        config = Configurator(settings={})
+        config.include('augeias')
+        testapp = TestApp(config.make_wsgi_app())
+        testapp.get('/metrics', status=404)
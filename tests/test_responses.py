@@ -0,0 +1,109 @@
+import io
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+from pyramid import testing
+from pyramid.httpexceptions import HTTPRequestRangeNotSatisfiable
+from pyramid.request import Request
+from pyramid.response import Response
+
+from augeias.responses import RangeFileIter
+from augeias.responses import file_app_iter
+from augeias.responses import parse_range_header
+from augeias.responses import requested_ranges
+from augeias.responses import set_file_body
+
+
+class TestParseRangeHeader(unittest.TestCase):
+
+    def test_no_header(self):
+        self.assertIsNone(parse_range_header(None, 100))
+        self.assertIsNone(parse_range_header('', 100))
+
+    def test_single_ranges(self):
+        self.assertEqual([(0, 10)], parse_range_header('bytes=0-9', 100))
+        self.assertEqual([(90, 100)], parse_range_header('bytes=90-', 100))
+        self.assertEqual([(80, 100)], parse_range_header('bytes=-20', 100))
+        self.assertEqual([(0, 100)], parse_range_header('bytes=-200', 100))
+        self.assertEqual([(50, 100)], parse_range_header('bytes=50-500', 100))
+
+    def test_multiple_ranges(self):
+        self.assertEqual(
+            [(0, 10), (20, 30), (95, 100)],
+            parse_range_header('bytes=0-9, 20-29,-5', 100)
+        )
+
+    def test_unsatisfiable(self):
+        self.assertEqual([], parse_range_header('bytes=100-', 100))
+        self.assertEqual([], parse_range_header('bytes=-0', 100))
+        self.assertEqual([(0, 1)], parse_range_header('bytes=200-300,0-0', 100))
+
+    def test_ignored(self):
+        self.assertIsNone(parse_range_header('items=0-9', 100))
+        self.assertIsNone(parse_range_header('bytes=9-0', 100))
+        self.assertIsNone(parse_range_header('bytes=a-b', 100))
+        self.assertIsNone(parse_range_header('bytes=-', 100))
+        self.assertIsNone(parse_range_header('bytes=0-99,0-99', 100))
+
+
+class TestRanges(unittest.TestCase):
+
+    def setUp(self):
+        testing.setUp()
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def test_requested_ranges_if_range(self):
+        request = Request.blank('/', headers={'Range': 'bytes=0-1', 'If-Range': '"abc"'})
+        response = Response()
+        self.assertIsNone(requested_ranges(request, response, 10))
+        response.etag = 'abc'
+        self.assertEqual([(0, 2)], requested_ranges(request, response, 10))
+
+    def test_requested_ranges_not_satisfiable(self):
+        request = Request.blank('/', headers={'Range': 'bytes=10-'})
+        with self.assertRaises(HTTPRequestRangeNotSatisfiable) as cm:
+            requested_ranges(request, Response(), 10)
+        self.assertEqual('bytes */10', cm.exception.headers['Content-Range'])
+
+    def test_set_file_body_multiple_ranges(self):
+        request = testing.DummyRequest()
+        response = Response(content_type='text/plain')
+        fileobj = io.BytesIO(b'0123456789')
+        set_file_body(request, response, fileobj, 10, [(0, 2), (8, 10)])
+        self.assertEqual(206, response.status_int)
+        boundary = response.content_type_params['boundary']
+        self.assertEqual('multipart/byteranges', response.content_type)
+        body = response.body
+        self.assertEqual(len(body), response.content_length)
+        self.assertIn(b'Content-Range: bytes 0-1/10\r\n\r\n01\r\n', body)
+        self.assertIn(b'Content-Range: bytes 8-9/10\r\n\r\n89\r\n', body)
+        self.assertTrue(body.endswith(f'--{boundary}--\r\n'.encode()))
+
+    def test_range_file_iter_reads_only_range(self):
+        fileobj = io.BytesIO(b'0123456789')
+        app_iter = RangeFileIter(fileobj, [(3, 7)], block_size=3)
+        self.assertEqual([b'345', b'6'], list(app_iter))
+        app_iter.close()
+        self.assertTrue(fileobj.closed)
+
+
+class TestFileAppIter(unittest.TestCase):
+
+    def setUp(self):
+        self.request = testing.DummyRequest()
+        self.file_wrapper = Mock(return_value=[b'data'])
+        self.request.environ['wsgi.file_wrapper'] = self.file_wrapper
+
+    def test_os_file_uses_file_wrapper(self):
+        with tempfile.TemporaryFile() as f:
+            self.assertEqual([b'data'], file_app_iter(self.request, f, 3))
+            self.file_wrapper.assert_called_once_with(f, 3)
+
+    def test_other_file_is_read_sequentially(self):
+        fileobj = io.BufferedReader(io.BytesIO(b'0123456789'))
+        self.assertEqual([b'012', b'345', b'678', b'9'],
+                         list(file_app_iter(self.request, fileobj, 3)))
+        self.file_wrapper.assert_not_called()
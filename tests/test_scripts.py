@@ -0,0 +1,93 @@
+import os
+import time
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+import tempdir
+
+from augeias.scripts import backfill_mime
+from augeias.scripts import collect_garbage
+from augeias.scripts import metadata_index
+from augeias.stores.ContentAddressableStore import ContentAddressableStore
+from augeias.stores.PairTreeFileSystemStore import PairTreeFileSystemStore
+
+
+class TestBackfillMime(unittest.TestCase):
+
+    def setUp(self):
+        self.temp = tempdir.TempDir()
+        self.store_dir = os.path.join(os.path.abspath(self.temp.name), 'test_data')
+        self.store = PairTreeFileSystemStore(self.store_dir)
+
+    def tearDown(self):
+        self.temp.dissolve()
+
+    def test_backfill_mime(self):
+        self.store.create_container('testing')
+        self.store.create_object('testing', 'metadata', b'some test data')
+        os.remove(self.store._meta_path('testing', 'metadata'))
+        out = StringIO()
+        with redirect_stdout(out):
+            backfill_mime.main([self.store_dir])
+        self.assertIn('recorded the mimetype of 1 objects', out.getvalue())
+        self.assertTrue(os.path.exists(self.store._meta_path('testing', 'metadata')))
+
+
+class TestCollectGarbage(unittest.TestCase):
+
+    def setUp(self):
+        self.temp = tempdir.TempDir()
+        self.store_dir = os.path.join(os.path.abspath(self.temp.name), 'test_data')
+        self.store = ContentAddressableStore(self.store_dir)
+
+    def tearDown(self):
+        self.temp.dissolve()
+
+    def test_collect_garbage(self):
+        self.store.create_container('testing')
+        self.store.create_object('testing', 'metadata', b'some test data')
+        os.remove(self.store._entry_path('testing', 'metadata'))
+        out = StringIO()
+        with redirect_stdout(out):
+            collect_garbage.main([self.store_dir])
+        self.assertIn('removed 1 unreferenced blobs', out.getvalue())
+
+    def test_expire_uploads(self):
+        store_dir = os.path.join(os.path.abspath(self.temp.name), 'pairtree')
+        store = PairTreeFileSystemStore(store_dir)
+        store.create_container('testing')
+        upload_id = store.create_upload('testing', 'big')
+        upload_path = store._upload_path('testing', 'big', upload_id)
+        os.utime(upload_path, (time.time() - 7200, time.time() - 7200))
+        out = StringIO()
+        with redirect_stdout(out):
+            collect_garbage.main(['--uploads', '--max-age', '1', store_dir])
+        self.assertIn('removed 1 abandoned uploads', out.getvalue())
+        self.assertFalse(os.path.exists(upload_path))
+
+
+class TestMetadataIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.temp = tempdir.TempDir()
+        self.store_dir = os.path.join(os.path.abspath(self.temp.name), 'test_data')
+        self.store = PairTreeFileSystemStore(self.store_dir)
+
+    def tearDown(self):
+        self.temp.dissolve()
+
+    def test_rebuild_and_verify(self):
+        self.store.create_container('testing')
+        self.store.create_object('testing', 'metadata', b'some test data')
+        out = StringIO()
+        with redirect_stdout(out):
+            self.assertEqual(1, metadata_index.main(['verify', self.store_dir]))
+        self.assertIn('testing is missing', out.getvalue())
+        self.assertIn('testing/metadata is missing', out.getvalue())
+        out = StringIO()
+        with redirect_stdout(out):
+            self.assertEqual(0, metadata_index.main(['rebuild', self.store_dir]))
+            self.assertEqual(0, metadata_index.main(['verify', self.store_dir]))
+        self.assertIn('indexed 1 objects', out.getvalue())
+        self.assertIn('found 0 differences', out.getvalue())
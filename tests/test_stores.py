@@ -1,14 +1,31 @@
+import asyncio
+import datetime
+import gzip
 import os
+import tarfile
+import shutil
+import time
 import unittest
+from io import BytesIO
+from unittest.mock import Mock
+from unittest.mock import patch
 from zipfile import ZipFile
 
 import tempdir
 
+from augeias.responses import file_app_iter
+from augeias.stores.AsyncStoreAdapter import AsyncStoreAdapter
+from augeias.stores.CachingStore import CachingStore
 from augeias.stores.CephStore import CephStore
+from augeias.stores.CompressingStore import MAGIC
+from augeias.stores.CompressingStore import CompressingStore
+from augeias.stores.CompressingStore import zstandard
+from augeias.stores.ContentAddressableStore import ContentAddressableStore
 from augeias.stores.PairTreeFileSystemStore import PairTreeFileSystemStore
 from augeias.stores.PairTreeFileSystemStore import _is_allowed_data
 from augeias.stores.PairTreeFileSystemStore import _validate_data
 from augeias.stores.error import NotFoundException
+from augeias.stores.error import OffsetMismatchException
 
 
 class TestPairTreeStore(unittest.TestCase):
@@ -59,6 +76,53 @@ class TestPairTreeStore(unittest.TestCase):
         object_list = self.store.list_object_keys_for_container(container_key)
         self.assertEqual(0, len(object_list))
 
+    def test_open_object(self):
+        container_key = 'testing'
+        object_key = 'metadata'
+        self.store.create_container(container_key)
+        self.store.create_object(container_key, object_key, b'some test data')
+        with self.store.open_object(container_key, object_key) as f:
+            self.assertEqual(b'some', f.read(4))
+            self.assertEqual(b' test data', f.read())
+        self.assertRaises(NotFoundException, self.store.open_object, container_key, 'nogo')
+        self.assertRaises(NotFoundException, self.store.open_object, 'nogo', object_key)
+
+    def test_open_object_handle(self):
+        container_key = 'testing'
+        object_key = 'metadata'
+        self.store.create_container(container_key)
+        self.store.create_object(container_key, object_key, b'%PDF-1.4 some pdf')
+        with self.store.open_object_handle(container_key, object_key) as handle:
+            self.assertEqual(17, handle.size)
+            self.assertEqual('application/pdf', handle.mime)
+            self.assertEqual(self.store.stat_object(container_key, object_key)['mtime'], handle.mtime)
+            self.assertEqual(self.store.get_object_info(container_key, object_key), handle.info)
+            self.assertEqual(b'%PDF-1.4 some pdf', handle.read())
+        self.assertTrue(handle.closed)
+        self.assertRaises(NotFoundException, self.store.open_object_handle, container_key, 'nogo')
+        self.assertRaises(NotFoundException, self.store.open_object_handle, 'nogo', object_key)
+        self.assertRaises(NotFoundException, self.store.open_object_handle, container_key, '.augeias')
+
+    def test_open_object_handle_unrecorded_mime(self):
+        container_key = 'testing'
+        object_key = 'metadata'
+        self.store.create_container(container_key)
+        self.store.create_object(container_key, object_key, b'%PDF-1.4 some pdf')
+        os.remove(self.store._meta_path(container_key, object_key))
+        with self.store.open_object_handle(container_key, object_key) as handle:
+            self.assertEqual('application/pdf', handle.mime)
+            self.assertEqual(b'%PDF-1.4 some pdf', handle.read())
+
+    def test_stat_object(self):
+        container_key = 'testing'
+        self.store.create_container(container_key)
+        self.store.create_object(container_key, 'metadata', b'some test data')
+        object_stat = self.store.stat_object(container_key, 'metadata')
+        self.assertEqual(14, object_stat['size'])
+        self.assertIsInstance(object_stat['mtime'], float)
+        self.assertRaises(NotFoundException, self.store.stat_object, container_key, 'nogo')
+        self.assertRaises(NotFoundException, self.store.stat_object, 'nogo', 'metadata')
+
     def test_get_file_info(self):
         here = os.path.dirname(__file__)
         testdata = os.path.join(here, '../', 'fixtures/kasteel.jpg')
@@ -73,6 +137,245 @@ class TestPairTreeStore(unittest.TestCase):
         self.assertEqual('image/jpeg', object_info['mime'])
         self.assertIn('time_last_modification', object_info)
 
+    def test_get_file_info_recorded_mime(self):
+        container_key = 'testing'
+        object_key = 'metadata'
+        self.store.create_container(container_key)
+        self.store.create_object(container_key, object_key, b'%PDF-1.4 some pdf')
+        with patch('augeias.stores.PairTreeFileSystemStore.magic') as magic:
+            object_info = self.store.get_object_info(container_key, object_key)
+        magic.from_buffer.assert_not_called()
+        self.assertEqual('application/pdf', object_info['mime'])
+        self.assertEqual(17, object_info['size'])
+
+    def test_list_object_info_for_container(self):
+        self.store.create_container('testing')
+        self.store.create_object('testing', 'pdf', b'%PDF-1.4 some pdf')
+        self.store.create_object('testing', 'text', b'some text')
+        with patch('augeias.stores.PairTreeFileSystemStore.magic') as magic:
+            object_info = self.store.list_object_info_for_container('testing')
+        magic.from_buffer.assert_not_called()
+        self.assertEqual(['pdf', 'text'], sorted(object_info))
+        self.assertEqual('application/pdf', object_info['pdf']['mime'])
+        self.assertEqual(9, object_info['text']['size'])
+        self.assertEqual(self.store.get_object_info('testing', 'text'), object_info['text'])
+        self.assertRaises(NotFoundException, self.store.list_object_info_for_container, 'other')
+
+    def test_iter_object_keys_for_container(self):
+        self.store.create_container('testing')
+        self.store.create_object('testing', 'pdf', b'%PDF-1.4 some pdf')
+        self.store.create_object('testing', 'text', b'some text')
+        self.assertEqual(['pdf', 'text'],
+                         sorted(self.store.iter_object_keys_for_container('testing')))
+        self.assertRaises(NotFoundException, self.store.iter_object_keys_for_container, 'other')
+
+    def test_get_file_info_outdated_mime(self):
+        container_key = 'testing'
+        object_key = 'metadata'
+        self.store.create_container(container_key)
+        self.store.create_object(container_key, object_key, b'%PDF-1.4 some pdf')
+        with open(self.store._object_path(container_key, object_key), 'wb') as f:
+            f.write(b'plain text')
+        object_info = self.store.get_object_info(container_key, object_key)
+        self.assertEqual('text/plain', object_info['mime'])
+
+    def test_delete_object_removes_metadata(self):
+        container_key = 'testing'
+        object_key = 'metadata'
+        self.store.create_container(container_key)
+        self.store.create_object(container_key, object_key, b'some test data')
+        meta_path = self.store._meta_path(container_key, object_key)
+        self.assertTrue(os.path.exists(meta_path))
+        self.store.delete_object(container_key, object_key)
+        self.assertFalse(os.path.exists(meta_path))
+
+    def test_backfill_mime_types(self):
+        self.store.create_container('testing')
+        self.store.create_container('other')
+        self.store.create_object('testing', 'metadata', b'%PDF-1.4 some pdf')
+        self.store.create_object('other', 'metadata', b'plain text')
+        os.remove(self.store._meta_path('testing', 'metadata'))
+        self.assertEqual(1, self.store.backfill_mime_types())
+        self.assertEqual(0, self.store.backfill_mime_types())
+        with patch('augeias.stores.PairTreeFileSystemStore.magic') as magic:
+            object_info = self.store.get_object_info('testing', 'metadata')
+        magic.from_buffer.assert_not_called()
+        self.assertEqual('application/pdf', object_info['mime'])
+
+    def _tar(self, files, mode='w'):
+        buffer = BytesIO()
+        with tarfile.open(fileobj=buffer, mode=mode) as tf:
+            for name, data in files:
+                tarinfo = tarfile.TarInfo(name)
+                tarinfo.size = len(data)
+                tf.addfile(tarinfo, BytesIO(data))
+        return buffer.getvalue()
+
+    def test_open_archive_member_indexes_tar(self):
+        self.store.create_container('testing')
+        self.store.create_object(
+            'testing', 'archive', self._tar([('a.txt', b'aaa'), ('b.txt', b'bb')]))
+        index_path = self.store._archive_index_path('testing', 'archive')
+        self.assertFalse(os.path.exists(index_path))
+        with self.store.open_archive_member('testing', 'archive', 'b.txt') as member:
+            self.assertEqual(2, member.size)
+            self.assertEqual(b'bb', member.read())
+        self.assertTrue(os.path.exists(index_path))
+        with patch('augeias.stores.PairTreeFileSystemStore.build_tar_index') as build:
+            with self.store.open_archive_member('testing', 'archive', 'a.txt') as member:
+                self.assertEqual(b'aaa', member.read())
+            build.assert_not_called()
+        self.assertRaises(KeyError, self.store.open_archive_member,
+                          'testing', 'archive', 'c.txt')
+        self.assertNotIn('.augeias', self.store.list_object_keys_for_container('testing'))
+
+    def test_open_archive_member_gzip_tar(self):
+        self.store.create_container('testing')
+        self.store.create_object(
+            'testing', 'archive', self._tar([('a.txt', b'aaa'), ('b.txt', b'bb')], 'w:gz'))
+        for name, data in (('b.txt', b'bb'), ('a.txt', b'aaa')):
+            with self.store.open_archive_member('testing', 'archive', name) as member:
+                self.assertEqual(data, member.read())
+
+    def test_open_archive_member_reindexes_updated_archive(self):
+        self.store.create_container('testing')
+        self.store.create_object('testing', 'archive', self._tar([('a.txt', b'old')]))
+        self.store.open_archive_member('testing', 'archive', 'a.txt').close()
+        self.store.update_object(
+            'testing', 'archive', self._tar([('z.txt', b'z'), ('a.txt', b'new')]))
+        with self.store.open_archive_member('testing', 'archive', 'a.txt') as member:
+            self.assertEqual(b'new', member.read())
+        self.store.delete_object('testing', 'archive')
+        self.assertFalse(os.path.exists(
+            self.store._archive_index_path('testing', 'archive')))
+
+    def test_open_archive_member_zip(self):
+        self.store.create_container('testing')
+        buffer = BytesIO()
+        with ZipFile(buffer, 'w') as zf:
+            zf.writestr('a.txt', b'aaa')
+        self.store.create_object('testing', 'archive', buffer.getvalue())
+        with self.store.open_archive_member('testing', 'archive', 'a.txt') as member:
+            self.assertEqual(b'aaa', member.read())
+        self.assertFalse(os.path.exists(
+            self.store._archive_index_path('testing', 'archive')))
+
+    def test_open_archive_member_nonexisting(self):
+        self.store.create_container('testing')
+        self.assertRaises(NotFoundException, self.store.open_archive_member,
+                          'testing', 'archive', 'a.txt')
+
+    def test_copy_object(self):
+        self.store.create_container('testing')
+        self.store.create_container('copies')
+        self.store.create_object('testing', 'original', b'some test data')
+        self.store.copy_object(self.store, 'testing', 'original', 'copies', 'copy')
+        self.assertEqual(b'some test data', self.store.get_object('copies', 'copy'))
+        self.assertEqual(self.store.get_object_info('testing', 'original')['mime'],
+                         self.store.get_object_info('copies', 'copy')['mime'])
+        self.store.update_object('testing', 'original', b'other data')
+        self.assertEqual(b'some test data', self.store.get_object('copies', 'copy'))
+        self.store.copy_object(self.store, 'copies', 'copy', 'copies', 'copy')
+        self.assertEqual(['copy'], self.store.list_object_keys_for_container('copies'))
+
+    def test_copy_object_without_link(self):
+        other_store = PairTreeFileSystemStore(
+            os.path.join(os.path.abspath(self.temp.name), 'other_data'))
+        other_store.create_container('testing')
+        other_store.create_object('testing', 'original', b'some test data')
+        self.store.create_container('testing')
+        with patch('os.link', side_effect=OSError):
+            self.store.copy_object(other_store, 'testing', 'original', 'testing', 'copy')
+            with patch('augeias.stores.PairTreeFileSystemStore.fcntl', None), \
+                    patch('os.copy_file_range', side_effect=OSError, create=True):
+                self.store.copy_object(other_store, 'testing', 'original', 'testing', 'copy2')
+        self.assertEqual(b'some test data', self.store.get_object('testing', 'copy'))
+        self.assertEqual(b'some test data', self.store.get_object('testing', 'copy2'))
+        self.assertEqual(['copy', 'copy2'],
+                         sorted(self.store.list_object_keys_for_container('testing')))
+
+    def test_copy_object_from_other_store(self):
+        source_store = Mock(spec=['open_object'])
+        source_store.open_object.return_value = BytesIO(b'some test data')
+        self.store.create_container('testing')
+        self.store.copy_object(source_store, 'source', 'original', 'testing', 'copy')
+        source_store.open_object.assert_called_once_with('source', 'original')
+        self.assertEqual(b'some test data', self.store.get_object('testing', 'copy'))
+
+    def test_copy_nonexisting_object(self):
+        self.store.create_container('testing')
+        self.assertRaises(NotFoundException, self.store.copy_object,
+                          self.store, 'testing', 'original', 'testing', 'copy')
+        self.assertRaises(NotFoundException, self.store.copy_object,
+                          self.store, 'testing', 'original', 'other', 'copy')
+
+    def test_upload(self):
+        self.store.create_container('testing')
+        self.store.create_object('testing', 'big', b'old data')
+        upload_id = self.store.create_upload('testing', 'big')
+        self.assertEqual(0, self.store.get_upload_offset('testing', 'big', upload_id))
+        self.assertEqual(5, self.store.append_upload('testing', 'big', upload_id, 0, b'some '))
+        with self.assertRaises(OffsetMismatchException) as cm:
+            self.store.append_upload('testing', 'big', upload_id, 2, b'test data')
+        self.assertEqual(5, cm.exception.offset)
+        self.assertEqual(14, self.store.append_upload(
+            'testing', 'big', upload_id, 5, BytesIO(b'test data')))
+        self.assertEqual(14, self.store.get_upload_offset('testing', 'big', upload_id))
+        self.assertEqual(b'old data', self.store.get_object('testing', 'big'))
+        self.assertEqual(['big'], self.store.list_object_keys_for_container('testing'))
+        self.store.commit_upload('testing', 'big', upload_id)
+        self.assertEqual(b'some test data', self.store.get_object('testing', 'big'))
+        self.assertEqual('text/plain', self.store.get_object_info('testing', 'big')['mime'])
+        self.assertRaises(NotFoundException, self.store.get_upload_offset,
+                          'testing', 'big', upload_id)
+        self.assertRaises(NotFoundException, self.store.commit_upload,
+                          'testing', 'big', upload_id)
+
+    def test_abort_upload(self):
+        self.store.create_container('testing')
+        upload_id = self.store.create_upload('testing', 'big')
+        self.store.append_upload('testing', 'big', upload_id, 0, b'some test data')
+        self.store.abort_upload('testing', 'big', upload_id)
+        self.assertRaises(NotFoundException, self.store.append_upload,
+                          'testing', 'big', upload_id, 14, b'more')
+        self.assertRaises(NotFoundException, self.store.get_object, 'testing', 'big')
+        self.assertEqual([], self.store.list_object_keys_for_container('testing'))
+
+    def test_upload_is_bound_to_its_object(self):
+        self.store.create_container('testing')
+        upload_id = self.store.create_upload('testing', 'aaa')
+        self.assertRaises(NotFoundException, self.store.append_upload,
+                          'testing', 'zzz', upload_id, 0, b'data')
+        self.assertRaises(NotFoundException, self.store.get_upload_offset,
+                          'testing', 'zzz', upload_id)
+        self.assertRaises(NotFoundException, self.store.commit_upload,
+                          'testing', 'other', upload_id)
+        self.assertRaises(NotFoundException, self.store.abort_upload,
+                          'testing', 'other', upload_id)
+        self.assertRaises(NotFoundException, self.store.get_object, 'testing', 'other')
+        self.assertEqual(0, self.store.get_upload_offset('testing', 'aaa', upload_id))
+
+    def test_expire_uploads(self):
+        self.store.create_container('testing')
+        old_id = self.store.create_upload('testing', 'old')
+        self.store.append_upload('testing', 'old', old_id, 0, b'some data')
+        new_id = self.store.create_upload('testing', 'new')
+        old_path = self.store._upload_path('testing', 'old', old_id)
+        os.utime(old_path, (time.time() - 7200, time.time() - 7200))
+        self.assertEqual(1, self.store.expire_uploads(3600))
+        self.assertRaises(NotFoundException, self.store.get_upload_offset,
+                          'testing', 'old', old_id)
+        self.assertEqual(0, self.store.get_upload_offset('testing', 'new', new_id))
+        self.assertEqual(0, self.store.expire_uploads(3600))
+
+    def test_upload_nonexisting(self):
+        self.assertRaises(NotFoundException, self.store.create_upload, 'testing', 'big')
+        self.store.create_container('testing')
+        self.assertRaises(NotFoundException, self.store.get_upload_offset,
+                          'testing', 'big', '../../etc')
+        self.assertRaises(NotFoundException, self.store.append_upload,
+                          'testing', 'big', '0' * 32, 0, b'data')
+
     def test_update_scenario(self):
         container_key = 'testing'
         object_key = 'metadata'
@@ -84,6 +387,44 @@ class TestPairTreeStore(unittest.TestCase):
         object_value = self.store.get_object(container_key, object_key)
         self.assertEqual(b'updated data', object_value)
 
+    def test_update_from_stream(self):
+        container_key = 'testing'
+        object_key = 'metadata'
+        self.store.create_container(container_key)
+        data = os.urandom(3 * 64 * 1024 + 10)
+        self.store.update_object(container_key, object_key, BytesIO(data))
+        self.assertEqual(data, self.store.get_object(container_key, object_key))
+        stray = os.path.join(self.store._container_path(container_key), '.augeias-tmp-stray')
+        open(stray, 'wb').close()
+        self.assertEqual([object_key], self.store.list_object_keys_for_container(container_key))
+
+    def test_failed_update_leaves_object_intact(self):
+        container_key = 'testing'
+        object_key = 'metadata'
+        self.store.create_container(container_key)
+        self.store.create_object(container_key, object_key, b'some test data')
+
+        class BrokenStream:
+            def read(self, size):
+                raise OSError('connection lost')
+
+        self.assertRaises(OSError, self.store.update_object,
+                          container_key, object_key, BrokenStream())
+        self.assertEqual(b'some test data', self.store.get_object(container_key, object_key))
+        container_path = self.store._container_path(container_key)
+        self.assertFalse([name for name in os.listdir(container_path)
+                          if name.startswith('.augeias-tmp-')])
+
+    def test_update_with_fsync(self):
+        store = PairTreeFileSystemStore(
+            os.path.join(os.path.abspath(self.temp.name), 'fsync_data'), fsync=True)
+        store.create_container('testing')
+        store.update_object('testing', 'metadata', b'durable data')
+        self.assertEqual(b'durable data', store.get_object('testing', 'metadata'))
+
+    def test_update_nonexisting_container(self):
+        self.assertRaises(NotFoundException, self.store.update_object, 'nogo', 'metadata', b'data')
+
     def test_delete_nonexisting(self):
         container_key = 'testing'
         object_key = 'metadata'
@@ -120,6 +461,36 @@ class TestPairTreeStore(unittest.TestCase):
             self.assertEqual(1, len(filenames))
             self.assertIn('filename.pdf', filenames)
 
+    def test_iter_container_data(self):
+        container_key = 'container'
+        self.store.create_container(container_key)
+        self.store.create_object(container_key, 'object_key', b'file-data')
+        self.store.create_object(container_key, 'other_key', b'other-data')
+
+        chunks = self.store.iter_container_data(
+            container_key, translations={'other_key': 'other.txt'})
+        with ZipFile(BytesIO(b''.join(chunks))) as zf:
+            self.assertEqual(['other.txt'], zf.namelist())
+            self.assertEqual(b'other-data', zf.read('other.txt'))
+
+        self.assertRaises(NotFoundException, self.store.iter_container_data, 'nogo')
+        self.assertRaises(NotFoundException, self.store.iter_container_data,
+                          container_key, translations={'nogo': 'nogo.txt'})
+
+    def test_iter_container_data_read_ahead(self):
+        store = PairTreeFileSystemStore(
+            os.path.join(os.path.abspath(self.temp.name), 'test_data'), read_ahead=4)
+        store.create_container('testing')
+        for i in range(10):
+            store.create_object('testing', f'object{i}', bytes([i]) * 100)
+        translations = {f'object{i}': f'{i}.bin' for i in reversed(range(10))}
+        with ZipFile(BytesIO(b''.join(store.iter_container_data('testing', translations)))) as zf:
+            self.assertEqual(list(translations.values()), zf.namelist())
+            self.assertEqual(b'\x03' * 100, zf.read('3.bin'))
+        self.assertRaises(NotFoundException, store.iter_container_data,
+                          'testing', {'object10': 'x'})
+        store.read_ahead_executor.shutdown()
+
     def test_delete_container(self):
         self.store.create_container('x')
         self.store.delete_container('x')
@@ -132,6 +503,68 @@ class TestPairTreeStore(unittest.TestCase):
             error_raised = True
         self.assertTrue(error_raised)
 
+    def test_list_container_keys(self):
+        for container_key in ('abcd', 'ab', 'x/y'):
+            self.store.create_container(container_key)
+        self.store.create_object('abcd', 'metadata', b'data')
+        self.assertEqual(['ab', 'abcd', 'x/y'], sorted(self.store.list_container_keys()))
+        self.store.delete_container('abcd')
+        self.assertEqual(['ab', 'x/y'], sorted(self.store.list_container_keys()))
+
+    def test_rebuild_container_index(self):
+        for container_key in ('abcd', 'abc', 'x/y'):
+            self.store.create_container(container_key)
+        self.store.create_object('abcd', 'metadata', b'data')
+        shutil.rmtree(self.store._container_index_dir)
+        self.assertEqual(['abc', 'abcd', 'x/y'], sorted(self.store.list_container_keys()))
+        self.store.store.delete_object('x/y')
+        self.assertEqual(2, self.store.rebuild_container_index())
+        self.assertEqual(['abc', 'abcd'], sorted(self.store.list_container_keys()))
+
+    def test_metadata_index(self):
+        store = PairTreeFileSystemStore(self.store.store.store_dir, metadata_index=True)
+        store.create_container('testing')
+        store.create_object('testing', 'pdf', b'%PDF-1.4 some pdf')
+        store.copy_object(store, 'testing', 'pdf', 'testing', 'copy')
+        self.assertFalse(store.metadata_index.built)
+        self.assertEqual(2, store.rebuild_metadata_index())
+        self.assertEqual([], store.verify_metadata_index())
+        store.create_object('testing', 'text', b'some text')
+        store.delete_object('testing', 'copy')
+        with patch('augeias.stores.PairTreeFileSystemStore.os.stat') as os_stat:
+            self.assertEqual(['pdf', 'text'], store.list_object_keys_for_container('testing'))
+            self.assertEqual('application/pdf', store.get_object_info('testing', 'pdf')['mime'])
+            self.assertEqual(9, store.stat_object('testing', 'text')['size'])
+            self.assertEqual(['pdf', 'text'], sorted(store.list_object_info_for_container('testing')))
+            self.assertEqual(['testing'], store.list_container_keys())
+        os_stat.assert_not_called()
+        self.assertEqual(
+            store.get_object_info('testing', 'text'),
+            self.store.get_object_info('testing', 'text'))
+        self.assertRaises(NotFoundException, store.list_object_keys_for_container, 'other')
+        self.assertEqual({'objects': 2, 'size': 26, 'mimes': {'application/pdf': 1, 'text/plain': 1}},
+                         store.metadata_index.summarize('testing'))
+
+    def test_verify_metadata_index(self):
+        store = PairTreeFileSystemStore(self.store.store.store_dir, metadata_index=True)
+        store.create_container('testing')
+        store.create_object('testing', 'first', b'data')
+        store.create_object('testing', 'second', b'data')
+        store.rebuild_metadata_index()
+        self.store.create_container('other')
+        self.store.create_object('testing', 'third', b'data')
+        self.store.update_object('testing', 'first', b'other data')
+        self.store.delete_object('testing', 'second')
+        self.assertEqual([
+            ('other', None, 'missing'),
+            ('testing', 'first', 'outdated'),
+            ('testing', 'second', 'deleted'),
+            ('testing', 'third', 'missing'),
+        ], store.verify_metadata_index())
+        store.rebuild_metadata_index()
+        self.assertEqual([], store.verify_metadata_index())
+        self.assertEqual(['first', 'third'], store.list_object_keys_for_container('testing'))
+
     def test_is_allowed_data(self):
         self.assertFalse(_is_allowed_data('foo'))
         self.assertTrue(_is_allowed_data(b'data'))
@@ -140,27 +573,637 @@ class TestPairTreeStore(unittest.TestCase):
         self.assertRaises(IOError, _validate_data, 'foo')
 
 
-class TestCephStore(unittest.TestCase):
-    """series of tests to check the implementation of the CephStore.
-        Not really unittests, more integration tests"""
+class TestContentAddressableStore(unittest.TestCase):
+
+    def setUp(self):
+        self.temp = tempdir.TempDir()
+        self.store_dir = os.path.join(os.path.abspath(self.temp.name), 'test_data')
+        self.store = ContentAddressableStore(self.store_dir)
+        self.store.create_container('testing')
+
+    def tearDown(self):
+        self.temp.dissolve()
+
+    def _blobs(self):
+        return [
+            file_name
+            for _, _, file_names in os.walk(os.path.join(self.store_dir, 'blobs'))
+            for file_name in file_names if not file_name.endswith('.refs')
+        ]
+
+    def test_usage_scenario(self):
+        self.store.create_object('testing', 'metadata', b'some test data')
+        self.assertEqual(['metadata'], self.store.list_object_keys_for_container('testing'))
+        self.assertEqual(b'some test data', self.store.get_object('testing', 'metadata'))
+        info = self.store.get_object_info('testing', 'metadata')
+        self.assertEqual(14, info['size'])
+        self.assertEqual('text/plain', info['mime'])
+        self.assertEqual(14, self.store.stat_object('testing', 'metadata')['size'])
+        self.assertEqual({'metadata': info}, self.store.list_object_info_for_container('testing'))
+        with self.store.open_object_handle('testing', 'metadata') as handle:
+            self.assertEqual(b'some test data', handle.read())
+        self.store.update_object('testing', 'metadata', BytesIO(b'other data'))
+        self.assertEqual(b'other data', self.store.get_object('testing', 'metadata'))
+        self.store.delete_object('testing', 'metadata')
+        self.assertEqual([], self.store.list_object_keys_for_container('testing'))
+        self.assertEqual([], self._blobs())
+
+    def test_identical_objects_are_stored_once(self):
+        self.store.create_container('other')
+        self.store.create_object('testing', 'first', b'some test data')
+        self.store.create_object('testing', 'second', BytesIO(b'some test data'))
+        self.store.create_object('other', 'third', b'some test data')
+        self.assertEqual(1, len(self._blobs()))
+        self.assertEqual(self.store.get_digest('testing', 'first'),
+                         self.store.get_digest('other', 'third'))
+        self.store.delete_object('testing', 'first')
+        self.store.delete_container('other')
+        self.assertEqual(b'some test data', self.store.get_object('testing', 'second'))
+        self.store.delete_object('testing', 'second')
+        self.assertEqual([], self._blobs())
+
+    def test_copy_object(self):
+        self.store.create_object('testing', 'original', b'some test data')
+        with patch.object(self.store, '_write_blob') as write_blob:
+            self.store.copy_object(self.store, 'testing', 'original', 'testing', 'copy')
+            write_blob.assert_not_called()
+        self.assertEqual(b'some test data', self.store.get_object('testing', 'copy'))
+        self.store.delete_object('testing', 'original')
+        self.assertEqual(b'some test data', self.store.get_object('testing', 'copy'))
+
+    def test_copy_object_from_other_store(self):
+        other_store = PairTreeFileSystemStore(
+            os.path.join(os.path.abspath(self.temp.name), 'other_data'))
+        other_store.create_container('testing')
+        other_store.create_object('testing', 'original', b'some test data')
+        self.store.copy_object(other_store, 'testing', 'original', 'testing', 'copy')
+        self.assertEqual(b'some test data', self.store.get_object('testing', 'copy'))
+
+    def test_get_container_data(self):
+        self.store.create_object('testing', 'first', b'first data')
+        self.store.create_object('testing', 'second', b'second data')
+        with ZipFile(self.store.get_container_data('testing', {'second': 'file.txt'})) as zf:
+            self.assertEqual(['file.txt'], zf.namelist())
+            self.assertEqual(b'second data', zf.read('file.txt'))
+        self.assertRaises(NotFoundException, self.store.get_container_data,
+                          'testing', {'third': 'file.txt'})
+
+    def test_collect_garbage(self):
+        self.store.create_object('testing', 'first', b'first data')
+        self.store.create_object('testing', 'second', b'second data')
+        digest = self.store.get_digest('testing', 'first')
+        # lose the manifest entry and a reference count, as a crash would
+        os.remove(self.store._entry_path('testing', 'first'))
+        os.remove(self.store._refs_path(self.store.get_digest('testing', 'second')))
+        self.assertEqual(1, self.store.collect_garbage())
+        self.assertFalse(os.path.exists(self.store._blob_path(digest)))
+        self.assertEqual(1, self.store._read_refs(self.store.get_digest('testing', 'second')))
+        self.assertEqual(0, self.store.collect_garbage())
+
+    def test_nonexisting(self):
+        self.assertRaises(NotFoundException, self.store.get_object, 'testing', 'metadata')
+        self.assertRaises(NotFoundException, self.store.delete_object, 'testing', 'metadata')
+        self.assertRaises(NotFoundException, self.store.create_object, 'other', 'metadata', b'data')
+        self.assertRaises(NotFoundException, self.store.list_object_keys_for_container, 'other')
+        self.assertRaises(NotFoundException, self.store.delete_container, 'other')
+        self.assertEqual([], os.listdir(os.path.join(self.store_dir, 'tmp')))
+
+    def test_list_container_keys(self):
+        self.store.create_container('x/y')
+        self.store.create_container('..')
+        self.assertEqual(['..', 'testing', 'x/y'], sorted(self.store.list_container_keys()))
+        self.store.delete_container('testing')
+        self.assertEqual(['..', 'x/y'], sorted(self.store.list_container_keys()))
+
+    def test_no_reserved_keys(self):
+        self.assertIsNone(self.store.reserved_key_prefix)
+        self.store.create_object('testing', '.augeias', b'some test data')
+        self.assertEqual(['.augeias'], self.store.list_object_keys_for_container('testing'))
+
+    def test_entries_are_kept_per_object(self):
+        self.store.create_object('testing', 'first', b'first data')
+        self.store.create_object('testing', '../second', b'second data')
+        self.assertEqual(['%2E.%2Fsecond.json', 'first.json'],
+                         sorted(os.listdir(self.store._manifest_path('testing'))))
+        self.assertEqual(['../second', 'first'],
+                         sorted(self.store.list_object_keys_for_container('testing')))
+        with patch.object(self.store, '_iter_entries') as iter_entries:
+            self.store.update_object('testing', 'first', b'other data')
+            self.assertEqual(b'other data', self.store.get_object('testing', 'first'))
+            self.store.delete_object('testing', '../second')
+            iter_entries.assert_not_called()
+        self.assertEqual(['first'], self.store.list_object_keys_for_container('testing'))
+        self.store.delete_container('testing')
+        self.assertEqual([], os.listdir(os.path.join(self.store_dir, 'containers')))
+        self.assertEqual([], self._blobs())
+
+
+class TestCachingStore(unittest.TestCase):
 
     def setUp(self):
-        self.store = CephStore()
+        self.temp = tempdir.TempDir()
+        store_dir = os.path.join(os.path.abspath(self.temp.name), 'test_data')
+        self.backing_store = PairTreeFileSystemStore(store_dir)
+        self.store = CachingStore(self.backing_store, max_bytes=10000,
+                                  max_object_size=2000)
+        self.store.create_container('testing')
+
+    def tearDown(self):
+        self.temp.dissolve()
+
+    def test_encoded_objects_are_passed_through(self):
+        store = CachingStore(CompressingStore(self.backing_store), max_object_size=2000)
+        large = b''.join(b'%d;some;test;data\n' % i for i in range(1000))
+        small = b'%d;some;test;data\n' * 100
+        store.create_object('testing', 'large', large)
+        store.create_object('testing', 'small', small)
+        store.create_object('testing', 'plain', b'some test data')
+        for object_key, data in (('large', large), ('small', small)):
+            with store.open_encoded_object_handle('testing', object_key, ['gzip']) as handle:
+                self.assertEqual('gzip', handle.encoding)
+                self.assertTrue(handle.negotiated)
+                self.assertEqual(data, gzip.decompress(handle.read()))
+            with store.open_encoded_object_handle('testing', object_key, []) as handle:
+                self.assertIsNone(handle.encoding)
+                self.assertEqual(data, handle.read())
+        with store.open_encoded_object_handle('testing', 'plain', ['gzip']) as handle:
+            self.assertIsNone(handle.encoding)
+            self.assertEqual(b'some test data', handle.read())
+        self.assertEqual(1, store.stats['entries'])
+        with store.open_encoded_object_handle('testing', 'plain', ['gzip']) as handle:
+            self.assertEqual(b'some test data', handle.read())
+        self.assertEqual(1, store.stats['hits'])
+
+    def test_get_object_is_cached(self):
+        self.store.create_object('testing', 'metadata', b'some test data')
+        with patch.object(self.backing_store, 'open_object_handle',
+                          wraps=self.backing_store.open_object_handle) as open_handle:
+            self.assertEqual(b'some test data', self.store.get_object('testing', 'metadata'))
+            self.assertEqual(b'some test data', self.store.get_object('testing', 'metadata'))
+            with self.store.open_object_handle('testing', 'metadata') as handle:
+                self.assertEqual(14, handle.size)
+                self.assertEqual('text/plain', handle.mime)
+                self.assertEqual(b'some test data', handle.read())
+            with self.store.open_encoded_object_handle('testing', 'metadata', ['gzip']) as handle:
+                self.assertIsNone(handle.encoding)
+                self.assertEqual(b'some test data', handle.read())
+            self.assertEqual(1, open_handle.call_count)
+        with patch.object(self.backing_store, 'get_object_info') as get_info, \
+                patch.object(self.backing_store, 'stat_object') as stat_object:
+            self.assertEqual('text/plain', self.store.get_object_info('testing', 'metadata')['mime'])
+            self.assertEqual(14, self.store.stat_object('testing', 'metadata')['size'])
+            get_info.assert_not_called()
+            stat_object.assert_not_called()
+        self.assertEqual({'hits': 5, 'misses': 1, 'evictions': 0, 'entries': 1, 'bytes': 526},
+                         self.store.stats)
+
+    def test_writes_invalidate(self):
+        self.store.create_container('other')
+        self.store.create_object('testing', 'first', b'first data')
+        self.store.create_object('testing', 'second', b'second data')
+        self.store.create_object('other', 'third', b'third data')
+        for container_key, object_key in (('testing', 'first'), ('testing', 'second'), ('other', 'third')):
+            self.store.get_object(container_key, object_key)
+            self.store.get_object_info(container_key, object_key)
+        self.store.update_object('testing', 'first', b'new data')
+        self.assertEqual(b'new data', self.store.get_object('testing', 'first'))
+        self.assertEqual(8, self.store.get_object_info('testing', 'first')['size'])
+        self.store.copy_object(self.store, 'other', 'third', 'testing', 'first')
+        self.assertEqual(b'third data', self.store.get_object('testing', 'first'))
+        self.store.delete_object('testing', 'first')
+        self.assertRaises(NotFoundException, self.store.get_object, 'testing', 'first')
+        self.store.delete_container('testing')
+        self.assertRaises(NotFoundException, self.store.get_object_info, 'testing', 'second')
+        self.assertEqual(b'third data', self.store.get_object('other', 'third'))
+        self.assertEqual(1, self.store.stats['entries'])
+
+    def test_large_objects_are_not_cached(self):
+        self.store.create_object('testing', 'large', b'x' * 3000)
+        self.assertEqual(b'x' * 3000, self.store.get_object('testing', 'large'))
+        self.assertEqual(0, self.store.stats['entries'])
+
+    def test_eviction(self):
+        for i in range(10):
+            self.store.create_object('testing', f'object{i}', bytes([i]) * 1500)
+        # read the first object twice so it is protected from a scan
+        self.store.get_object('testing', 'object0')
+        self.store.get_object('testing', 'object0')
+        for i in range(1, 10):
+            self.store.get_object('testing', f'object{i}')
+        stats = self.store.stats
+        self.assertLessEqual(stats['bytes'], 10000)
+        self.assertEqual(10 - stats['entries'], stats['evictions'])
+        with patch.object(self.backing_store, 'open_object_handle') as open_handle:
+            self.assertEqual(b'\0' * 1500, self.store.get_object('testing', 'object0'))
+            self.assertEqual(b'\x09' * 1500, self.store.get_object('testing', 'object9'))
+            open_handle.assert_not_called()
+
+    def test_revalidate(self):
+        store = CachingStore(self.backing_store, revalidate=True)
+        store.create_object('testing', 'metadata', b'some test data')
+        self.assertEqual(b'some test data', store.get_object('testing', 'metadata'))
+        # written past the cache, eg. by another process
+        self.backing_store.update_object('testing', 'metadata', b'other data')
+        self.assertEqual(b'other data', store.get_object('testing', 'metadata'))
+        self.assertEqual(10, store.get_object_info('testing', 'metadata')['size'])
+
+    def test_passes_other_calls_on(self):
+        self.store.create_object('testing', 'metadata', b'some test data')
+        self.assertEqual(['metadata'], self.store.list_object_keys_for_container('testing'))
+        self.assertEqual(0, self.store.backfill_mime_types())
+        self.store.copy_object(self.store, 'testing', 'metadata', 'testing', 'copy')
+        self.assertEqual(2, os.stat(self.backing_store._object_path('testing', 'copy')).st_nlink)
+
+
+class TestCompressingStore(unittest.TestCase):
+
+    def setUp(self):
+        self.temp = tempdir.TempDir()
+        store_dir = os.path.join(os.path.abspath(self.temp.name), 'test_data')
+        self.backing_store = PairTreeFileSystemStore(store_dir)
+        self.store = CompressingStore(self.backing_store)
+        self.store.create_container('testing')
+        self.text = b''.join(b'<line number="%d">some test data</line>\n' % i for i in range(2000))
 
     def tearDown(self):
-        pass
+        self.temp.dissolve()
+
+    def test_compressible_object(self):
+        self.store.create_object('testing', 'text', self.text)
+        stored = self.backing_store.get_object('testing', 'text')
+        self.assertTrue(stored.startswith(MAGIC))
+        self.assertLess(len(stored), len(self.text) / 5)
+        self.assertEqual(self.text, self.store.get_object('testing', 'text'))
+        info = self.store.get_object_info('testing', 'text')
+        self.assertEqual(len(self.text), info['size'])
+        self.assertEqual('text/plain', info['mime'])
+        self.assertEqual(len(self.text), self.store.stat_object('testing', 'text')['size'])
+        self.assertEqual({'text': info}, self.store.list_object_info_for_container('testing'))
+        with self.store.open_object_handle('testing', 'text') as handle:
+            self.assertEqual(len(self.text), handle.size)
+            self.assertIsNone(handle.encoding)
+            handle.seek(60000)
+            self.assertEqual(self.text[60000:60100], handle.read(100))
+            handle.seek(10)
+            self.assertEqual(self.text[10:20], handle.read(10))
+
+    def test_incompressible_objects_are_stored_unchanged(self):
+        here = os.path.dirname(__file__)
+        with open(os.path.join(here, '../', 'fixtures/kasteel.jpg'), 'rb') as f:
+            jpeg = f.read()
+        random_data = os.urandom(5000)
+        self.store.create_object('testing', 'jpeg', BytesIO(jpeg))
+        self.store.create_object('testing', 'random', random_data)
+        self.store.create_object('testing', 'small', b'some test data')
+        self.assertEqual(jpeg, self.backing_store.get_object('testing', 'jpeg'))
+        self.assertEqual(random_data, self.backing_store.get_object('testing', 'random'))
+        self.assertEqual(b'some test data', self.backing_store.get_object('testing', 'small'))
+        self.assertEqual(jpeg, self.store.get_object('testing', 'jpeg'))
+        self.assertEqual('image/jpeg', self.store.get_object_info('testing', 'jpeg')['mime'])
+
+    def test_data_that_looks_like_an_envelope(self):
+        data = MAGIC + b'\0' * 20
+        self.store.create_object('testing', 'tricky', data)
+        self.assertEqual(data, self.store.get_object('testing', 'tricky'))
+        self.assertEqual(len(data), self.store.stat_object('testing', 'tricky')['size'])
+
+    def test_open_encoded_object_handle(self):
+        self.store.create_object('testing', 'text', self.text)
+        with self.store.open_encoded_object_handle('testing', 'text', ['gzip']) as handle:
+            self.assertEqual('gzip', handle.encoding)
+            self.assertTrue(handle.negotiated)
+            encoded = handle.read()
+            self.assertEqual(len(encoded), handle.size)
+        self.assertEqual(self.text, gzip.decompress(encoded))
+        with self.store.open_encoded_object_handle('testing', 'text', ['zstd']) as handle:
+            self.assertIsNone(handle.encoding)
+            self.assertTrue(handle.negotiated)
+            self.assertEqual(self.text, handle.read())
+
+    @unittest.skipIf(zstandard is None, 'zstandard is not installed')
+    def test_zstd(self):
+        store = CompressingStore(self.backing_store, encoding='zstd')
+        store.create_object('testing', 'text', self.text)
+        self.assertEqual(self.text, store.get_object('testing', 'text'))
+        self.assertEqual(self.text, self.store.get_object('testing', 'text'))
+
+    def test_objects_written_without_the_store(self):
+        self.backing_store.create_object('testing', 'text', self.text)
+        self.assertEqual(self.text, self.store.get_object('testing', 'text'))
+        self.assertEqual(len(self.text), self.store.get_object_info('testing', 'text')['size'])
+
+    def test_copy_object(self):
+        self.store.create_object('testing', 'text', self.text)
+        self.store.copy_object(self.store, 'testing', 'text', 'testing', 'copy')
+        self.assertEqual(2, os.stat(self.backing_store._object_path('testing', 'copy')).st_nlink)
+        self.assertEqual(self.text, self.store.get_object('testing', 'copy'))
+        self.backing_store.copy_object(self.store, 'testing', 'text', 'testing', 'plain')
+        self.assertEqual(self.text, self.backing_store.get_object('testing', 'plain'))
+
+    def test_commit_upload(self):
+        upload_id = self.store.create_upload('testing', 'text')
+        self.store.append_upload('testing', 'text', upload_id, 0, self.text)
+        with patch.object(self.backing_store, '_write_object',
+                          wraps=self.backing_store._write_object) as write_object:
+            self.store.commit_upload('testing', 'text', upload_id)
+            write_object.assert_called_once()
+        self.assertTrue(self.backing_store.get_object('testing', 'text').startswith(MAGIC))
+        self.assertEqual(self.text, self.store.get_object('testing', 'text'))
+        self.assertRaises(NotFoundException, self.store.get_upload_offset,
+                          'testing', 'text', upload_id)
+        data = os.urandom(5000)
+        upload_id = self.store.create_upload('testing', 'random')
+        self.store.append_upload('testing', 'random', upload_id, 0, data)
+        with patch.object(self.backing_store, '_write_object') as write_object:
+            self.store.commit_upload('testing', 'random', upload_id)
+            write_object.assert_not_called()
+        self.assertEqual(data, self.backing_store.get_object('testing', 'random'))
+
+    def test_reserved_key_prefix(self):
+        self.assertEqual('.augeias', self.backing_store.reserved_key_prefix)
+        self.assertEqual('.augeias', CachingStore(self.store).reserved_key_prefix)
+
+    def test_container_data(self):
+        self.store.create_object('testing', 'text', self.text)
+        self.store.create_object('testing', 'small', b'some test data')
+        with ZipFile(self.store.get_container_data('testing')) as zf:
+            self.assertEqual(self.text, zf.read('text'))
+            self.assertEqual(b'some test data', zf.read('small'))
+
+
+class TestAsyncStoreAdapter(unittest.TestCase):
+
+    def setUp(self):
+        self.temp = tempdir.TempDir()
+        store_dir = os.path.join(os.path.abspath(self.temp.name), 'test_data')
+        self.store = AsyncStoreAdapter(PairTreeFileSystemStore(store_dir), max_workers=2)
+
+    def tearDown(self):
+        self.store.executor.shutdown()
+        self.temp.dissolve()
+
+    def test_usage_scenario(self):
+        async def scenario():
+            await self.store.create_container('testing')
+            await self.store.create_object('testing', 'metadata', b'some test data')
+            await self.store.copy_object(self.store, 'testing', 'metadata', 'testing', 'copy')
+            self.assertEqual(['copy', 'metadata'], sorted(
+                await self.store.list_object_keys_for_container('testing')))
+            self.assertEqual(b'some test data', await self.store.get_object('testing', 'copy'))
+            chunks = [chunk async for chunk in self.store.iter_object('testing', 'metadata', 4)]
+            self.assertEqual([b'some', b' tes', b't da', b'ta'], chunks)
+            self.assertEqual(14, (await self.store.stat_object('testing', 'metadata'))['size'])
+            self.assertEqual('text/plain',
+                             (await self.store.get_object_info('testing', 'metadata'))['mime'])
+            self.assertEqual(['copy', 'metadata'], sorted(
+                await self.store.list_object_info_for_container('testing')))
+            await self.store.update_object('testing', 'metadata', BytesIO(b'other data'))
+            zip_data = b''.join([chunk async for chunk in self.store.iter_container_data('testing')])
+            with ZipFile(BytesIO(zip_data)) as zf:
+                self.assertEqual(b'other data', zf.read('metadata'))
+            await self.store.delete_object('testing', 'copy')
+            with self.assertRaises(NotFoundException):
+                await self.store.get_object('testing', 'copy')
+            await self.store.delete_container('testing')
+
+        asyncio.run(scenario())
+
+
+class FakeClientError(Exception):
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {'Error': {'Code': code}}
+
+
+class FakeS3Client:
+    """A small in-memory stand-in for the part of an S3 client the CephStore uses."""
+
+    page_size = 2
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self.requests = []
+
+    def _object(self, Bucket, Key):
+        try:
+            return self.objects[(Bucket, Key)]
+        except KeyError:
+            raise FakeClientError('NoSuchKey')
+
+    def put_object(self, Bucket, Key, Body, ContentType='binary/octet-stream'):
+        self.requests.append('put_object')
+        self.objects[(Bucket, Key)] = {
+            'data': bytes(Body), 'mime': ContentType,
+            'modified': datetime.datetime.now(datetime.timezone.utc)}
+
+    def head_object(self, Bucket, Key):
+        obj = self._object(Bucket, Key)
+        return {'ContentLength': len(obj['data']), 'LastModified': obj['modified'],
+                'ContentType': obj['mime']}
+
+    def get_object(self, Bucket, Key, Range=None):
+        self.requests.append(('get_object', Range))
+        response = self.head_object(Bucket, Key)
+        data = self._object(Bucket, Key)['data']
+        if Range is not None:
+            data = data[int(Range[len('bytes='):-1]):]
+        response['Body'] = BytesIO(data)
+        return response
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+    def delete_objects(self, Bucket, Delete):
+        for obj in Delete['Objects']:
+            self.objects.pop((Bucket, obj['Key']), None)
+
+    def copy_object(self, Bucket, Key, CopySource):
+        self.requests.append('copy_object')
+        source = self._object(CopySource['Bucket'], CopySource['Key'])
+        self.objects[(Bucket, Key)] = dict(source)
+
+    def list_objects_v2(self, Bucket, Prefix, Delimiter=None, ContinuationToken=None):
+        keys = sorted(key for bucket, key in self.objects
+                      if bucket == Bucket and key.startswith(Prefix))
+        if Delimiter is not None:
+            keys = sorted({Prefix + key[len(Prefix):].split(Delimiter)[0] + Delimiter
+                           for key in keys if Delimiter in key[len(Prefix):]})
+        start = int(ContinuationToken or 0)
+        page = keys[start:start + self.page_size]
+        response = {'IsTruncated': start + self.page_size < len(keys)}
+        if response['IsTruncated']:
+            response['NextContinuationToken'] = str(start + self.page_size)
+        if Delimiter is not None:
+            response['CommonPrefixes'] = [{'Prefix': key} for key in page]
+        else:
+            response['Contents'] = [{'Key': key} for key in page]
+        return response
+
+    def create_multipart_upload(self, Bucket, Key, ContentType):
+        upload_id = str(len(self.uploads))
+        self.uploads[upload_id] = {'parts': {}, 'mime': ContentType}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.requests.append('upload_part')
+        self.uploads[UploadId]['parts'][PartNumber] = bytes(Body)
+        return {'ETag': f'etag-{PartNumber}'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        upload = self.uploads.pop(UploadId)
+        data = b''.join(upload['parts'][part['PartNumber']]
+                        for part in MultipartUpload['Parts'])
+        self.put_object(Bucket, Key, data, upload['mime'])
+
+    def upload_part_copy(self, Bucket, Key, UploadId, PartNumber, CopySource,
+                         CopySourceRange):
+        self.requests.append('upload_part_copy')
+        data = self._object(CopySource['Bucket'], CopySource['Key'])['data']
+        start, stop = CopySourceRange[len('bytes='):].split('-')
+        self.uploads[UploadId]['parts'][PartNumber] = data[int(start):int(stop) + 1]
+        return {'CopyPartResult': {'ETag': f'etag-{PartNumber}'}}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId, None)
+
+
+class TestCephStore(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeS3Client()
+        self.store = CephStore('augeias', client=self.client, multipart_chunk_size=10)
 
     def test_usage_scenario(self):
         container_key = 'testing'
         object_key = 'metadata'
         self.store.create_container(container_key)
-        self.store.create_object(container_key, object_key, 'some test data')
-        object_value = self.store.get_object(container_key, object_key)
-        self.assertEqual(None, object_value)
-        object_value = self.store.get_object_info(container_key, object_key)
-        self.assertEqual(None, object_value)
+        self.store.create_object(container_key, object_key, b'some test')
+        self.assertEqual(b'some test', self.store.get_object(container_key, object_key))
+        object_info = self.store.get_object_info(container_key, object_key)
+        self.assertEqual(9, object_info['size'])
+        self.assertEqual('text/plain', object_info['mime'])
+        self.assertEqual(9, self.store.stat_object(container_key, object_key)['size'])
+        self.store.update_object(container_key, object_key, BytesIO(b'updated'))
+        self.assertEqual(b'updated', self.store.get_object(container_key, object_key))
+        self.assertEqual([object_key], self.store.list_object_keys_for_container(container_key))
         self.store.delete_object(container_key, object_key)
-        object_list = self.store.list_object_keys_for_container(container_key)
-        self.assertEqual(None, object_list)
-        self.store.update_object(container_key, object_key, 'updated data')
+        self.assertEqual([], self.store.list_object_keys_for_container(container_key))
         self.store.delete_container(container_key)
+        self.assertEqual({}, self.client.objects)
+
+    def test_multipart_upload(self):
+        self.store.create_container('testing')
+        data = b'%PDF-1.4 ' + b'x' * 16
+        self.store.create_object('testing', 'large', BytesIO(data))
+        self.assertEqual(3, self.client.requests.count('upload_part'))
+        self.assertEqual(data, self.store.get_object('testing', 'large'))
+        self.assertEqual('application/pdf', self.store.get_object_info('testing', 'large')['mime'])
+        self.assertEqual({}, self.client.uploads)
+
+    def test_failed_multipart_upload_is_aborted(self):
+        self.store.create_container('testing')
+
+        class BrokenStream:
+            def __init__(self):
+                self.reads = 0
+
+            def read(self, size):
+                self.reads += 1
+                if self.reads > 2:
+                    raise OSError('connection lost')
+                return b'x' * size
+
+        self.assertRaises(OSError, self.store.create_object, 'testing', 'large', BrokenStream())
+        self.assertEqual({}, self.client.uploads)
+        self.assertRaises(NotFoundException, self.store.get_object, 'testing', 'large')
+
+        with patch.object(self.client, 'abort_multipart_upload',
+                          side_effect=FakeClientError('InternalError')):
+            with self.assertLogs('augeias.stores.CephStore', 'WARNING'):
+                self.assertRaisesRegex(OSError, 'connection lost', self.store.create_object,
+                                       'testing', 'large', BrokenStream())
+
+    def test_open_object_seeks_with_ranged_get(self):
+        self.store.create_container('testing')
+        data = bytes(range(256)) * 100
+        self.store.create_object('testing', 'metadata', data)
+        with self.store.open_object_handle('testing', 'metadata') as handle:
+            self.assertEqual(len(data), handle.size)
+            self.assertEqual(data[:4], handle.read(4))
+            handle.seek(20000)
+            self.assertEqual(data[20000:], handle.read())
+        self.assertEqual([('get_object', None), ('get_object', 'bytes=20000-')],
+                         [r for r in self.client.requests if r[0] == 'get_object'])
+
+    def test_download_is_read_with_one_request(self):
+        self.store.create_container('testing')
+        data = bytes(range(256)) * 100
+        self.store.create_object('testing', 'metadata', data)
+        del self.client.requests[:]
+        request = Mock(environ={'wsgi.file_wrapper': Mock()})
+        handle = self.store.open_object_handle('testing', 'metadata')
+        app_iter = file_app_iter(request, handle, block_size=1000)
+        self.assertEqual(data, b''.join(app_iter))
+        app_iter.close()
+        request.environ['wsgi.file_wrapper'].assert_not_called()
+        self.assertEqual([('get_object', None)], self.client.requests)
+
+    def test_open_archive_member(self):
+        self.store.create_container('testing')
+        zip_content = BytesIO()
+        with ZipFile(zip_content, 'w') as zf:
+            zf.writestr('file.txt', b'archived')
+        self.store.create_object('testing', 'archive', zip_content.getvalue())
+        with self.store.open_archive_member('testing', 'archive', 'file.txt') as member:
+            self.assertEqual(b'archived', member.read())
+
+    def test_paginated_listing(self):
+        for container_key in ('ccc', 'aaa', 'bbb'):
+            self.store.create_container(container_key)
+        for object_key in ('one', 'two', 'three', 'four', 'five'):
+            self.store.create_object('aaa', object_key, b'data')
+        self.assertEqual(['five', 'four', 'one', 'three', 'two'],
+                         self.store.list_object_keys_for_container('aaa'))
+        self.assertEqual(['aaa', 'bbb', 'ccc'], self.store.list_container_keys())
+
+    def test_copy_object(self):
+        self.store.create_container('testing')
+        self.store.create_container('copies')
+        self.store.create_object('testing', 'metadata', b'some test data')
+        self.store.copy_object(self.store, 'testing', 'metadata', 'copies', 'copy')
+        self.assertIn('copy_object', self.client.requests)
+        self.assertEqual(b'some test data', self.store.get_object('copies', 'copy'))
+        self.assertRaises(NotFoundException, self.store.copy_object,
+                          self.store, 'testing', 'nothing', 'copies', 'copy')
+
+    def test_copy_large_object_in_parts(self):
+        store = CephStore('augeias', client=self.client, copy_part_size=10)
+        store.create_container('testing')
+        data = b'%PDF-1.4 ' + b'x' * 16
+        store.create_object('testing', 'large', data)
+        store.copy_object(store, 'testing', 'large', 'testing', 'copy')
+        self.assertNotIn('copy_object', self.client.requests)
+        self.assertEqual(3, self.client.requests.count('upload_part_copy'))
+        self.assertEqual(data, store.get_object('testing', 'copy'))
+        self.assertEqual('application/pdf', store.get_object_info('testing', 'copy')['mime'])
+        self.assertEqual({}, self.client.uploads)
+
+    def test_iter_container_data(self):
+        self.store.create_container('testing')
+        self.store.create_object('testing', 'first', b'first data')
+        self.store.create_object('testing', 'second', b'second data')
+        zip_data = b''.join(self.store.iter_container_data('testing', {'second': 'b.txt'}))
+        with ZipFile(BytesIO(zip_data)) as zf:
+            self.assertEqual(['b.txt'], zf.namelist())
+            self.assertEqual(b'second data', zf.read('b.txt'))
+
+    def test_nonexisting(self):
+        self.assertRaises(NotFoundException, self.store.create_object, 'testing', 'metadata', b'data')
+        self.assertRaises(NotFoundException, self.store.list_object_keys_for_container, 'testing')
+        self.assertRaises(NotFoundException, self.store.delete_container, 'testing')
+        self.store.create_container('testing')
+        self.assertRaises(NotFoundException, self.store.get_object, 'testing', 'metadata')
+        self.assertRaises(NotFoundException, self.store.get_object_info, 'testing', 'metadata')
+        self.assertRaises(NotFoundException, self.store.delete_object, 'testing', 'metadata')
@@ -0,0 +1,230 @@
+import json
+import logging
+import os
+import tarfile
+import unittest
+import zipfile
+from io import BytesIO
+
+import tempdir
+from pyramid.config import Configurator
+from webtest import TestApp
+
+from augeias import tracing
+from augeias.collections.model import Collection
+from augeias.stores.PairTreeFileSystemStore import PairTreeFileSystemStore
+from augeias.stores.TracingStore import TracingStore
+from augeias.stores.error import NotFoundException
+from augeias.tracing import InMemorySink
+from augeias.tracing import LoggingSink
+from augeias.tracing import span
+from augeias.zipstream import ZipMember
+from augeias.zipstream import stream_zip
+
+
+class TestSpans(unittest.TestCase):
+
+    def setUp(self):
+        self.sink = InMemorySink()
+        tracing.set_sink(self.sink)
+
+    def tearDown(self):
+        tracing.set_sink(None)
+
+    def test_disabled(self):
+        tracing.set_sink(None)
+        with span('outer', size=1) as outer:
+            outer.set_attribute('status', 200)
+        self.assertIs(tracing.NOOP_SPAN, outer)
+        self.assertEqual([], self.sink.spans)
+
+    def test_nested_spans(self):
+        with span('outer', size=1) as outer:
+            with span('inner') as inner:
+                pass
+            outer.set_attribute('status', 200)
+        with span('other') as other:
+            pass
+        self.assertEqual(['inner', 'outer', 'other'], self.sink.names())
+        self.assertIs(outer, inner.parent)
+        self.assertEqual(outer.trace_id, inner.trace_id)
+        self.assertIsNone(other.parent)
+        self.assertNotEqual(outer.trace_id, other.trace_id)
+        self.assertEqual({'size': 1, 'status': 200}, outer.attributes)
+        self.assertGreaterEqual(outer.duration, inner.duration)
+
+    def test_error(self):
+        with self.assertRaises(KeyError):
+            with span('failing'):
+                raise KeyError('key')
+        self.assertEqual('KeyError', self.sink.spans[0].error)
+
+    def test_span_without_with(self):
+        with span('outer') as outer:
+            interleaved = span('interleaved')
+            with span('inner') as inner:
+                pass
+            interleaved.end()
+            interleaved.end()
+        self.assertEqual(['inner', 'interleaved', 'outer'], self.sink.names())
+        self.assertIs(outer, interleaved.parent)
+        self.assertIs(outer, inner.parent)
+
+    def test_logging_sink(self):
+        tracing.set_sink(LoggingSink())
+        with self.assertLogs('augeias.tracing', logging.INFO) as logs:
+            with span('outer') as outer:
+                with span('inner', size=2):
+                    pass
+        inner = json.loads(logs.records[0].getMessage())
+        self.assertEqual('inner', inner['name'])
+        self.assertEqual(outer.trace_id, inner['trace_id'])
+        self.assertEqual(outer.span_id, inner['parent_id'])
+        self.assertEqual({'size': 2}, inner['attributes'])
+        self.assertIsNone(inner['error'])
+
+    def test_stream_zip(self):
+        members = [ZipMember(name, 4, 0, lambda: BytesIO(b'data')) for name in ('a', 'b')]
+        with span('zip'):
+            b''.join(stream_zip(members))
+        self.assertEqual(['zip.write_member', 'zip.write_member', 'zip'], self.sink.names())
+        self.assertEqual({'member': 'b', 'size': 4}, self.sink.spans[1].attributes)
+
+
+class TestTracingStore(unittest.TestCase):
+
+    def setUp(self):
+        self.temp = tempdir.TempDir()
+        self.sink = InMemorySink()
+        tracing.set_sink(self.sink)
+        self.store = TracingStore(PairTreeFileSystemStore(
+            os.path.join(os.path.abspath(self.temp.name), 'test_data')), 'cheeses')
+        self.store.create_container('testing')
+        self.store.create_object('testing', 'first', b'some test data')
+        del self.sink.spans[:]
+
+    def tearDown(self):
+        tracing.set_sink(None)
+        self.temp.dissolve()
+
+    def test_operations_are_traced(self):
+        self.assertEqual(b'some test data', self.store.get_object('testing', 'first'))
+        self.assertEqual(
+            ['pairtree.get_container', 'pairtree.get_bytestream', 'store.get_object'],
+            self.sink.names())
+        get_object = self.sink.spans[-1]
+        self.assertEqual({'collection': 'cheeses'}, get_object.attributes)
+        self.assertTrue(all(s.parent is get_object for s in self.sink.spans[:-1]))
+
+    def test_errors_are_traced(self):
+        self.assertRaises(NotFoundException, self.store.get_object, 'testing', 'none')
+        self.assertRaises(NotFoundException, self.store.get_object, 'none', 'first')
+        self.assertEqual(
+            [('pairtree.get_container', None),
+             ('pairtree.get_bytestream', 'PartNotFoundException'),
+             ('store.get_object', 'NotFoundException'),
+             ('pairtree.get_container', 'NotFoundException'),
+             ('store.get_object', 'NotFoundException')],
+            [(s.name, s.error) for s in self.sink.spans])
+
+
+class TestTracingRequests(unittest.TestCase):
+
+    def setUp(self):
+        self.temp = tempdir.TempDir()
+        self.app = self._make_app('augeias.tracing.InMemorySink', 'test_data')
+        self.testapp = TestApp(self.app)
+        self.sink = self.app.registry.tracing_sink
+
+    def tearDown(self):
+        self.temp.dissolve()
+
+    def _make_app(self, setting, directory):
+        config = Configurator(settings={'augeias.tracing': setting})
+        config.include('augeias')
+        store = PairTreeFileSystemStore(os.path.join(os.path.abspath(self.temp.name), directory))
+        collection = Collection(name='cheeses', object_store=store)
+        config.registry.collections[collection.name] = collection
+        return config.make_wsgi_app()
+
+    def test_settings(self):
+        for setting in ('false', 'off', ' False ', False, ''):
+            app = self._make_app(setting, 'disabled')
+            self.assertFalse(hasattr(app.registry, 'tracing_sink'))
+            self.assertIsInstance(app.registry.collections['cheeses'].object_store,
+                                  PairTreeFileSystemStore)
+            TestApp(app).put('/collections/cheeses/containers/brie')
+        for setting in ('true', 'on', True, 'log'):
+            app = self._make_app(setting, 'logged')
+            self.assertIsInstance(app.registry.tracing_sink, LoggingSink)
+
+    def test_applications_have_their_own_sink(self):
+        other = self._make_app('augeias.tracing.InMemorySink', 'other_data')
+        self.assertIsNot(self.sink, other.registry.tracing_sink)
+        TestApp(other).put('/collections/cheeses/containers/brie')
+        self.testapp.get('/collections/cheeses/containers')
+        self.assertEqual('/collections/cheeses/containers/brie',
+                         other.registry.tracing_sink.spans[-1].attributes['path'])
+        self.assertEqual('/collections/cheeses/containers', self.sink.spans[-1].attributes['path'])
+        self.assertIsNone(tracing.get_sink())
+        with span('outside') as outside:
+            pass
+        self.assertIs(tracing.NOOP_SPAN, outside)
+
+    def test_streamed_zip_is_traced(self):
+        self.testapp.put('/collections/cheeses/containers/brie')
+        self.testapp.put('/collections/cheeses/containers/brie/wedge', b'some test data')
+        del self.sink.spans[:]
+        res = self.testapp.get('/collections/cheeses/containers/brie',
+                               headers={'Accept': 'application/zip'})
+        self.assertEqual(['wedge'], zipfile.ZipFile(BytesIO(res.body)).namelist())
+        request = self.sink.spans[-1]
+        self.assertEqual('request', request.name)
+        write_member = self.sink.spans[self.sink.names().index('zip.write_member')]
+        self.assertIs(request, write_member.parent)
+        self.assertGreaterEqual(request.duration, write_member.duration)
+        self.assertIn('pairtree.get_bytestream', self.sink.names())
+        self.assertTrue(all(s.trace_id == request.trace_id for s in self.sink.spans))
+
+    def test_request_is_traced(self):
+        self.assertIsInstance(self.sink, InMemorySink)
+        self.assertIsInstance(self.app.registry.collections['cheeses'].object_store,
+                              TracingStore)
+        self.testapp.put('/collections/cheeses/containers/brie')
+        self.testapp.put('/collections/cheeses/containers/brie/wedge', b'some test data')
+        del self.sink.spans[:]
+        self.testapp.get('/collections/cheeses/containers/brie/wedge')
+        request = self.sink.spans[-1]
+        self.assertEqual('request', request.name)
+        self.assertEqual({'method': 'GET', 'path': '/collections/cheeses/containers/brie/wedge',
+                          'route': 'get_object', 'status': 200}, request.attributes)
+        self.assertIn('store.open_encoded_object_handle', self.sink.names())
+        self.assertTrue(all(s.trace_id == request.trace_id for s in self.sink.spans))
+
+    def test_archives_are_traced(self):
+        self.testapp.put('/collections/cheeses/containers/brie')
+        url = '/collections/cheeses/containers/brie/'
+        zip_content = BytesIO()
+        with zipfile.ZipFile(zip_content, 'w') as zf:
+            zf.writestr('file.txt', b'zipped')
+        tar_content = BytesIO()
+        with tarfile.open(fileobj=tar_content, mode='w') as tf:
+            info = tarfile.TarInfo('file.txt')
+            info.size = 3
+            tf.addfile(info, BytesIO(b'tar'))
+        self.testapp.put(url + 'archive.zip', zip_content.getvalue())
+        self.testapp.put(url + 'archive.tar', tar_content.getvalue())
+        del self.sink.spans[:]
+        self.assertEqual(b'tar', self.testapp.get(url + 'archive.tar/file.txt').body)
+        self.assertEqual(b'zipped', self.testapp.get(url + 'archive.zip/file.txt').body)
+        self.testapp.put(url + 'archive.zip/file.txt?new_file_name=new.txt', b'new data',
+                         headers={'Content-Type': 'application/octet-stream'})
+        spans = [s for s in self.sink.spans if s.name.startswith('archive.')]
+        self.assertEqual(
+            [('archive.build_tar_index', {}),
+             ('archive.open_member', {'member': 'file.txt', 'indexed': True}),
+             ('archive.build_tar_index', {}),
+             ('archive.open_member', {'member': 'file.txt', 'indexed': False}),
+             ('archive.replace_zip_member', {'member': 'file.txt'})],
+            [(s.name, s.attributes) for s in spans])
+        self.assertTrue(all(s.parent is not None for s in spans))
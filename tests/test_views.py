@@ -1,9 +1,16 @@
+import io
+import tempfile
 import unittest
+import zipfile
 from unittest.mock import Mock
 
 from pyramid import testing
+from pyramid.httpexceptions import HTTPBadRequest
 
+from augeias.stores.StoreInterface import ObjectHandle
 from augeias.views import AugeiasView
+from augeias.views import ValidationFailure
+from augeias.views import get_file_from_archive
 
 
 class ViewTests(unittest.TestCase):
@@ -21,11 +28,57 @@ class ViewTests(unittest.TestCase):
         info = self.view.my_view()
         self.assertEqual(info['project'], 'augeias')
 
+    def test_get_object_uses_file_wrapper(self):
+        collection = Mock()
+        f = tempfile.TemporaryFile()
+        self.addCleanup(f.close)
+        f.write(b'jpeg-data')
+        f.seek(0)
+        object_file = ObjectHandle(f, 9, 1600000000.0, 'image/jpeg')
+        collection.object_store.open_encoded_object_handle.return_value = object_file
+        file_wrapper = Mock(return_value=[b'jpeg-data'])
+        self.request.environ['wsgi.file_wrapper'] = file_wrapper
+        self.request.registry.collections = {'collection': collection}
+        self.request.matchdict = {
+            'container_key': 'container',
+            'collection_key': 'collection',
+            'object_key': 'object'
+        }
+        response = self.view.get_object()
+        file_wrapper.assert_called_once_with(object_file, 64 * 1024)
+        self.assertEqual('image/jpeg', response.content_type)
+        self.assertEqual(9, response.content_length)
+        self.assertEqual(b'jpeg-data', response.body)
+
+    def test_reserved_object_keys(self):
+        collection = Mock()
+        collection.object_store.reserved_key_prefix = '.augeias'
+        self.request.registry.collections = {'collection': collection}
+        for object_key in ('.augeias', '.augeias-foo'):
+            self.request.matchdict = {
+                'container_key': 'container',
+                'collection_key': 'collection',
+                'object_key': object_key
+            }
+            self.assertRaises(ValidationFailure, self.view.create_upload)
+        collection.object_store.create_upload.assert_not_called()
+        collection.object_store.reserved_key_prefix = None
+        collection.object_store.create_upload.return_value = 'upload'
+        self.request.route_url = Mock(return_value='http://localhost/upload')
+        self.view.create_upload()
+        collection.object_store.create_upload.assert_called_once_with('container', '.augeias-foo')
+
     def test_get_container_data(self):
         collection = Mock()
-        collection.object_store.get_container_data.return_value = Mock(
-            read=Mock(return_value=b'zip-file')
+        collection.object_store.iter_container_data.return_value = iter(
+            [b'zip-', b'file']
         )
+        collection.object_store.list_object_keys_for_container.return_value = [
+            '001', '002'
+        ]
+        collection.object_store.stat_object.return_value = {
+            'size': 9, 'mtime': 1600000000.0
+        }
         self.request.registry.collections = {'collection': collection}
         self.request.matchdict = {
             'container_key': 'container',
@@ -36,9 +89,15 @@ class ViewTests(unittest.TestCase):
 
     def test_get_container_data_translations(self):
         collection = Mock()
-        collection.object_store.get_container_data.return_value = Mock(
-            read=Mock(return_value=b'zip-file')
+        collection.object_store.iter_container_data.return_value = iter(
+            [b'zip-', b'file']
         )
+        collection.object_store.list_object_keys_for_container.return_value = [
+            '001', '002'
+        ]
+        collection.object_store.stat_object.return_value = {
+            'size': 9, 'mtime': 1600000000.0
+        }
         self.request.GET = {
             '001': 'name1.pdf',
             '002': 'name2.pdf',
@@ -50,7 +109,7 @@ class ViewTests(unittest.TestCase):
         }
         response = self.view.get_container_data()
         self.assertEqual(b'zip-file', response.body)
-        args, kwargs = collection.object_store.get_container_data.call_args_list[0]
+        args, kwargs = collection.object_store.iter_container_data.call_args_list[0]
         self.assertEqual(args, ('container',))
         self.assertEqual(
             kwargs,
@@ -61,3 +120,22 @@ class ViewTests(unittest.TestCase):
                 }
             }
         )
+
+
+class ArchiveHelperTests(unittest.TestCase):
+
+    def _zip(self, files):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for name, data in files:
+                zf.writestr(name, data)
+        return buffer.getvalue()
+
+    def test_get_file_from_archive(self):
+        archive = self._zip([('a.txt', b'a'), ('b.txt', b'b')])
+        self.assertEqual(b'b', get_file_from_archive(archive, 'b.txt'))
+        self.assertEqual(b'a', get_file_from_archive(io.BytesIO(archive), 'a.txt'))
+
+    def test_get_file_from_archive_not_found(self):
+        archive = self._zip([('a.txt', b'a')])
+        self.assertRaises(HTTPBadRequest, get_file_from_archive, archive, 'b.txt')
@@ -0,0 +1,81 @@
+import io
+import time
+import unittest
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from augeias.zipstream import ZipMember
+from augeias.zipstream import stream_zip
+
+
+def _member(name, data, mtime=None):
+    return ZipMember(
+        name=name,
+        size=len(data),
+        mtime=time.time() if mtime is None else mtime,
+        open=lambda: io.BytesIO(data)
+    )
+
+
+class TestStreamZip(unittest.TestCase):
+
+    def test_stream_zip(self):
+        members = [_member('a.txt', b'a' * 1000), _member('b.txt', b'')]
+        chunks = list(stream_zip(members, chunk_size=100))
+        self.assertGreater(len(chunks), 10)
+        self.assertTrue(all(len(chunk) < 200 for chunk in chunks))
+        with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as zf:
+            self.assertEqual(['a.txt', 'b.txt'], zf.namelist())
+            self.assertEqual(b'a' * 1000, zf.read('a.txt'))
+            self.assertEqual(b'', zf.read('b.txt'))
+            self.assertIsNone(zf.testzip())
+
+    def test_stream_zip_is_lazy(self):
+        opened = []
+
+        def open_member():
+            opened.append(True)
+            return io.BytesIO(b'data')
+
+        chunks = stream_zip([ZipMember('a', 4, time.time(), open_member)])
+        self.assertEqual([], opened)
+        next(chunks)
+        self.assertEqual([True], opened)
+
+    def test_stream_zip_read_ahead(self):
+        members = [_member(f'{i}.txt', bytes([i]) * (i * 100), mtime=0) for i in range(20)]
+        members.append(ZipMember('large', 3000, 0, lambda: io.BytesIO(b'l' * 3000)))
+        with ThreadPoolExecutor(4) as executor, \
+                mock.patch('augeias.zipstream.READ_AHEAD_MAX_SIZE', 2000):
+            chunks = list(stream_zip(members, executor=executor, read_ahead=3))
+        self.assertEqual(b''.join(stream_zip(members)), b''.join(chunks))
+
+    def test_stream_zip_read_ahead_closes_opened_members(self):
+        opened = []
+
+        def open_member():
+            f = io.BytesIO(b'data')
+            opened.append(f)
+            return f
+
+        members = [ZipMember(f'{i}', 4, 0, open_member) for i in range(10)]
+        with ThreadPoolExecutor(2) as executor, \
+                mock.patch('augeias.zipstream.READ_AHEAD_MAX_SIZE', 0):
+            chunks = stream_zip(members, executor=executor, read_ahead=3)
+            next(chunks)
+            chunks.close()
+        self.assertLessEqual(len(opened), 4)
+        self.assertTrue(all(f.closed for f in opened))
+
+    def test_stream_zip_old_mtime(self):
+        chunks = stream_zip([_member('old', b'data', mtime=0)])
+        with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as zf:
+            self.assertEqual((1980, 1, 1), zf.getinfo('old').date_time[:3])
+
+    def test_stream_zip64(self):
+        with mock.patch('zipfile.ZIP64_LIMIT', 100):
+            chunks = list(stream_zip([_member('big', b'b' * 500), _member('small', b's')]))
+            with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as zf:
+                self.assertEqual(b'b' * 500, zf.read('big'))
+                self.assertEqual(b's', zf.read('small'))